@@ -0,0 +1,462 @@
+import asyncio
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+import anyio
+import pyarrow as pa
+from langchain_core.messages import AIMessage, HumanMessage
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from clients.client_pool import client_pool
+from clients.metabase_client import QueryError, raise_query_errors
+from config.settings import (API_CLIENT_IDLE_TTL, API_JSON_MAX_ROWS, API_MAX_CONCURRENCY, API_METRICS_PUBLIC,
+                             CHART_MAX_CATEGORIES, CHART_MAX_POINTS, REQUEST_DEADLINE)
+from services.incremental import execute_query
+from services.llm_usage import usage_summary
+from services.local_mirror import mirror_stats
+from services.pipeline import PipelineObserver, answer_question
+from services.query_generator import generate_sql_query
+from services.query_jobs import JobLimitError, QueryJob, query_jobs
+from utils.arrow_results import is_truncated
+from utils.charting import build_chart, chart_payload
+from utils.resilience import Cancelled, CircuitOpenError, DeadlineExceeded, breaker_states, deadline_scope
+from utils.tracing import latency_summary, metrics_text, recent_traces, start_trace
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PREVIEW_ROWS = 20
+JOB_PROGRESS_INTERVAL = 1.0
+
+# One authenticated client per credential, shared by every request with those credentials
+# (connection pool, schema snapshot, caches); released after API_CLIENT_IDLE_TTL without use
+_clients: Dict[tuple, list] = {}  # key -> [client, last used]
+_clients_lock = threading.Lock()
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+class APIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _metabase_url() -> str:
+    return os.getenv("METABASE_URL", "")
+
+def _credentials(request: Request) -> Tuple[str, str]:
+    """Metabase username/password from HTTP Basic auth"""
+    scheme, _, encoded = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "basic":
+        raise APIError(401, "Basic auth dengan kredensial Metabase diperlukan")
+    try:
+        username, _, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        raise APIError(401, "Header Authorization tidak valid")
+    return username, password
+
+def _evict_idle_clients():
+    now = time.monotonic()
+    with _clients_lock:
+        idle = [key for key, entry in _clients.items() if now - entry[1] > API_CLIENT_IDLE_TTL]
+        clients = [_clients.pop(key)[0] for key in idle]
+    for client in clients:
+        client_pool.release(client)
+
+def _client_for(username: str, password: str):
+    """Blocking: the pinned client for these credentials, logging in on first use"""
+    _evict_idle_clients()
+    key = client_pool._key(_metabase_url(), username, password)
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is not None:
+            entry[1] = time.monotonic()
+            return entry[0]
+    client = client_pool.acquire(_metabase_url(), username, password)
+    if client is None:
+        raise APIError(401, "Tidak dapat login ke Metabase")
+    with _clients_lock:
+        entry = _clients.setdefault(key, [client, time.monotonic()])
+    if entry[0] is not client:
+        client_pool.release(client)  # another request pinned it first; drop the extra reference
+    return entry[0]
+
+async def _authenticate(request: Request) -> str:
+    """The Basic-auth username, once Metabase has accepted the password (logins are pinned, see _client_for)"""
+    username, password = _credentials(request)
+    await _run_blocking(_client_for, username, password)
+    return username
+
+def _limiter_instance() -> anyio.CapacityLimiter:
+    # Created lazily: a CapacityLimiter belongs to the running event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(API_MAX_CONCURRENCY)
+    return _limiter
+
+async def _run_blocking(fn: Callable, *args):
+    """Run pipeline code (requests/LangChain, all blocking) on a worker thread, at most API_MAX_CONCURRENCY at once"""
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_limiter_instance())
+
+def _error_status(error: BaseException) -> Tuple[int, str]:
+    if isinstance(error, (APIError, QueryError)):
+        return error.status, str(error)
+    if isinstance(error, DeadlineExceeded):
+        return 504, "Permintaan melebihi batas waktu"
+    if isinstance(error, CircuitOpenError):
+        return 503, f"Layanan sedang gangguan: {error}"
+    if isinstance(error, JobLimitError):
+        return 429, str(error)
+    if isinstance(error, Cancelled):
+        return 409, "Query dibatalkan"
+    return 500, f"{type(error).__name__}: {error}"
+
+def _error_response(error: BaseException) -> JSONResponse:
+    status, message = _error_status(error)
+    return JSONResponse({"error": message}, status_code=status)
+
+async def _json_body(request: Request) -> Dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise APIError(400, "Body harus berupa JSON")
+    if not isinstance(body, dict):
+        raise APIError(400, "Body harus berupa objek JSON")
+    return body
+
+def _require(body: Dict, field: str, kind: type):
+    value = body.get(field)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise APIError(400, f'"{field}" wajib diisi ({kind.__name__})')
+    return value
+
+def _chat_history(items) -> list:
+    history = []
+    for item in items or []:
+        message_type = HumanMessage if item.get("role") == "user" else AIMessage
+        history.append(message_type(content=item.get("content", "")))
+    return history
+
+def _max_rows(value) -> int:
+    """Rows of a JSON result to return: 0 to API_JSON_MAX_ROWS (use Arrow IPC for whole results)"""
+    try:
+        max_rows = int(value)
+    except (TypeError, ValueError):
+        raise APIError(400, "max_rows harus berupa bilangan bulat")
+    if not 0 <= max_rows <= API_JSON_MAX_ROWS:
+        raise APIError(400, f"max_rows harus 0-{API_JSON_MAX_ROWS}")
+    return max_rows
+
+def _table_payload(table: pa.Table, max_rows: int) -> Dict:
+    # A result without columns has no rows to show, whatever num_rows says
+    row_count = table.num_rows if table.num_columns else 0
+    return {
+        "columns": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+        "row_count": row_count,
+        "truncated": is_truncated(table),
+        "rows": [list(row.values()) for row in table.slice(0, min(max_rows, row_count)).to_pylist()]
+    }
+
+def _json_dumps(data) -> str:
+    # Timestamps and decimals from Arrow are not JSON types
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+class DataResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return _json_dumps(content).encode("utf-8")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {_json_dumps(data)}\n\n"
+
+class EventObserver(PipelineObserver):
+    """Turns pipeline callbacks into (event, data) pairs for the SSE stream"""
+
+    streams_tokens = True
+
+    def __init__(self, emit: Callable[[str, Dict], None], owner: str):
+        self.emit = emit
+        self.owner = owner
+        self.job: Optional[QueryJob] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        self.emit("stage", {"name": name, "status": "start"})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit("stage", {"name": name, "status": "end", "elapsed": round(time.perf_counter() - start, 3)})
+
+    def on_query_type(self, query_type: str):
+        self.emit("query_type", {"query_type": query_type})
+
+    def on_sql(self, sql: str, source: str, title: Optional[str]):
+        self.emit("sql", {"sql": sql, "source": source, "title": title})
+
+    def on_result(self, table):
+        payload = _table_payload(table, PREVIEW_ROWS)
+        payload["preview"] = payload.pop("rows")
+        payload["chart"] = chart_payload(build_chart(table, CHART_MAX_POINTS, CHART_MAX_CATEGORIES))
+        self.emit("result", payload)
+
+    def on_token(self, text: str):
+        self.emit("token", {"text": text})
+
+    def run_query(self, run, description: str):
+        # A job, so the query counts against the user's limit and can be cancelled (DELETE /jobs/{id})
+        self.job = query_jobs.submit(self.owner, run, description)
+        self.emit("job", {"job_id": self.job.id})
+        while not self.job.wait(JOB_PROGRESS_INTERVAL):
+            self.emit("progress", {"rows_read": self.job.rows_read, "elapsed": round(self.job.elapsed, 1)})
+        return self.job.result()
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.cancel()
+
+def _ask(username: str, password: str, body: Dict, observer: PipelineObserver) -> str:
+    client = _client_for(username, password)
+    with deadline_scope(REQUEST_DEADLINE), raise_query_errors():
+        return answer_question(
+            body["question"], client, body["database_id"], _chat_history(body.get("history")), observer
+        )
+
+async def _event_stream(username: str, password: str, body: Dict):
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: Dict):
+        # Called from the worker thread
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    observer = EventObserver(emit, username)
+
+    async def work():
+        try:
+            answer = await _run_blocking(_ask, username, password, body, observer)
+            queue.put_nowait(("answer", {"text": answer}))
+        except Exception as e:
+            status, message = _error_status(e)
+            queue.put_nowait(("error", {"status": status, "error": message}))
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.ensure_future(work())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield _sse(*item)
+    finally:
+        # Client went away: abort its running query; the rest of the pipeline
+        # thread cannot be interrupted, it finishes and its events are dropped
+        if not task.done():
+            observer.cancel()
+            task.cancel()
+
+async def ask(request: Request):
+    """POST /ask {"question", "database_id", "history"?, "stream"?}: SSE events, or one JSON answer with stream=false"""
+    try:
+        username, password = _credentials(request)
+        body = await _json_body(request)
+        _require(body, "question", str)
+        _require(body, "database_id", int)
+        if body.get("stream", True):
+            return StreamingResponse(
+                _event_stream(username, password, body),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        events = []
+        observer = EventObserver(lambda event, data: events.append({"event": event, "data": data}), username)
+        observer.streams_tokens = False
+        answer = await _run_blocking(_ask, username, password, body, observer)
+        return DataResponse({"answer": answer, "events": events})
+    except Exception as e:
+        return _error_response(e)
+
+def _generate_sql(username: str, password: str, body: Dict) -> str:
+    client = _client_for(username, password)
+    with deadline_scope(REQUEST_DEADLINE), start_trace("generate_sql", user=username,
+                                                        database_id=body["database_id"]):
+        tables = client.get_tables(body["database_id"])
+        if not tables:
+            raise APIError(404, "Tidak dapat mengakses tabel database")
+        return generate_sql_query(
+            body["question"], tables, _chat_history(body.get("history")), client, body["database_id"]
+        )
+
+async def sql(request: Request):
+    """POST /sql {"question", "database_id", "history"?}: the generated SQL, not executed"""
+    try:
+        username, password = _credentials(request)
+        body = await _json_body(request)
+        _require(body, "question", str)
+        _require(body, "database_id", int)
+        return JSONResponse({"sql": await _run_blocking(_generate_sql, username, password, body)})
+    except Exception as e:
+        return _error_response(e)
+
+def _query_runner(client, body: Dict) -> Callable[[], pa.Table]:
+    if body.get("card_id") is not None:
+        return lambda: client.execute_card(body["card_id"], body.get("parameters"), as_arrow=True)
+    return lambda: execute_query(client, body["database_id"], body["sql"])
+
+def _validate_query(body: Dict):
+    if body.get("card_id") is not None:
+        _require(body, "card_id", int)
+    else:
+        _require(body, "database_id", int)
+        _require(body, "sql", str)
+
+def _submit(username: str, password: str, body: Dict) -> QueryJob:
+    client = _client_for(username, password)
+    description = f"card:{body['card_id']}" if body.get("card_id") is not None else body["sql"]
+    # The job runs in a copy of this context: a failed query fails the job with its QueryError
+    with raise_query_errors():
+        return query_jobs.submit(username, _query_runner(client, body), description)
+
+def _table_response(request: Request, table: pa.Table, max_rows: int) -> Response:
+    if ARROW_STREAM in request.headers.get("accept", ""):
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_STREAM)
+    return DataResponse(_table_payload(table, max_rows), headers={"X-Total-Rows": str(table.num_rows)})
+
+async def execute(request: Request):
+    """POST /execute {"database_id", "sql"} or {"card_id", "parameters"?}: JSON rows, or Arrow IPC via Accept"""
+    try:
+        username, password = _credentials(request)
+        body = await _json_body(request)
+        _validate_query(body)
+        max_rows = _max_rows(body.get("max_rows", API_JSON_MAX_ROWS))
+        with deadline_scope(REQUEST_DEADLINE):
+            job = await _run_blocking(_submit, username, password, body)
+        try:
+            table = await _run_blocking(job.result)
+        finally:
+            if not job.done:
+                job.cancel()
+        return _table_response(request, table, max_rows)
+    except Exception as e:
+        return _error_response(e)
+
+async def submit_job(request: Request):
+    """POST /jobs (same body as /execute): starts the query and returns its job id right away"""
+    try:
+        username, password = _credentials(request)
+        body = await _json_body(request)
+        _validate_query(body)
+        job = await _run_blocking(_submit, username, password, body)
+        return JSONResponse(job.to_dict(), status_code=202)
+    except Exception as e:
+        return _error_response(e)
+
+async def list_jobs(request: Request):
+    try:
+        username = await _authenticate(request)
+        return JSONResponse([job.to_dict() for job in query_jobs.list(username)])
+    except Exception as e:
+        return _error_response(e)
+
+async def _owned_job(request: Request) -> QueryJob:
+    username = await _authenticate(request)
+    job = query_jobs.get(request.path_params["job_id"], owner=username)
+    if job is None:
+        raise APIError(404, "Job tidak ditemukan")
+    return job
+
+async def job_status(request: Request):
+    """GET /jobs/{id}: status and progress; DELETE /jobs/{id}: cancel"""
+    try:
+        job = await _owned_job(request)
+        if request.method == "DELETE":
+            job.cancel()
+        return JSONResponse(job.to_dict())
+    except Exception as e:
+        return _error_response(e)
+
+async def job_result(request: Request):
+    """GET /jobs/{id}/result?max_rows=: the finished result (409 while still running)"""
+    try:
+        job = await _owned_job(request)
+        if not job.done:
+            raise APIError(409, f"Job masih {job.status}")
+        max_rows = _max_rows(request.query_params.get("max_rows", API_JSON_MAX_ROWS))
+        return _table_response(request, job.result(), max_rows)
+    except Exception as e:
+        return _error_response(e)
+
+async def health(request: Request):
+    """Liveness only: it is unauthenticated, so nothing about users or data goes here"""
+    return JSONResponse({"status": "ok"})
+
+async def status(request: Request):
+    """GET /status: breakers, job counts and local mirrors, for any Metabase user"""
+    try:
+        await _authenticate(request)
+        return DataResponse({"breakers": breaker_states(), "jobs": query_jobs.stats(), "mirrors": mirror_stats()})
+    except Exception as e:
+        return _error_response(e)
+
+async def metrics(request: Request):
+    """Prometheus histograms; behind Metabase login unless API_METRICS_PUBLIC is set"""
+    try:
+        if not API_METRICS_PUBLIC:
+            await _authenticate(request)
+        return Response(metrics_text(), media_type="text/plain; version=0.0.4")
+    except Exception as e:
+        return _error_response(e)
+
+async def list_traces(request: Request):
+    """The caller's recent request timelines, newest first (?min_seconds=5 for slow ones only)"""
+    try:
+        username = await _authenticate(request)
+        try:
+            min_seconds = float(request.query_params.get("min_seconds", 0))
+        except ValueError:
+            raise APIError(400, "min_seconds harus berupa angka")
+        traces = [trace.to_dict() for trace in recent_traces(limit=200, min_duration=min_seconds)
+                  if trace.attrs.get("user") == username]
+        return DataResponse({"traces": traces[:50], "latency": latency_summary()})
+    except Exception as e:
+        return _error_response(e)
+
+async def usage(request: Request):
+    """The caller's LLM tokens, latency and estimated cost (?days=7&by=day,chain)"""
+    try:
+        username = await _authenticate(request)
+        try:
+            days = int(request.query_params.get("days", 7))
+        except ValueError:
+            raise APIError(400, "days harus berupa bilangan bulat")
+        by = [column for column in request.query_params.get("by", "day,chain").split(",") if column]
+        if not 1 <= days <= 366 or not set(by) <= {"day", "chain", "model"}:
+            raise APIError(400, "days harus 1-366 dan by hanya boleh berisi day, chain, model")
+        rows = await _run_blocking(usage_summary, by, days, username)
+        return DataResponse({"days": days, "usage": rows})
+    except Exception as e:
+        return _error_response(e)
+
+app = Starlette(routes=[
+    Route("/ask", ask, methods=["POST"]),
+    Route("/sql", sql, methods=["POST"]),
+    Route("/execute", execute, methods=["POST"]),
+    Route("/jobs", submit_job, methods=["POST"]),
+    Route("/jobs", list_jobs, methods=["GET"]),
+    Route("/jobs/{job_id}", job_status, methods=["GET", "DELETE"]),
+    Route("/jobs/{job_id}/result", job_result, methods=["GET"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/status", status, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+    Route("/traces", list_traces, methods=["GET"]),
+    Route("/usage", usage, methods=["GET"])
+])
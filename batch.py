@@ -0,0 +1,14 @@
+from dotenv import load_dotenv
+
+# Load environment first (settings are read at import time)
+load_dotenv()
+
+from config.settings import setup_environment
+
+setup_environment()
+
+# Usage: python batch.py questions.txt --database-id 1 --workers 4 --output report.jsonl
+from services.batch_runner import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Peak memory and wall time of the result paths: JSON -> pandas (original),
+whole-body JSON -> Arrow, and streamed JSON -> Arrow (what execute_query does now).
+
+Each case runs in a fresh subprocess so ru_maxrss reflects only that path; "delta MB"
+is the growth over the process baseline (interpreter, imports), i.e. the decode itself.
+Usage: python benchmarks/bench_result_path.py [rows ...]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_ROWS = [2_000, 100_000, 1_000_000]
+COLS = [
+    {"name": "id", "base_type": "type/BigInteger"},
+    {"name": "city", "base_type": "type/Text"},
+    {"name": "category", "base_type": "type/Text"},
+    {"name": "total", "base_type": "type/Decimal"},
+    {"name": "created_at", "base_type": "type/DateTime"}
+]
+CHUNK_SIZE = 64 * 1024
+CITIES = ["Jakarta", "Surabaya", "Bandung", "Medan", "Makassar"]
+
+def synthetic_response(rows: int) -> bytes:
+    data = [
+        [i, CITIES[i % 5], f"cat-{i % 37}", round(i * 1.25, 2), f"2024-01-{i % 28 + 1:02d}T10:00:00"]
+        for i in range(rows)
+    ]
+    return json.dumps({"data": {"cols": COLS, "rows": data}}).encode("utf-8")
+
+def run_case(path: str, body_path: str):
+    import pandas as pd
+    import pyarrow as pa
+    from utils.arrow_results import summarize_table, table_from_result
+    from utils.json_stream import DatasetStreamDecoder
+
+    # Warm up pyarrow's one-off initialisation so it is not billed to either path
+    table_from_result(json.loads(synthetic_response(10)))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(body_path, "rb") as f:
+        if path == "stream":
+            # Current execute_query path: rows decoded chunk by chunk as they arrive from the socket
+            decoder = DatasetStreamDecoder()
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                decoder.feed(chunk)
+            table = decoder.table(decoder.close()["data"]["cols"])
+            summarize_table(table)
+        elif path == "pandas":
+            # Old execute_query + st.dataframe: object columns, then Arrow conversion for display
+            result = json.loads(f.read())
+            df = pd.DataFrame(result["data"]["rows"], columns=[c["name"] for c in result["data"]["cols"]])
+            pa.Table.from_pandas(df, preserve_index=False)
+            df.select_dtypes(include=["number"]).describe()
+        else:
+            table = table_from_result(json.loads(f.read()))
+            summarize_table(table)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"path": path, "seconds": elapsed, "peak_mb": peak / 1024, "delta_mb": (peak - baseline) / 1024}))
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--case":
+        run_case(sys.argv[2], sys.argv[3])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "--write":
+        with open(sys.argv[3], "wb") as f:
+            f.write(synthetic_response(int(sys.argv[2])))
+        return
+
+    rows_list = [int(arg) for arg in sys.argv[1:]] or DEFAULT_ROWS
+    print(f"{'rows':>10} {'path':>8} {'seconds':>9} {'peak MB':>9} {'delta MB':>9}")
+    for rows in rows_list:
+        with tempfile.NamedTemporaryFile(suffix=".json") as body:
+            # Generated in a child too: ru_maxrss is inherited across fork/exec, so the parent stays small
+            subprocess.run([sys.executable, __file__, "--write", str(rows), body.name], check=True)
+            for path in ("pandas", "arrow", "stream"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", path, body.name], capture_output=True, text=True, check=True
+                ).stdout
+                stats = json.loads(output.strip().splitlines()[-1])
+                print(f"{rows:>10} {path:>8} {stats['seconds']:>9.3f} {stats['peak_mb']:>9.1f} {stats['delta_mb']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+from clients.metabase_client import MetabaseClient
+
+class ClientPool:
+    """Process-wide, reference-counted MetabaseClient reuse across Streamlit sessions"""
+
+    def __init__(self):
+        self._clients: Dict[tuple, List] = {}  # key -> [client, refcount]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(base_url: str, username: str, password: str) -> tuple:
+        # The password hash is part of the key so a wrong password never reuses a live session
+        password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return (base_url.rstrip('/'), username, password_hash)
+
+    def acquire(self, base_url: str, username: str, password: str) -> Optional[MetabaseClient]:
+        """Return a shared, authenticated client, or None if authentication fails"""
+        key = self._key(base_url, username, password)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = [MetabaseClient(base_url, username, password), 0]
+                self._clients[key] = entry
+            entry[1] += 1
+            client = entry[0]
+
+        if client.session_token or client.authenticate():
+            return client
+
+        self.release(client)
+        return None
+
+    def lease(self, base_url: str, username: str, password: str) -> Optional["ClientLease"]:
+        """Like acquire, but the reference is owned by a lease that releases it once"""
+        client = self.acquire(base_url, username, password)
+        return ClientLease(self, client) if client is not None else None
+
+    def release(self, client: Optional[MetabaseClient]):
+        """Drop one reference; the client is closed when no session uses it anymore"""
+        if client is None:
+            return
+        with self._lock:
+            for key, entry in list(self._clients.items()):
+                if entry[0] is client:
+                    entry[1] -= 1
+                    if entry[1] <= 0:
+                        del self._clients[key]
+                        client.session.close()
+                    return
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {"base_url": key[0], "username": key[1], "sessions": entry[1]}
+                for key, entry in self._clients.items()
+            ]
+
+class ClientLease:
+    """One reference to a pooled client, dropped by release() or when the lease is garbage collected.
+
+    Streamlit has no session-end callback; a lease kept in st.session_state is
+    collected with the state of a closed session, which returns its reference.
+    """
+
+    def __init__(self, pool: ClientPool, client: MetabaseClient):
+        self.client = client
+        self._finalizer = weakref.finalize(self, pool.release, client)
+
+    def release(self):
+        self._finalizer()  # runs at most once
+
+client_pool = ClientPool()
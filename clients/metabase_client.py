@@ -1,138 +1,382 @@
 import streamlit as st
 import pandas as pd
 import requests
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 
+from clients.schema_snapshot import SchemaSnapshotStore
+from clients.token_store import TokenStore
+from config.settings import (
+    METABASE_CACHE_SCOPE, METABASE_MAX_RETRIES, METABASE_PAGE_SIZE, METABASE_SESSION_MAX_AGE, METABASE_SESSION_REFRESH_MARGIN,
+    METABASE_TIMEOUTS, RESULT_QUERY_MAX_MB, SCHEMA_SNAPSHOT_TTL
+)
+from utils.arrow_results import empty_table, mark_truncated
+from utils.cache import get_cache
+from utils.helpers import normalize_sql, parse_api_response, project_listing_item
+from utils.json_stream import decode_stream
+from utils.resilience import (
+    Cancelled, CircuitOpenError, DeadlineExceeded, bounded_timeout, check_cancelled, current_cancel_token,
+    current_deadline, get_breaker, retry_call
+)
+from utils.single_flight import SingleFlight
+from utils.tracing import traced
+
+# Process-wide: identical concurrent requests from any session share one HTTP call
+metabase_flights = SingleFlight("metabase")
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+READ_CHUNK_SIZE = 64 * 1024
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """Errors that mean Metabase itself is degraded (counted by the circuit breaker)"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code >= 500
+
+class QueryError(Exception):
+    """A query Metabase could not run; status is 400 for the query itself, 502 for an upstream failure"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+# Front ends that report failures themselves (the HTTP API, query jobs) get a QueryError
+# instead of st.error plus an empty result, which would look like a query without rows
+_raise_query_errors: contextvars.ContextVar = contextvars.ContextVar("raise_query_errors", default=False)
+
+@contextmanager
+def raise_query_errors():
+    token = _raise_query_errors.set(True)
+    try:
+        yield
+    finally:
+        _raise_query_errors.reset(token)
+
+def _query_failed(label: str, error: Exception, as_arrow: bool):
+    """Raise a failed query as QueryError under raise_query_errors(), otherwise show it and return no rows"""
+    if _raise_query_errors.get():
+        if isinstance(error, (QueryError, CircuitOpenError, DeadlineExceeded)):
+            raise error
+        raise QueryError(f"{label}: {error}", 502 if _is_upstream_failure(error) else 400) from error
+    st.error(f"{label}: {error}")
+    return empty_table() if as_arrow else pd.DataFrame()
+
 class MetabaseClient:
     def __init__(self, base_url: str, username: str, password: str):
         self.base_url = base_url.rstrip('/')
         self.session = requests.Session()
         self.session_token = None
+        self.token_expires_at = None
+        self.token_store = TokenStore()
+        self._auth_lock = threading.RLock()
         self.username = username
         self.password = password
         self.table_schemas = {}  # Cache for table schemas
+        self.schema_store = SchemaSnapshotStore()
+        self.schema_snapshot_ttl = SCHEMA_SNAPSHOT_TTL
+        self.cache_scope = f"user:{username}"  # widened to group ids after login with METABASE_CACHE_SCOPE=groups
+        
+    @traced("metabase.http")
+    def _request(self, method: str, path: str, endpoint: str = "default", idempotent: bool = True,
+                 _reauthenticated: bool = False, **kwargs):
+        """Send a request with per-endpoint timeouts, jittered retries and a circuit breaker.
+        
+        Non-idempotent calls (login, ad-hoc queries) are only retried when the
+        connection could not be established, so the server never saw them.
+        Session tokens close to expiry are renewed first, and a 401 triggers
+        one transparent re-login and resend.
+        """
+        is_login = path == "/api/session"
+        if not is_login and self._token_needs_refresh():
+            self.authenticate(force=True, stale_token=self.session_token)
+        sent_token = self.session_token
+        
+        connect_timeout, read_timeout = METABASE_TIMEOUTS.get(endpoint, METABASE_TIMEOUTS["default"])
+        breaker = get_breaker(f"metabase:{self.base_url}")
         
-    def authenticate(self):
-        """Authenticate with Metabase and get session token"""
+        def send():
+            check_cancelled()
+            timeout = (bounded_timeout(connect_timeout), bounded_timeout(read_timeout))
+            response = getattr(self.session, method)(f"{self.base_url}{path}", timeout=timeout, **kwargs)
+            if response.status_code in RETRYABLE_STATUS:
+                response.raise_for_status()
+            return response
+        
+        def should_retry(error: BaseException) -> bool:
+            if isinstance(error, (Cancelled, CircuitOpenError, DeadlineExceeded)):
+                return False
+            if isinstance(error, requests.ConnectTimeout) or (
+                    isinstance(error, requests.ConnectionError) and not isinstance(error, requests.Timeout)):
+                return True
+            if not idempotent:
+                return False
+            if isinstance(error, requests.Timeout):
+                return True
+            response = getattr(error, "response", None)
+            return response is not None and response.status_code in RETRYABLE_STATUS
+        
+        response = retry_call(
+            # A 500 is returned to the caller (not retried) but still counts against the breaker
+            lambda: breaker.call(send, is_failure=_is_upstream_failure,
+                                 is_failed_result=lambda response: response.status_code >= 500),
+            should_retry,
+            max_retries=METABASE_MAX_RETRIES
+        )
+        
+        if (response.status_code == 401 and not is_login and not _reauthenticated
+                and sent_token and self.authenticate(force=True, stale_token=sent_token)):
+            return self._request(method, path, endpoint, idempotent, _reauthenticated=True, **kwargs)
+        return response
+    
+    def _token_needs_refresh(self) -> bool:
+        if not self.session_token or self.token_expires_at is None:
+            return False
+        return time.time() >= self.token_expires_at - METABASE_SESSION_REFRESH_MARGIN
+    
+    def _use_token(self, token: str, expires_at: float):
+        self.session_token = token
+        self.token_expires_at = expires_at
+        self.session.headers.update({"X-Metabase-Session": token})
+    
+    @traced("metabase.authenticate")
+    def authenticate(self, force: bool = False, stale_token: Optional[str] = None):
+        """Authenticate with Metabase, reusing a stored session token unless force is set.
+        
+        stale_token is the token a caller found expired or rejected. If another
+        thread (or, through the token store, another process) has replaced it
+        by the time the lock is held, that token is used instead of logging in
+        again, so concurrent 401s and early refreshes cost one login.
+        """
+        with self._auth_lock:
+            if stale_token is not None and self._token_replaced(stale_token):
+                return True
+            if not force:
+                stored = self.token_store.load(self.base_url, self.username, self.password)
+                if stored and time.time() < stored["expires_at"] - METABASE_SESSION_REFRESH_MARGIN:
+                    self._use_token(stored["token"], stored["expires_at"])
+                    self._load_cache_scope()  # also validates the token (401 -> one re-login)
+                    return True
+            
+            try:
+                response = self._request(
+                    "post", "/api/session", endpoint="session", idempotent=False,
+                    json={"username": self.username, "password": self.password}
+                )
+                response.raise_for_status()
+                token = response.json()["id"]
+                entry = self.token_store.save(
+                    self.base_url, self.username, self.password, token, METABASE_SESSION_MAX_AGE
+                )
+                self._use_token(token, entry["expires_at"])
+                self._load_cache_scope()
+                return True
+            except Exception as e:
+                # A failed early refresh keeps the current, still valid token
+                if self.token_expires_at is None or time.time() >= self.token_expires_at:
+                    self.session_token = None
+                    self.token_expires_at = None
+                    self.session.headers.pop("X-Metabase-Session", None)
+                st.error(f"Authentication failed: {e}")
+                return False
+    
+    def _token_replaced(self, stale_token: str) -> bool:
+        """Whether a fresh token other than stale_token is available (called with the auth lock held)"""
+        if self.session_token and self.session_token != stale_token and not self._token_needs_refresh():
+            return True
+        stored = self.token_store.load(self.base_url, self.username, self.password)
+        if (stored and stored["token"] != stale_token
+                and time.time() < stored["expires_at"] - METABASE_SESSION_REFRESH_MARGIN):
+            self._use_token(stored["token"], stored["expires_at"])
+            return True
+        return False
+    
+    def _load_cache_scope(self):
+        """Who this client's cached results may be shared with (per user unless METABASE_CACHE_SCOPE=groups).
+        
+        Sandboxed tables filter rows by user attributes, so with the groups
+        scope only users with the same groups and the same login attributes
+        share entries.
+        """
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/session",
-                json={"username": self.username, "password": self.password}
-            )
+            response = self._request("get", "/api/user/current")
             response.raise_for_status()
-            self.session_token = response.json()["id"]
-            self.session.headers.update({"X-Metabase-Session": self.session_token})
-            return True
-        except Exception as e:
-            st.error(f"Authentication failed: {e}")
-            return False
+            user = response.json()
+            group_ids = user.get("group_ids")
+            if METABASE_CACHE_SCOPE == "groups" and isinstance(group_ids, list) and group_ids:
+                scope = "groups:" + ",".join(str(g) for g in sorted(group_ids))
+                attributes = user.get("login_attributes") or {}
+                if attributes:
+                    digest = hashlib.sha256(json.dumps(attributes, sort_keys=True, default=str).encode("utf-8"))
+                    scope += f"|attrs:{digest.hexdigest()[:16]}"
+                self.cache_scope = scope
+        except Exception:
+            pass  # keep the per-user scope
+    
+    def _cache_key(self, *parts) -> tuple:
+        return (self.base_url, self.cache_scope) + parts
     
+    def _shared(self, cache_name: str, key: tuple, loader):
+        """Read through the shared cache; concurrent misses share one in-flight request"""
+        return get_cache(cache_name).get_or_load(
+            key, lambda: metabase_flights.do((cache_name,) + key, loader)
+        )
+    
+    @traced("metabase.get_databases")
     def get_databases(self) -> List[Dict]:
-        """Get list of available databases"""
+        """Get list of available databases (shared across sessions)"""
+        return self._shared("databases", self._cache_key(), self._fetch_databases)
+    
+    def _fetch_databases(self) -> List[Dict]:
         try:
-            response = self.session.get(f"{self.base_url}/api/database")
+            response = self._request("get", "/api/database")
             response.raise_for_status()
-            data = response.json()
-            
-            databases = []
-            
-            # Handle different response formats
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and item.get("id") is not None:
-                        databases.append({
-                            "id": item.get("id"),
-                            "name": item.get("name", f"Database {item.get('id')}"),
-                            "engine": item.get("engine", "Unknown")
-                        })
-            
-            elif isinstance(data, dict):
-                if "data" in data and isinstance(data["data"], list):
-                    for item in data["data"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            databases.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Database {item.get('id')}"),
-                                "engine": item.get("engine", "Unknown")
-                            })
-                
-                elif "databases" in data and isinstance(data["databases"], list):
-                    for item in data["databases"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            databases.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Database {item.get('id')}"),
-                                "engine": item.get("engine", "Unknown")
-                            })
-                
-                else:
-                    if "id" in data and "name" in data:
-                        databases.append({
-                            "id": data.get("id"),
-                            "name": data.get("name", f"Database {data.get('id')}"),
-                            "engine": data.get("engine", "Unknown")
-                        })
-                    else:
-                        for key, value in data.items():
-                            if isinstance(value, dict) and "id" in value:
-                                databases.append({
-                                    "id": value.get("id"),
-                                    "name": value.get("name", key),
-                                    "engine": value.get("engine", "Unknown")
-                                })
-                            elif isinstance(value, list):
-                                for item in value:
-                                    if isinstance(item, dict) and item.get("id") is not None:
-                                        databases.append({
-                                            "id": item.get("id"),
-                                            "name": item.get("name", f"Database {item.get('id')}"),
-                                            "engine": item.get("engine", "Unknown")
-                                        })
-            
-            return databases
+            return parse_api_response(response.json(), project=lambda item: {
+                "id": item.get("id"),
+                "name": item.get("name", f"Database {item.get('id')}"),
+                "engine": item.get("engine", "Unknown"),
+                "timezone": item.get("timezone")
+            })
         except Exception as e:
             st.error(f"Failed to get databases: {e}")
             return []
     
-    def get_tables(self, database_id: int) -> List[Dict]:
-        """Get tables for a specific database"""
+    def get_database(self, database_id: int) -> Dict:
+        """One entry of get_databases() (id, name, engine, timezone), or {} when it is not listed"""
+        return next((database for database in self.get_databases() if database.get("id") == database_id), {})
+    
+    def _parse_table(self, table: Dict) -> Optional[Dict]:
+        """Convert a Metabase table object (with fields) into our table_info dict"""
+        schema_name = table.get("schema", "public")
+        table_name = table.get("name", table.get("display_name"))
+        if not table_name:
+            return None
+
+        table_info = {
+            "schema": schema_name, 
+            "table": table_name,
+            "id": table.get("id"),
+            "fields": []
+        }
+        
+        # Get field information
+        if "fields" in table and isinstance(table["fields"], list):
+            for field in table["fields"]:
+                fingerprint = (field.get("fingerprint") or {}).get("global") or {}
+                field_info = {
+                    "name": field.get("name"),
+                    "type": field.get("base_type", "Unknown"),
+                    "display_name": field.get("display_name"),
+                    "id": field.get("id"),
+                    "has_field_values": field.get("has_field_values"),
+                    "distinct_count": fingerprint.get("distinct-count")
+                }
+                table_info["fields"].append(field_info)
+        
+        return table_info
+    
+    def _sync_tables_full(self, database_id: int) -> List[Dict]:
+        """Fetch full metadata for a database and write a fresh schema snapshot"""
+        response = self._request("get", f"/api/database/{database_id}/metadata", endpoint="metadata")
+        response.raise_for_status()
+        data = response.json()
+        
+        entries = []
+        if isinstance(data, dict) and isinstance(data.get("tables"), list):
+            for table in data["tables"]:
+                if isinstance(table, dict):
+                    table_info = self._parse_table(table)
+                    if table_info:
+                        entries.append({"updated_at": table.get("updated_at"), "table": table_info})
+        
+        if entries:
+            self.schema_store.save(self.base_url, database_id, entries)
+        return [entry["table"] for entry in entries]
+    
+    def _sync_tables_incremental(self, database_id: int, snapshot: Dict) -> List[Dict]:
+        """Re-fetch only tables whose updated_at changed since the snapshot"""
         try:
-            response = self.session.get(f"{self.base_url}/api/database/{database_id}/metadata")
+            response = self._request(
+                "get", f"/api/database/{database_id}", endpoint="metadata",
+                params={"include": "tables"}
+            )
             response.raise_for_status()
-            data = response.json()
+            remote_tables = response.json().get("tables")
+            if not isinstance(remote_tables, list):
+                return self._sync_tables_full(database_id)
             
-            tables = []
+            known = {
+                entry["table"].get("id"): entry
+                for entry in snapshot.get("tables", [])
+                if entry.get("table", {}).get("id") is not None
+            }
             
-            if isinstance(data, dict) and "tables" in data:
-                tables_data = data["tables"]
-                if isinstance(tables_data, list):
-                    for table in tables_data:
-                        if isinstance(table, dict):
-                            schema_name = table.get("schema", "public")
-                            table_name = table.get("name", table.get("display_name"))
-                            if table_name:
-                                table_info = {
-                                    "schema": schema_name, 
-                                    "table": table_name,
-                                    "id": table.get("id"),
-                                    "fields": []
-                                }
-                                
-                                # Get field information
-                                if "fields" in table and isinstance(table["fields"], list):
-                                    for field in table["fields"]:
-                                        field_info = {
-                                            "name": field.get("name"),
-                                            "type": field.get("base_type", "Unknown"),
-                                            "display_name": field.get("display_name")
-                                        }
-                                        table_info["fields"].append(field_info)
-                                
-                                tables.append(table_info)
-                                
-                                # Cache the schema
-                                full_table_name = f"{schema_name}.{table_name}"
-                                self.table_schemas[full_table_name] = table_info["fields"]
+            entries = []
+            changed = False
+            for table in remote_tables:
+                if not isinstance(table, dict) or table.get("id") is None:
+                    continue
+                cached = known.get(table["id"])
+                if cached and cached.get("updated_at") == table.get("updated_at"):
+                    entries.append(cached)
+                    continue
+                
+                # New or changed table: fetch its fields only
+                changed = True
+                detail = self._request("get", f"/api/table/{table['id']}/query_metadata", endpoint="metadata")
+                detail.raise_for_status()
+                table_info = self._parse_table(detail.json())
+                if table_info:
+                    entries.append({"updated_at": table.get("updated_at"), "table": table_info})
+            
+            if len(entries) != len(known):
+                changed = True  # tables removed (or added)
+            
+            if not entries:
+                return self._sync_tables_full(database_id)
+            
+            if changed:
+                self.schema_store.save(self.base_url, database_id, entries)
+            else:
+                self.schema_store.touch(self.base_url, database_id, snapshot)
+            return [entry["table"] for entry in entries]
+        
+        except Exception as e:
+            # Metabase unreachable: a stale snapshot beats the hardcoded fallback
+            st.warning(f"Schema sync failed, using cached schema: {e}")
+            return SchemaSnapshotStore.tables(snapshot)
+    
+    @traced("metabase.get_tables")
+    def get_tables(self, database_id: int, refresh: bool = False) -> List[Dict]:
+        """Get tables for a specific database (shared in memory, backed by the on-disk snapshot)"""
+        cache = get_cache("schemas")
+        key = self._cache_key(database_id)
+        tables = None if refresh else cache.get(key)
+        if tables is None:
+            tables = metabase_flights.do(("schemas", refresh) + key, lambda: self._load_tables(database_id, refresh))
+            if any(t.get("id") is not None for t in tables):  # never share the hardcoded fallback
+                cache.set(key, tables)
+        
+        # Cache the schema
+        for table_info in tables:
+            full_table_name = f"{table_info['schema']}.{table_info['table']}"
+            self.table_schemas[full_table_name] = table_info["fields"]
+        return tables
+    
+    def _load_tables(self, database_id: int, refresh: bool = False) -> List[Dict]:
+        try:
+            snapshot = self.schema_store.load(self.base_url, database_id)
+            if snapshot and not refresh and SchemaSnapshotStore.is_fresh(snapshot, self.schema_snapshot_ttl):
+                tables = SchemaSnapshotStore.tables(snapshot)
+            elif snapshot:
+                tables = self._sync_tables_incremental(database_id, snapshot)
+            else:
+                tables = self._sync_tables_full(database_id)
             
             # Fallback if no tables found
             if not tables:
@@ -188,6 +432,7 @@ class MetabaseClient:
             self.table_schemas["mb.khs_customer_transactions"] = fallback_schema
             return [{"schema": "mb", "table": "khs_customer_transactions", "id": None, "fields": fallback_schema}]
     
+    @traced("metabase.analyze_table_structure")
     def analyze_table_structure(self, database_id: int, table_name: str) -> Dict:
         """Analyze table structure by running sample queries"""
         try:
@@ -219,157 +464,259 @@ class MetabaseClient:
         
         return {}
     
-    def execute_query(self, database_id: int, query: str) -> pd.DataFrame:
-        """Execute SQL query and return results as DataFrame"""
+    @traced("metabase.execute_query")
+    def execute_query(self, database_id: int, query: str, use_cache: bool = True, as_arrow: bool = False,
+                      max_rows: Optional[int] = None):
+        """Execute SQL query and return results as DataFrame, or pyarrow.Table when as_arrow is set.
+        
+        Results live in a shared read-only cache; the Arrow path decodes the
+        response straight into typed Arrow columns without a pandas copy.
+        max_rows replaces Metabase's default row limit for ad-hoc queries
+        (2000); a result cut at the limit is flagged as truncated.
+        """
+        key = self._cache_key(database_id, normalize_sql(query), "arrow" if as_arrow else "pandas", max_rows)
+        loader = lambda: self._run_query(database_id, query, as_arrow, max_rows=max_rows)
+        if not use_cache:
+            return metabase_flights.do(("query_results",) + key, loader)
+        return self._shared("query_results", key, loader)
+    
+    def _read_dataset(self, response, max_bytes: Optional[int] = None):
+        """Decode a streamed dataset response while it downloads.
+        
+        Returns (decoder, complete); once the decoded rows outgrow max_bytes
+        the rest of the response is only scanned for the "cols" that follow
+        the rows, and complete is False. The download is bounded by the
+        request deadline: when it runs out the response is closed, even in
+        the middle of a body that keeps trickling in.
+        """
+        token = current_cancel_token()
+        deadline = current_deadline()
+        # Cancelling closes the socket: the blocked read fails now, and Metabase sees the
+        # disconnect and cancels the warehouse query on engines that support it
+        unregister = token.on_cancel(response.close) if token is not None else None
+        timer = None
+        expired = threading.Event()
+        if deadline is not None:
+            def expire():
+                expired.set()
+                response.close()
+            timer = threading.Timer(deadline.remaining(), expire)
+            timer.daemon = True
+            timer.start()
+
+        def chunks():
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if deadline is not None:
+                    deadline.check()
+                yield chunk
+
+        on_progress = (lambda rows: setattr(token, "rows_read", rows)) if token is not None else None
+        try:
+            decoder, complete = decode_stream(chunks(), max_bytes, on_progress=on_progress)
+        except Exception:
+            self._check_aborted(token, deadline, expired)
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+            if timer is not None:
+                timer.cancel()
+        # A closed response can also end the body early without an error
+        self._check_aborted(token, deadline, expired)
+        return decoder, complete
+    
+    @staticmethod
+    def _check_aborted(token, deadline, expired=None):
+        if token is not None:
+            token.check()
+        # The timer's clock can run out a moment before the deadline's own check does
+        if expired is not None and expired.is_set():
+            raise DeadlineExceeded("Batas waktu permintaan terlampaui")
+        if deadline is not None:
+            deadline.check()
+    
+    def _run_query(self, database_id: int, query: str, as_arrow: bool = False, max_bytes: Optional[int] = None,
+                   max_rows: Optional[int] = None):
+        """Run native SQL, holding at most max_bytes (RESULT_QUERY_MAX_MB) of decoded rows.
+        
+        A result over the budget keeps its leading rows and is flagged as
+        truncated; the query is never sent twice.
+        """
+        max_bytes = max_bytes or int(RESULT_QUERY_MAX_MB * 1024 * 1024)
         try:
             payload = {
                 "type": "native",
                 "native": {"query": query},
                 "database": database_id
             }
-            response = self.session.post(f"{self.base_url}/api/dataset", json=payload)
+            if max_rows is not None:
+                payload["constraints"] = {"max-results": max_rows, "max-results-bare-rows": max_rows}
+            response = self._request(
+                "post", "/api/dataset", endpoint="dataset", idempotent=False, json=payload, stream=True
+            )
             response.raise_for_status()
+            decoder, complete = self._read_dataset(response, max_bytes)
             
-            result = response.json()
-            if "data" in result and "cols" in result["data"] and "rows" in result["data"]:
-                columns = [col["name"] for col in result["data"]["cols"]]
-                rows = result["data"]["rows"]
-                return pd.DataFrame(rows, columns=columns)
-            else:
-                st.error(f"Unexpected response format: {result}")
-                return pd.DataFrame()
+            frame = self._frame_from_stream(decoder, as_arrow)
+            if not complete:
+                if as_arrow:
+                    frame = mark_truncated(frame)
+                else:
+                    frame.attrs["truncated"] = True
+            return frame
+        except Cancelled:
+            raise
         except Exception as e:
-            st.error(f"Query execution failed: {e}")
-            return pd.DataFrame()
+            return _query_failed("Query execution failed", e, as_arrow)
     
-    def get_dashboards(self) -> List[Dict]:
-        """Get list of available dashboards"""
+    @traced("metabase.build_frame")
+    def _frame_from_stream(self, decoder, as_arrow: bool = False):
+        result = decoder.close()
+        if result.get("status") == "failed" or result.get("error"):
+            # Metabase answers a query the warehouse rejected with 202 and the error in the body
+            raise QueryError(str(result.get("error") or "Query failed"))
+        if "data" in result and "cols" in result["data"] and "rows" in result["data"]:
+            # The pandas path keeps JSON types (dates stay strings) like the old DataFrame(rows) did
+            table = decoder.table(result["data"]["cols"], typed=as_arrow)
+            if result["data"].get("rows_truncated"):
+                # Cut at Metabase's row limit (2000 for ad-hoc queries unless constraints raise it)
+                if as_arrow:
+                    return mark_truncated(table)
+                frame = table.to_pandas()
+                frame.attrs["truncated"] = True
+                return frame
+            return table if as_arrow else table.to_pandas()
+        raise QueryError(f"Unexpected response format: {result}", 502)
+    
+    @traced("metabase.get_field_values")
+    def get_field_values(self, field_id: int) -> Dict:
+        """Distinct values Metabase keeps for a field: {"values": [...], "has_more": bool, "fetched_at": ts}"""
+        return self._shared("field_values", self._cache_key(field_id), lambda: self._fetch_field_values(field_id))
+    
+    def _fetch_field_values(self, field_id: int) -> Dict:
         try:
-            response = self.session.get(f"{self.base_url}/api/dashboard")
+            response = self._request("get", f"/api/field/{field_id}/values", endpoint="metadata")
             response.raise_for_status()
             data = response.json()
-            
-            dashboards = []
-            
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and item.get("id") is not None:
-                        dashboards.append({
-                            "id": item.get("id"),
-                            "name": item.get("name", f"Dashboard {item.get('id')}"),
-                            "description": item.get("description", "No description")
-                        })
-            
-            elif isinstance(data, dict):
-                if "data" in data and isinstance(data["data"], list):
-                    for item in data["data"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            dashboards.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Dashboard {item.get('id')}"),
-                                "description": item.get("description", "No description")
-                            })
-                
-                elif "dashboards" in data and isinstance(data["dashboards"], list):
-                    for item in data["dashboards"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            dashboards.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Dashboard {item.get('id')}"),
-                                "description": item.get("description", "No description")
-                            })
-                
-                else:
-                    if "id" in data and "name" in data:
-                        dashboards.append({
-                            "id": data.get("id"),
-                            "name": data.get("name", f"Dashboard {data.get('id')}"),
-                            "description": data.get("description", "No description")
-                        })
-                    else:
-                        for key, value in data.items():
-                            if isinstance(value, dict) and "id" in value:
-                                dashboards.append({
-                                    "id": value.get("id"),
-                                    "name": value.get("name", key),
-                                    "description": value.get("description", "No description")
-                                })
-                            elif isinstance(value, list):
-                                for item in value:
-                                    if isinstance(item, dict) and item.get("id") is not None:
-                                        dashboards.append({
-                                            "id": item.get("id"),
-                                            "name": item.get("name", f"Dashboard {item.get('id')}"),
-                                            "description": item.get("description", "No description")
-                                        })
-            
-            return dashboards
+            # Each entry is [value] or [value, human readable remapping]
+            values = []
+            for item in data.get("values") or []:
+                value = item[0] if isinstance(item, list) and item else item
+                if value is not None:
+                    values.append(value)
+            return {"values": values, "has_more": bool(data.get("has_more_values")), "fetched_at": time.time()}
+        except Exception:
+            return {}  # not cached; value_lookup skips the field for VALUE_INDEX_RETRY_AFTER
+    
+    @traced("metabase.get_card")
+    def get_card(self, card_id: int) -> Dict:
+        """Get one saved question with its native SQL and template tags (shared across sessions)"""
+        return self._shared("cards", self._cache_key("detail", card_id), lambda: self._fetch_card(card_id))
+    
+    def _fetch_card(self, card_id: int) -> Dict:
+        try:
+            response = self._request("get", f"/api/card/{card_id}")
+            response.raise_for_status()
+            card = response.json()
+            native = (card.get("dataset_query") or {}).get("native") or {}
+            return {
+                "id": card.get("id"),
+                "name": card.get("name") or f"Question {card_id}",
+                "description": card.get("description") or "No description",
+                "database_id": card.get("database_id"),
+                "query": native.get("query", ""),
+                "template_tags": list((native.get("template-tags") or {}).values()),
+                "updated_at": card.get("updated_at")
+            }
+        except Exception as e:
+            st.warning(f"Failed to get card {card_id}: {e}")
+            return {}
+    
+    @traced("metabase.execute_card")
+    def execute_card(self, card_id: int, parameters: Optional[List[Dict]] = None, as_arrow: bool = False):
+        """Run a saved question; Metabase can serve it from its own result cache"""
+        key = self._cache_key(
+            "card", card_id, json.dumps(parameters or [], sort_keys=True), "arrow" if as_arrow else "pandas"
+        )
+        return self._shared("query_results", key, lambda: self._run_card(card_id, parameters, as_arrow))
+    
+    def _run_card(self, card_id: int, parameters: Optional[List[Dict]], as_arrow: bool = False):
+        try:
+            response = self._request(
+                "post", f"/api/card/{card_id}/query", endpoint="dataset", idempotent=False,
+                json={"parameters": parameters or []}, stream=True
+            )
+            response.raise_for_status()
+            decoder, _ = self._read_dataset(response)
+            return self._frame_from_stream(decoder, as_arrow)
+        except Cancelled:
+            raise
+        except Exception as e:
+            return _query_failed("Saved question execution failed", e, as_arrow)
+    
+    @traced("metabase.get_dashboards")
+    def get_dashboards(self) -> List[Dict]:
+        """Get list of available dashboards (shared across sessions)"""
+        return self._shared("dashboards", self._cache_key(), self._fetch_dashboards)
+    
+    def _fetch_dashboards(self) -> List[Dict]:
+        try:
+            return self._list_items("dashboard", "/api/dashboard", "Dashboard")
         except Exception as e:
             st.error(f"Failed to get dashboards: {e}")
             return []
     
-    def get_cards(self) -> List[Dict]:
-        """Get list of available cards/questions"""
+    @traced("metabase.get_cards")
+    def get_cards(self, report_errors: bool = True) -> List[Dict]:
+        """Get list of available cards/questions (shared across sessions).
+
+        A failed listing is shown in the UI and returns []; with
+        report_errors=False the error is raised to the caller instead.
+        """
+        try:
+            return self._shared("cards", self._cache_key(), self._fetch_cards)
+        except Exception as e:
+            if not report_errors:
+                raise
+            st.error(f"Failed to get cards: {e}")
+            return []
+    
+    def _fetch_cards(self) -> List[Dict]:
+        return self._list_items("card", "/api/card", "Question")
+    
+    def _list_items(self, model: str, legacy_path: str, label: str) -> List[Dict]:
+        """List cards/dashboards via the paginated search API, projected to a few fields.
+        
+        /api/card and /api/dashboard return every object with its full query and
+        result metadata; search returns small summaries. Instances without a
+        usable search endpoint fall back to the legacy listing.
+        """
+        project = lambda item: project_listing_item(item, label)
         try:
-            response = self.session.get(f"{self.base_url}/api/card")
+            return self._search_paginated(model, project)
+        except Exception:
+            response = self._request("get", legacy_path)
+            response.raise_for_status()
+            return parse_api_response(response.json(), project=project)
+    
+    def _search_paginated(self, model: str, project) -> List[Dict]:
+        items = []
+        offset = 0
+        while True:
+            response = self._request(
+                "get", "/api/search",
+                params={"models": model, "limit": METABASE_PAGE_SIZE, "offset": offset}
+            )
             response.raise_for_status()
             data = response.json()
+            if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+                raise ValueError("Unexpected search response")
             
-            cards = []
+            page = [item for item in data["data"] if item.get("model", model) == model]
+            items.extend(parse_api_response(page, project=project))
+            offset += len(data["data"])
             
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and item.get("id") is not None:
-                        cards.append({
-                            "id": item.get("id"),
-                            "name": item.get("name", f"Question {item.get('id')}"),
-                            "description": item.get("description", "No description")
-                        })
-            
-            elif isinstance(data, dict):
-                if "data" in data and isinstance(data["data"], list):
-                    for item in data["data"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            cards.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Question {item.get('id')}"),
-                                "description": item.get("description", "No description")
-                            })
-                
-                elif "cards" in data and isinstance(data["cards"], list):
-                    for item in data["cards"]:
-                        if isinstance(item, dict) and item.get("id") is not None:
-                            cards.append({
-                                "id": item.get("id"),
-                                "name": item.get("name", f"Question {item.get('id')}"),
-                                "description": item.get("description", "No description")
-                            })
-                
-                else:
-                    if "id" in data and "name" in data:
-                        cards.append({
-                            "id": data.get("id"),
-                            "name": data.get("name", f"Question {data.get('id')}"),
-                            "description": data.get("description", "No description")
-                        })
-                    else:
-                        for key, value in data.items():
-                            if isinstance(value, dict) and "id" in value:
-                                cards.append({
-                                    "id": value.get("id"),
-                                    "name": value.get("name", key),
-                                    "description": value.get("description", "No description")
-                                })
-                            elif isinstance(value, list):
-                                for item in value:
-                                    if isinstance(item, dict) and item.get("id") is not None:
-                                        cards.append({
-                                            "id": item.get("id"),
-                                            "name": item.get("name", f"Question {item.get('id')}"),
-                                            "description": item.get("description", "No description")
-                                        })
-            
-            return cards
-        except Exception as e:
-            st.error(f"Failed to get cards: {e}")
-            return []
\ No newline at end of file
+            # Some versions omit "total"; then only a short page marks the end
+            total = data.get("total")
+            if not data["data"] or (offset >= total if total is not None else len(data["data"]) < METABASE_PAGE_SIZE):
+                return items
\ No newline at end of file
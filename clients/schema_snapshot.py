@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from config.settings import get_cache_dir
+
+class SchemaSnapshotStore:
+    """Persist table schemas per (Metabase URL, database id) on local disk"""
+
+    VERSION = 1
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or get_cache_dir("schema")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, base_url: str, database_id: int) -> str:
+        key = hashlib.sha1(f"{base_url}|{database_id}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"db_{database_id}_{key}.json")
+
+    def load(self, base_url: str, database_id: int) -> Optional[Dict]:
+        """Load a snapshot, or None if missing/corrupt/for another server"""
+        try:
+            with open(self._path(base_url, database_id), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (snapshot.get("version") != self.VERSION
+                or snapshot.get("base_url") != base_url
+                or snapshot.get("database_id") != database_id):
+            return None
+        return snapshot
+
+    def save(self, base_url: str, database_id: int, entries: List[Dict]) -> Dict:
+        """Write snapshot atomically; entries are {"updated_at": ..., "table": table_info}"""
+        snapshot = {
+            "version": self.VERSION,
+            "base_url": base_url,
+            "database_id": database_id,
+            "synced_at": time.time(),
+            "tables": entries
+        }
+        path = self._path(base_url, database_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+        return snapshot
+
+    def touch(self, base_url: str, database_id: int, snapshot: Dict) -> Dict:
+        """Mark an unchanged snapshot as freshly synced"""
+        return self.save(base_url, database_id, snapshot.get("tables", []))
+
+    def invalidate(self, base_url: str, database_id: int):
+        try:
+            os.remove(self._path(base_url, database_id))
+        except OSError:
+            pass
+
+    @staticmethod
+    def is_fresh(snapshot: Dict, ttl: int) -> bool:
+        return (time.time() - snapshot.get("synced_at", 0)) < ttl
+
+    @staticmethod
+    def tables(snapshot: Dict) -> List[Dict]:
+        return [entry["table"] for entry in snapshot.get("tables", []) if "table" in entry]
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from config.settings import get_cache_dir
+
+class TokenStore:
+    """Metabase session tokens on local disk, one file per (URL, user).
+
+    Files are created with 0600 permissions inside a 0700 directory. A token
+    is only handed out to a caller that presents the same password, checked
+    against a salted PBKDF2 hash, so a shared host cannot reuse someone
+    else's session by typing their username.
+    """
+
+    PBKDF2_ITERATIONS = 100_000
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or get_cache_dir("tokens")
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.chmod(self.directory, 0o700)
+        except OSError:
+            pass
+        self._lock = threading.Lock()
+
+    def _path(self, base_url: str, username: str) -> str:
+        key = hashlib.sha256(f"{base_url}|{username}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _credential_hash(self, base_url: str, username: str, password: str, salt: str) -> str:
+        return hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), f"{salt}|{base_url}|{username}".encode("utf-8"),
+            self.PBKDF2_ITERATIONS
+        ).hex()
+
+    def load(self, base_url: str, username: str, password: str) -> Optional[Dict]:
+        """Return {"token", "issued_at", "expires_at"} if a live token exists for these credentials"""
+        try:
+            with open(self._path(base_url, username), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        expected = self._credential_hash(base_url, username, password, entry.get("salt", ""))
+        if entry.get("credential_hash") != expected:
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            return None
+        return {key: entry[key] for key in ("token", "issued_at", "expires_at")}
+
+    def save(self, base_url: str, username: str, password: str, token: str, max_age: float) -> Dict:
+        salt = os.urandom(16).hex()
+        now = time.time()
+        entry = {
+            "token": token,
+            "issued_at": now,
+            "expires_at": now + max_age,
+            "salt": salt,
+            "credential_hash": self._credential_hash(base_url, username, password, salt)
+        }
+        path = self._path(base_url, username)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        return entry
+
+    def delete(self, base_url: str, username: str):
+        try:
+            os.remove(self._path(base_url, username))
+        except OSError:
+            pass
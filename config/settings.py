@@ -1,3 +1,4 @@
+import json
 import os
 
 def setup_environment():
@@ -10,4 +11,134 @@ def setup_environment():
 
     # Konfigurasi ke LangChain
     os.environ["OPENAI_API_KEY"] = api_key
-    os.environ["OPENAI_BASE_URL"] = base_url
\ No newline at end of file
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+def get_cache_dir(*subdirs: str) -> str:
+    """Return (and create) a local cache directory under CHATORACLE_CACHE_DIR"""
+    root = os.getenv("CHATORACLE_CACHE_DIR", ".cache")
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# Schema snapshot (lihat clients/schema_snapshot.py)
+SCHEMA_SNAPSHOT_TTL = int(os.getenv("SCHEMA_SNAPSHOT_TTL", "3600"))
+
+# Timeouts (detik): (connect, read) per endpoint Metabase, plus LLM dan batas waktu per pertanyaan
+METABASE_CONNECT_TIMEOUT = float(os.getenv("METABASE_CONNECT_TIMEOUT", "3.05"))
+METABASE_TIMEOUTS = {
+    "session": (METABASE_CONNECT_TIMEOUT, float(os.getenv("METABASE_SESSION_TIMEOUT", "15"))),
+    "metadata": (METABASE_CONNECT_TIMEOUT, float(os.getenv("METABASE_METADATA_TIMEOUT", "30"))),
+    "dataset": (METABASE_CONNECT_TIMEOUT, float(os.getenv("METABASE_QUERY_TIMEOUT", "120"))),
+    "default": (METABASE_CONNECT_TIMEOUT, float(os.getenv("METABASE_READ_TIMEOUT", "20")))
+}
+METABASE_MAX_RETRIES = int(os.getenv("METABASE_MAX_RETRIES", "2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "180"))
+
+# Umur sesi Metabase (MAX_SESSION_AGE, default 14 hari) dan kapan token diperbarui sebelum kedaluwarsa
+METABASE_SESSION_MAX_AGE = float(os.getenv("METABASE_SESSION_MAX_AGE", str(14 * 24 * 3600)))
+METABASE_SESSION_REFRESH_MARGIN = float(os.getenv("METABASE_SESSION_REFRESH_MARGIN", str(24 * 3600)))
+
+# Cakupan cache bersama: "user" (default) atau "groups" (berbagi antar user dengan grup dan atribut login yang sama)
+METABASE_CACHE_SCOPE = os.getenv("METABASE_CACHE_SCOPE", "user").lower()
+
+# Saved question yang cocok dengan pertanyaan dijalankan langsung tanpa menyusun SQL: porsi kata pertanyaan
+# yang harus dijelaskan card, dan porsi nama card yang harus disebut pertanyaan
+CARD_MATCH_ENABLED = os.getenv("CARD_MATCH_ENABLED", "true").lower() == "true"
+CARD_MATCH_MIN_COVERAGE = float(os.getenv("CARD_MATCH_MIN_COVERAGE", "0.75"))
+CARD_MATCH_MIN_NAME_COVERAGE = float(os.getenv("CARD_MATCH_MIN_NAME_COVERAGE", "0.6"))
+# Listing card yang gagal atau kosong tidak dicoba ulang selama sekian detik (pencocokan dilewati)
+CARD_MATCH_RETRY_AFTER = int(os.getenv("CARD_MATCH_RETRY_AFTER", "60"))
+
+# Ukuran halaman untuk listing cards/dashboards via /api/search
+METABASE_PAGE_SIZE = int(os.getenv("METABASE_PAGE_SIZE", "200"))
+
+# Result viewer: baris per halaman dan jumlah hasil query yang disimpan per sesi
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "100"))
+RESULT_HISTORY_LIMIT = int(os.getenv("RESULT_HISTORY_LIMIT", "5"))
+
+# Grafik otomatis: jumlah titik maksimum per seri (downsampling LTTB) dan kategori maksimum untuk bar chart
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1000"))
+CHART_MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", "30"))
+
+# Batas memori hasil query: per query (byte respons yang dibaca), per sesi, dan total seluruh sesi di proses ini
+RESULT_QUERY_MAX_MB = float(os.getenv("RESULT_QUERY_MAX_MB", "64"))
+RESULT_SESSION_MAX_MB = float(os.getenv("RESULT_SESSION_MAX_MB", "256"))
+RESULT_TOTAL_MAX_MB = float(os.getenv("RESULT_TOTAL_MAX_MB", "1024"))
+
+# Cache respons LLM (exact match pada prompt dan parameter model, disimpan di disk): TTL detik dan ukuran MB
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "64"))
+
+# HTTP API (serve.py): alamat, jumlah pertanyaan yang diproses bersamaan di satu proses,
+# batas baris hasil JSON, dan berapa lama client Metabase per user disimpan tanpa dipakai (detik).
+# /metrics butuh login Metabase kecuali API_METRICS_PUBLIC=true (mis. untuk Prometheus di jaringan internal)
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))
+API_JSON_MAX_ROWS = int(os.getenv("API_JSON_MAX_ROWS", "1000"))
+API_CLIENT_IDLE_TTL = float(os.getenv("API_CLIENT_IDLE_TTL", "1800"))
+API_METRICS_PUBLIC = os.getenv("API_METRICS_PUBLIC", "false").lower() == "true"
+
+# Query job: jumlah thread eksekusi, query berjalan per user, dan berapa lama job selesai disimpan (detik)
+QUERY_JOB_WORKERS = int(os.getenv("QUERY_JOB_WORKERS", "8"))
+QUERY_JOBS_PER_USER = int(os.getenv("QUERY_JOBS_PER_USER", "2"))
+QUERY_JOB_RETENTION = float(os.getenv("QUERY_JOB_RETENTION", "600"))
+
+# Template SQL untuk pertanyaan umum (top-N, tren, per kota, total) yang disusun tanpa LLM
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES_ENABLED", "true").lower() == "true"
+
+# Indeks nilai kolom (/api/field/:id/values) untuk mengenali nilai filter di pertanyaan: TTL detik,
+# kolom teks dengan lebih dari VALUE_INDEX_MAX_DISTINCT nilai tidak diindeks, skor kemiripan minimum, dan
+# berapa detik kolom yang nilainya gagal diambil dilewati sebelum dicoba lagi
+VALUE_INDEX_ENABLED = os.getenv("VALUE_INDEX_ENABLED", "true").lower() == "true"
+VALUE_INDEX_TTL = int(os.getenv("VALUE_INDEX_TTL", "21600"))
+VALUE_INDEX_MAX_DISTINCT = int(os.getenv("VALUE_INDEX_MAX_DISTINCT", "5000"))
+VALUE_INDEX_MIN_SCORE = float(os.getenv("VALUE_INDEX_MIN_SCORE", "0.85"))
+VALUE_INDEX_RETRY_AFTER = int(os.getenv("VALUE_INDEX_RETRY_AFTER", "300"))
+
+# Mirror lokal DuckDB (butuh: pip install duckdb) untuk tabel "schema.table:KOLOM_TANGGAL" dipisah koma;
+# kolom tanggal menjadi watermark. Refresh tiap LOCAL_MIRROR_REFRESH detik, mirror lebih tua dari
+# LOCAL_MIRROR_MAX_STALENESS tidak dipakai, baris LOCAL_MIRROR_LOOKBACK_DAYS hari sebelum watermark dibaca ulang,
+# dan tiap query salinan meminta LOCAL_MIRROR_PAGE_ROWS baris (tanpa batas eksplisit Metabase memotong di 2000).
+# Satu mirror per cakupan METABASE_CACHE_SCOPE: baris disalin dengan izin user yang memicu refresh, jadi
+# mirror hanya dibagi antar user dengan izin (termasuk sandboxing baris) yang sama
+LOCAL_MIRROR_ENABLED = os.getenv("LOCAL_MIRROR_ENABLED", "false").lower() == "true"
+LOCAL_MIRROR_TABLES = os.getenv("LOCAL_MIRROR_TABLES", "mb.khs_customer_transactions:REQUEST_DATE")
+LOCAL_MIRROR_REFRESH = float(os.getenv("LOCAL_MIRROR_REFRESH", "900"))
+LOCAL_MIRROR_MAX_STALENESS = float(os.getenv("LOCAL_MIRROR_MAX_STALENESS", "3600"))
+LOCAL_MIRROR_LOOKBACK_DAYS = float(os.getenv("LOCAL_MIRROR_LOOKBACK_DAYS", "3"))
+LOCAL_MIRROR_PAGE_ROWS = int(os.getenv("LOCAL_MIRROR_PAGE_ROWS", "100000"))
+
+# Konteks data untuk rekomendasi: statistik seluruh tabel dari satu query agregat (TTL detik). Jumlah kolom
+# numerik/teks yang diprofilkan, kolom teks dengan paling banyak DATA_CONTEXT_MAX_CATEGORIES nilai berbeda
+# juga diambil DATA_CONTEXT_TOP kategori teratas; DATA_CONTEXT_DISTINCT bisa diganti fungsi aproksimasi warehouse
+DATA_CONTEXT_TTL = int(os.getenv("DATA_CONTEXT_TTL", "3600"))
+DATA_CONTEXT_MAX_NUMERIC = int(os.getenv("DATA_CONTEXT_MAX_NUMERIC", "8"))
+DATA_CONTEXT_MAX_TEXT = int(os.getenv("DATA_CONTEXT_MAX_TEXT", "6"))
+DATA_CONTEXT_MAX_CATEGORIES = int(os.getenv("DATA_CONTEXT_MAX_CATEGORIES", "50"))
+DATA_CONTEXT_TOP = int(os.getenv("DATA_CONTEXT_TOP", "5"))
+DATA_CONTEXT_DISTINCT = os.getenv("DATA_CONTEXT_DISTINCT", "COUNT(DISTINCT {column})")
+
+# Agregat periode berjalan ("minggu ini", "bulan ini"): agregat yang lebih tua dari INCREMENTAL_REFRESH_AFTER detik
+# hanya ditambah baris setelah watermark, dihitung ulang penuh tiap INCREMENTAL_FULL_REFRESH detik, disimpan
+# INCREMENTAL_TTL detik; zona waktu warehouse untuk watermark (kosong: zona waktu database dari Metabase, lalu UTC)
+INCREMENTAL_ENABLED = os.getenv("INCREMENTAL_ENABLED", "true").lower() == "true"
+INCREMENTAL_REFRESH_AFTER = float(os.getenv("INCREMENTAL_REFRESH_AFTER", "60"))
+INCREMENTAL_FULL_REFRESH = float(os.getenv("INCREMENTAL_FULL_REFRESH", "21600"))
+INCREMENTAL_TTL = int(os.getenv("INCREMENTAL_TTL", str(7 * 24 * 3600)))
+INCREMENTAL_TIMEZONE = os.getenv("INCREMENTAL_TIMEZONE", "")
+
+# Tracing (lihat utils/tracing.py): jumlah timeline request yang disimpan di memori, ambang request lambat (detik),
+# dan panel admin di sidebar dengan request lambat dan latensi per tahap
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "200"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "10"))
+ADMIN_PANEL_ENABLED = os.getenv("ADMIN_PANEL_ENABLED", "false").lower() == "true"
+
+# Akuntansi token LLM per chain/user/hari (SQLite, kosong: .cache/usage/llm_usage.sqlite); harga USD per 1 juta
+# token sebagai {"model": [prompt, completion]}, model ":free" = 0 dan model lain yang tidak ada tidak dihitung
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "true").lower() == "true"
+LLM_USAGE_PATH = os.getenv("LLM_USAGE_PATH", "")
+LLM_PRICES = json.loads(os.getenv("LLM_PRICES", "{}") or "{}")
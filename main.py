@@ -23,7 +23,9 @@ api_key, base_url = setup_environment()
 
 # Import UI components (setelah environment setup)
 from ui.components import render_page_header, initialize_session_state
-from ui.sidebar import render_sidebar, render_additional_features, render_info_panel, render_status_info
+from ui.sidebar import (
+    render_admin_panel, render_sidebar, render_additional_features, render_info_panel, render_status_info
+)
 from ui.chat_interface import display_chat_history, handle_chat_input
 
 # Initialize UI
@@ -35,6 +37,7 @@ render_sidebar()
 render_additional_features()
 render_info_panel()
 render_status_info()
+render_admin_panel()
 
 # Main chat interface
 display_chat_history()
@@ -0,0 +1,14 @@
+from dotenv import load_dotenv
+
+# Load environment first (settings are read at import time)
+load_dotenv()
+
+from config.settings import API_HOST, API_PORT, setup_environment
+
+setup_environment()
+
+# Usage: python serve.py  (then POST /ask, /sql, /execute; see api/app.py)
+import uvicorn
+
+if __name__ == "__main__":
+    uvicorn.run("api.app:app", host=API_HOST, port=API_PORT)
@@ -0,0 +1,141 @@
+import argparse
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from clients.client_pool import client_pool
+from config.settings import REQUEST_DEADLINE
+from services.llm_factory import set_rate_limit
+from services.pipeline import PipelineObserver, answer_question
+from utils.arrow_results import is_truncated
+from utils.resilience import RateLimiter, deadline_scope
+
+def load_questions(path: str) -> List[Dict]:
+    """One question per line (.txt), or JSON lines with a "question" field and optional "id" (.jsonl)"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append({"id": item.get("id", number), "question": item["question"]})
+            else:
+                questions.append({"id": number, "question": line})
+    return questions
+
+class BatchObserver(PipelineObserver):
+    """Fills a report record from pipeline callbacks"""
+
+    def __init__(self, record: Dict):
+        self.record = record
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # execute_card and execute both count as "execute" in the report
+            stage = "execute" if name == "execute_card" else name
+            self.record["timings"][stage] = round(time.perf_counter() - start, 3)
+
+    def on_query_type(self, query_type: str):
+        self.record["query_type"] = query_type
+        if query_type != "data_query":
+            self.record["source"] = "llm"
+
+    def on_sql(self, sql: str, source: str, title: Optional[str]):
+        self.record.update(sql=sql, source=source)
+
+    def on_result(self, table):
+        self.record["row_count"] = table.num_rows
+        self.record["truncated"] = is_truncated(table)
+
+def run_question(question: str, metabase_client, database_id: int) -> Dict:
+    """Run one question through the pipeline without the UI; returns a report record"""
+    record = {"question": question, "query_type": None, "source": None, "sql": None, "row_count": None,
+              "truncated": False, "answer": None, "error": None, "timings": {}}
+    start = time.perf_counter()
+    try:
+        with deadline_scope(REQUEST_DEADLINE):
+            record["answer"] = answer_question(question, metabase_client, database_id, [], BatchObserver(record))
+        if record["query_type"] == "data_query" and record["row_count"] is None:
+            record["row_count"] = 0
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        record["timings"]["total"] = round(time.perf_counter() - start, 3)
+    return record
+
+def run_batch(questions: List[Dict], metabase_client, database_id: int, workers: int = 4,
+              questions_per_second: Optional[float] = None) -> Iterator[Dict]:
+    """Run questions on a bounded thread pool, yielding records as they finish"""
+    limiter = RateLimiter(questions_per_second, burst=workers) if questions_per_second else None
+
+    def task(item: Dict) -> Dict:
+        if limiter is not None:
+            limiter.acquire()
+        record = run_question(item["question"], metabase_client, database_id)
+        record["id"] = item["id"]
+        record["thread"] = threading.current_thread().name
+        return record
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = [pool.submit(task, item) for item in questions]
+        for future in as_completed(futures):
+            yield future.result()
+
+def summarize(records: List[Dict], elapsed: float) -> Dict:
+    totals = sorted(record["timings"]["total"] for record in records)
+    return {
+        "questions": len(records),
+        "errors": sum(1 for record in records if record["error"]),
+        "empty": sum(1 for record in records if record["row_count"] == 0),
+        "elapsed": round(elapsed, 2),
+        "throughput_per_min": round(len(records) / elapsed * 60, 2) if elapsed else None,
+        "p50": statistics.median(totals) if totals else None,
+        "p95": totals[math.ceil(len(totals) * 0.95) - 1] if totals else None
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run a file of questions through the pipeline without the UI")
+    parser.add_argument("questions", help=".txt (one per line) or .jsonl with a \"question\" field")
+    parser.add_argument("--database-id", type=int, required=True)
+    parser.add_argument("--output", default="batch_report.jsonl", help="JSONL report, one record per question")
+    parser.add_argument("--workers", type=int, default=4, help="questions in flight at once")
+    parser.add_argument("--qps", type=float, default=None, help="max questions started per second")
+    parser.add_argument("--llm-rpm", type=float, default=None, help="max LLM calls per minute")
+    parser.add_argument("--metabase-url", default=os.getenv("METABASE_URL"))
+    parser.add_argument("--username", default=os.getenv("METABASE_USERNAME"))
+    args = parser.parse_args(argv)
+
+    password = os.getenv("METABASE_PASSWORD")
+    client = client_pool.acquire(args.metabase_url, args.username, password)
+    if client is None:
+        raise SystemExit("❌ Tidak dapat login ke Metabase (cek METABASE_URL/USERNAME/PASSWORD)")
+
+    set_rate_limit(args.llm_rpm)
+    questions = load_questions(args.questions)
+    records = []
+    start = time.perf_counter()
+    with open(args.output, "w", encoding="utf-8") as report:
+        for record in run_batch(questions, client, args.database_id, args.workers, args.qps):
+            records.append(record)
+            report.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            report.flush()
+            if record["error"]:
+                status = "ERROR"
+            else:
+                status = f"{record['row_count']} rows" if record["row_count"] is not None else record["query_type"]
+            print(f"[{len(records)}/{len(questions)}] {record['timings']['total']:.1f}s {status} - {record['question'][:60]}")
+
+    print(json.dumps(summarize(records, time.perf_counter() - start), indent=2))
+    client_pool.release(client)
@@ -0,0 +1,106 @@
+import logging
+import re
+from typing import Dict, List, Optional, Set
+
+from config.settings import CARD_MATCH_MIN_COVERAGE, CARD_MATCH_MIN_NAME_COVERAGE, CARD_MATCH_RETRY_AFTER
+from services.catalog_index import get_catalog_index, list_catalog
+from utils.cache import get_cache
+from utils.search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+CARD_MATCH_CANDIDATES = 3
+
+def _covered(tokens: List[str], vocabulary: Set[str]) -> float:
+    """Fraction of tokens found in vocabulary (tokens of 3+ chars also match by prefix)"""
+    if not tokens:
+        return 0.0
+    hits = 0
+    for token in tokens:
+        if token in vocabulary or (len(token) >= 3 and any(word.startswith(token) for word in vocabulary)):
+            hits += 1
+    return hits / len(tokens)
+
+def _card_vocabulary(card: Dict) -> Set[str]:
+    text = " ".join(str(card.get(field) or "") for field in ("name", "description", "collection", "query"))
+    for tag in card.get("template_tags", []):
+        text += f" {tag.get('name', '')} {tag.get('display-name', '')}"
+    return set(tokenize(text))
+
+def _extract_parameters(question: str, card: Dict) -> Optional[List[Dict]]:
+    """Fill template tags from the question; None if a required tag cannot be filled"""
+    parameters = []
+    numbers = re.findall(r"\b\d+(?:\.\d+)?\b", question)
+    for tag in card.get("template_tags", []):
+        tag_type = tag.get("type")
+        value = None
+        if tag_type == "number" and len(numbers) == 1:
+            value = float(numbers[0]) if "." in numbers[0] else int(numbers[0])
+        elif tag_type == "text":
+            # "<tag name> <value>", e.g. "kota Surabaya" for a tag named "kota"
+            labels = {tag.get("name", ""), tag.get("display-name", "")}
+            for label in filter(None, labels):
+                match = re.search(rf"\b(?i:{re.escape(label)})\s+['\"]?([\w.-]+(?:\s+[A-Z][\w.-]*)*)", question)
+                if match:
+                    value = match.group(1)
+                    break
+
+        if value is None:
+            if tag.get("required") and tag.get("default") is None:
+                return None
+            continue
+        parameters.append({
+            "type": "category" if tag_type == "text" else "number/=",
+            "target": ["variable", ["template-tag", tag.get("name")]],
+            "value": value
+        })
+    return parameters
+
+def _cards_listed(metabase_client) -> bool:
+    """Refresh the card index; False when the listing failed or was empty.
+
+    Matching runs on every data question, so a failure is logged rather than
+    shown, and remembered for CARD_MATCH_RETRY_AFTER seconds (the client does
+    not cache empty listings) instead of being retried on every question.
+    """
+    key = ("listing_unavailable", metabase_client.base_url, getattr(metabase_client, "cache_scope", None))
+    cache = get_cache("cards")
+    if cache.get(key):
+        return False
+    try:
+        items = list_catalog(metabase_client, "card", report_errors=False)
+    except Exception as e:
+        logger.warning("Card listing failed, skipping saved-question matching: %s", e)
+        items = []
+    if not items:
+        cache.set(key, True, ttl=CARD_MATCH_RETRY_AFTER)
+    return bool(items)
+
+def match_card(question: str, metabase_client, database_id: int) -> Optional[Dict]:
+    """Return {"card": ..., "parameters": [...]} when a saved question confidently answers the question"""
+    question_tokens = tokenize(question)
+    if not question_tokens:
+        return None
+
+    if not _cards_listed(metabase_client):
+        return None
+    index = get_catalog_index(metabase_client)
+    for _, candidate in index.search(question, model="card", limit=CARD_MATCH_CANDIDATES):
+        card = metabase_client.get_card(candidate["id"])
+        if not card or card.get("database_id") not in (None, database_id):
+            continue
+
+        # Native SQL becomes searchable once a card has been looked at
+        index.update_fields(("card", candidate["id"]), query=card.get("query", ""))
+
+        card = dict(card, collection=candidate.get("collection", ""))
+        if _covered(question_tokens, _card_vocabulary(card)) < CARD_MATCH_MIN_COVERAGE:
+            continue
+        if _covered(tokenize(card["name"]), set(question_tokens)) < CARD_MATCH_MIN_NAME_COVERAGE:
+            continue
+
+        parameters = _extract_parameters(question, card)
+        if parameters is None:
+            continue
+        return {"card": card, "parameters": parameters}
+    return None
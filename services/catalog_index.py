@@ -0,0 +1,30 @@
+import threading
+from typing import Dict, List
+
+from utils.search_index import InvertedIndex
+
+_indexes: Dict[tuple, InvertedIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_catalog_index(metabase_client) -> InvertedIndex:
+    """Process-wide card/dashboard index per Metabase URL and permission scope"""
+    key = (metabase_client.base_url, getattr(metabase_client, "cache_scope", None))
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = InvertedIndex()
+        return _indexes[key]
+
+def list_catalog(metabase_client, model: str, report_errors: bool = True) -> List[Dict]:
+    """Current listing for a model ("card" or "dashboard"), indexed incrementally"""
+    if model == "card":
+        items = metabase_client.get_cards(report_errors=report_errors)
+    else:
+        items = metabase_client.get_dashboards()
+    get_catalog_index(metabase_client).sync(model, items)
+    return items
+
+def search_catalog(metabase_client, question: str, model: str, limit: int = 10) -> List[Dict]:
+    """Top matches for the question; falls back to the first items when nothing matches"""
+    items = list_catalog(metabase_client, model)
+    matches = get_catalog_index(metabase_client).search(question, model=model, limit=limit)
+    return [doc for _, doc in matches] or items[:limit]
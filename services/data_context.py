@@ -0,0 +1,179 @@
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+
+from clients.metabase_client import QueryError
+from config.settings import (
+    DATA_CONTEXT_DISTINCT, DATA_CONTEXT_MAX_CATEGORIES, DATA_CONTEXT_MAX_NUMERIC, DATA_CONTEXT_MAX_TEXT,
+    DATA_CONTEXT_TOP
+)
+from services.local_mirror import execute_query
+from services.sql_templates import NUMERIC_TYPES, TEXT_TYPES
+from utils.arrow_results import TEMPORAL_TYPES
+from utils.cache import get_cache
+from utils.helpers import is_id_column, quote_identifier
+
+# The measure shown next to each top category
+METRIC_TOKENS = ("total", "amount", "revenue", "sales", "price")
+# Metabase engines without GROUPING SETS: the profile runs one statement per category column instead
+NO_GROUPING_SETS_ENGINES = {"mysql", "sqlite", "h2", "druid"}
+
+def main_table(tables_info: List[Dict]) -> Optional[Dict]:
+    """The sales/transactions table when there is one, else the first table"""
+    for table in tables_info:
+        name = table["table"].lower()
+        if table.get("fields") and ("transaction" in name or "sales" in name):
+            return table
+    return tables_info[0] if tables_info else None
+
+def _columns(table_info: Dict) -> Dict[str, List[Dict]]:
+    fields = [field for field in table_info.get("fields") or [] if not is_id_column(field.get("name", ""))]
+    text = [field for field in fields if field.get("type") in TEXT_TYPES][:DATA_CONTEXT_MAX_TEXT]
+    return {
+        "numeric": [field for field in fields if field.get("type") in NUMERIC_TYPES][:DATA_CONTEXT_MAX_NUMERIC],
+        "text": text,
+        "temporal": [field for field in fields if field.get("type") in TEMPORAL_TYPES],
+        # Only columns known to be low-cardinality are grouped, so the result stays small
+        "category": [field for field in text
+                     if field.get("distinct_count") is not None
+                     and field["distinct_count"] <= DATA_CONTEXT_MAX_CATEGORIES]
+    }
+
+def _aggregates(columns: Dict[str, List[Dict]]) -> List[str]:
+    select = ["COUNT(*) AS n_rows"]
+    for i, field in enumerate(columns["numeric"]):
+        name = quote_identifier(field["name"])
+        select += [f"SUM({name}) AS s{i}", f"MIN({name}) AS mn{i}", f"MAX({name}) AS mx{i}", f"AVG({name}) AS a{i}"]
+    for i, field in enumerate(columns["text"]):
+        select.append(f"{DATA_CONTEXT_DISTINCT.format(column=quote_identifier(field['name']))} AS d{i}")
+    for i, field in enumerate(columns["temporal"]):
+        name = quote_identifier(field["name"])
+        select += [f"MIN({name}) AS tmn{i}", f"MAX({name}) AS tmx{i}"]
+    return select
+
+def _table_name(table_info: Dict) -> str:
+    return f"{quote_identifier(table_info['schema'])}.{quote_identifier(table_info['table'])}"
+
+def profile_sql(table_info: Dict) -> str:
+    """One aggregate statement: the grand total row plus one row per category value (GROUPING SETS).
+
+    Aliases are positional (s0, d1, ...) so they stay short and valid on every warehouse.
+    """
+    columns = _columns(table_info)
+    select = _aggregates(columns)
+    table_name = _table_name(table_info)
+    categories = [quote_identifier(field["name"]) for field in columns["category"]]
+    if not categories:
+        return f"SELECT {', '.join(select)} FROM {table_name}"
+    groups = [f"{name} AS c{i}" for i, name in enumerate(categories)]
+    flags = [f"GROUPING({name}) AS g{i}" for i, name in enumerate(categories)]
+    sets = ", ".join(["()"] + [f"({name})" for name in categories])
+    return f"SELECT {', '.join(groups + flags + select)} FROM {table_name} GROUP BY GROUPING SETS ({sets})"
+
+def profile_statements(table_info: Dict) -> List[str]:
+    """profile_sql without GROUPING SETS: the totals, then one GROUP BY per category column"""
+    columns = _columns(table_info)
+    table_name = _table_name(table_info)
+    statements = [f"SELECT {', '.join(_aggregates(columns))} FROM {table_name}"]
+    sums = ["COUNT(*) AS n_rows"] + [
+        f"SUM({quote_identifier(field['name'])}) AS s{i}" for i, field in enumerate(columns["numeric"])
+    ]
+    for i, field in enumerate(columns["category"]):
+        name = quote_identifier(field["name"])
+        statements.append(f"SELECT {name} AS c{i}, {', '.join(sums)} FROM {table_name} GROUP BY {name}")
+    return statements
+
+def _rows(result: pa.Table) -> List[Dict]:
+    # Some warehouses (Oracle) return aliases upper-cased
+    return [{key.lower(): value for key, value in row.items()} for row in result.to_pylist()]
+
+def parse_profile(table_info: Dict, result: pa.Table) -> Dict:
+    """Per-column statistics from the profile_sql result"""
+    return _profile(table_info, _rows(result))
+
+def parse_profile_statements(table_info: Dict, results: List[pa.Table]) -> Dict:
+    """Per-column statistics from the profile_statements results, flagged like GROUPING SETS rows"""
+    count = len(_columns(table_info)["category"])
+    rows = [dict(row, **{f"g{i}": 1 for i in range(count)}) for row in _rows(results[0])]
+    for i, result in enumerate(results[1:]):
+        rows += [dict(row, **{f"g{k}": int(k != i) for k in range(count)}) for row in _rows(result)]
+    return _profile(table_info, rows)
+
+def _profile(table_info: Dict, rows: List[Dict]) -> Dict:
+    columns = _columns(table_info)
+    categories = columns["category"]
+    # GROUPING(x) is 1 on rows where x is aggregated away: the grand total row has them all set
+    total = next((row for row in rows if all(row.get(f"g{i}") == 1 for i in range(len(categories)))), None)
+    if total is None:
+        return {}
+
+    profile = {"table": f"{table_info['schema']}.{table_info['table']}", "rows": total["n_rows"], "columns": {}}
+    for i, field in enumerate(columns["numeric"]):
+        profile["columns"][field["name"]] = {
+            "kind": "numeric", "sum": total[f"s{i}"], "min": total[f"mn{i}"], "max": total[f"mx{i}"],
+            "avg": total[f"a{i}"]
+        }
+    for i, field in enumerate(columns["text"]):
+        profile["columns"][field["name"]] = {"kind": "text", "distinct": total[f"d{i}"]}
+    for i, field in enumerate(columns["temporal"]):
+        profile["columns"][field["name"]] = {"kind": "temporal", "min": total[f"tmn{i}"], "max": total[f"tmx{i}"]}
+
+    names = [field["name"] for field in columns["numeric"]]
+    metric = next((i for i, name in enumerate(names) if any(token in name.lower() for token in METRIC_TOKENS)),
+                  0 if names else None)
+    for i, field in enumerate(categories):
+        group = [row for row in rows if row.get(f"g{i}") == 0]
+        group.sort(key=lambda row: row["n_rows"], reverse=True)
+        profile["columns"][field["name"]]["top"] = [
+            {"value": row[f"c{i}"], "rows": row["n_rows"], "sum": row[f"s{metric}"] if metric is not None else None}
+            for row in group[:DATA_CONTEXT_TOP]
+        ]
+    profile["metric"] = names[metric] if metric is not None else None
+    return profile
+
+def get_table_profile(metabase_client, database_id: int, table_info: Dict) -> Dict:
+    """Whole-table statistics computed by the warehouse, cached per table (DATA_CONTEXT_TTL)"""
+    key = (metabase_client.base_url, getattr(metabase_client, "cache_scope", None), database_id,
+           table_info["schema"], table_info["table"])
+    return get_cache("data_context").get_or_load(key, lambda: _load_profile(metabase_client, database_id, table_info))
+
+def _load_profile(metabase_client, database_id: int, table_info: Dict) -> Dict:
+    """GROUPING SETS in one statement where the engine has it; per-column statements otherwise or on failure"""
+    engine = metabase_client.get_database(database_id).get("engine")
+    if _columns(table_info)["category"] and engine not in NO_GROUPING_SETS_ENGINES:
+        try:
+            profile = parse_profile(table_info, execute_query(metabase_client, database_id, profile_sql(table_info)))
+        except QueryError:
+            profile = {}
+        if profile:
+            return profile
+    results = [execute_query(metabase_client, database_id, sql) for sql in profile_statements(table_info)]
+    return parse_profile_statements(table_info, results)
+
+def _number(value) -> str:
+    if isinstance(value, (float, Decimal)):
+        return f"{value:,.2f}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+def format_profile(profile: Dict) -> str:
+    """Prompt text for the recommendation chain"""
+    lines = [f"Tabel {profile['table']}: {_number(profile['rows'])} baris (seluruh tabel)."]
+    for name, stats in profile["columns"].items():
+        if stats["kind"] == "numeric":
+            lines.append(f"- {name}: total {_number(stats['sum'])}, rata-rata {_number(stats['avg'])}, "
+                         f"min {_number(stats['min'])}, max {_number(stats['max'])}")
+        elif stats["kind"] == "temporal":
+            lines.append(f"- {name}: dari {stats['min']} sampai {stats['max']}")
+        else:
+            line = f"- {name}: {_number(stats['distinct'])} nilai berbeda"
+            if stats.get("top"):
+                metric = f", {profile['metric']}" if profile.get("metric") else ""
+                top = "; ".join(
+                    f"{item['value'] if item['value'] is not None else '(kosong)'} ({_number(item['rows'])} baris"
+                    + (f", {_number(item['sum'])}" if item["sum"] is not None else "") + ")"
+                    for item in stats["top"]
+                )
+                line += f"; teratas (baris{metric}): {top}"
+            lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from clients.metabase_client import QueryError, metabase_flights
+from config.settings import (
+    INCREMENTAL_ENABLED, INCREMENTAL_FULL_REFRESH, INCREMENTAL_REFRESH_AFTER, INCREMENTAL_TIMEZONE
+)
+from services import local_mirror
+from utils.cache import get_cache
+
+MAX_SPECS = 256
+
+HWM = "hwm"
+
+_specs: "OrderedDict[str, Dict]" = OrderedDict()
+_specs_lock = threading.Lock()
+
+def register(sql: str, spec: Dict):
+    """Remember that sql is a current-period aggregate that can be refreshed incrementally"""
+    with _specs_lock:
+        _specs[sql] = spec
+        _specs.move_to_end(sql)
+        while len(_specs) > MAX_SPECS:
+            _specs.popitem(last=False)
+
+def spec_for(sql: str) -> Optional[Dict]:
+    with _specs_lock:
+        return _specs.get(sql)
+
+def _columns(spec: Dict) -> list:
+    return ([spec["dimension"]] if spec["dimension"] else []) + [spec["alias"]]
+
+def window_sql(spec: Dict, since: Optional[datetime] = None) -> str:
+    """The aggregate over the window (or only rows past since) plus the high-water mark of the rows it read"""
+    select = ([spec["dimension"]] if spec["dimension"] else []) + [
+        f"{spec['expression']} AS {spec['alias']}", f"MAX({spec['date']}) AS {HWM}"
+    ]
+    conditions = spec["conditions"] + [f"{spec['date']} >= DATE '{spec['start']}'"]
+    if since is not None:
+        # Fractional seconds are kept, or rows later in the watermark's second would be read again
+        conditions.append(f"{spec['date']} > TIMESTAMP '{since.isoformat(sep=' ')}'")
+    sql = f"SELECT {', '.join(select)} FROM {spec['table']} WHERE {' AND '.join(conditions)}"
+    if spec["dimension"]:
+        sql += f" GROUP BY {spec['dimension']}"
+    return sql
+
+def _warehouse_timezone(metabase_client, database_id: int):
+    name = INCREMENTAL_TIMEZONE or metabase_client.get_database(database_id).get("timezone")
+    try:
+        return ZoneInfo(name) if name else timezone.utc
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+def warehouse_today(metabase_client, database_id: int) -> date:
+    """Today in the warehouse's time zone, so current periods roll over at its midnight"""
+    return datetime.now(_warehouse_timezone(metabase_client, database_id)).date()
+
+def _run(metabase_client, database_id: int, spec: Dict, since: Optional[datetime]):
+    """(aggregate, high-water mark) for the window or for rows past since; None when the query failed"""
+    # Stored aggregates carry the freshness; a cached window or delta would miss new rows
+    result = local_mirror.execute_query(metabase_client, database_id, window_sql(spec, since), use_cache=False)
+    columns = _columns(spec) + [HWM]
+    if result.num_columns != len(columns):
+        return None
+    # Warehouses may change alias case; the select order is fixed
+    result = result.rename_columns(columns)
+    hwm = pc.max(result.column(HWM)).as_py() if result.num_rows else None
+    if isinstance(hwm, datetime) and hwm.tzinfo is not None:
+        # Offsets are parsed to UTC; the warehouse compares the literal as its own wall time
+        hwm = hwm.astimezone(_warehouse_timezone(metabase_client, database_id)).replace(tzinfo=None)
+    table = result.drop_columns([HWM])
+    if not spec["dimension"]:
+        # COUNT(*)/SUM over no rows still returns one row; an empty SUM is 0 for merging
+        table = table.set_column(0, spec["alias"], pc.fill_null(table.column(0), 0))
+    return table, hwm
+
+def merge(stored: pa.Table, delta: pa.Table, spec: Dict) -> pa.Table:
+    """Add a delta aggregate into the stored one (SUM and COUNT are additive)"""
+    if delta.num_rows == 0:
+        return stored
+    if stored.num_rows == 0:
+        return delta
+    combined = pa.concat_tables([stored, delta.cast(stored.schema, safe=False)], promote_options="permissive")
+    alias = spec["alias"]
+    if not spec["dimension"]:
+        total = pc.sum(combined.column(alias)).as_py()
+        return pa.table({alias: pa.array([total], type=stored.schema.field(alias).type)})
+    dimension = spec["dimension"]
+    merged = combined.group_by(dimension).aggregate([(alias, "sum")])
+    return merged.select([dimension, f"{alias}_sum"]).rename_columns([dimension, alias])
+
+def _present(table: pa.Table, spec: Dict) -> pa.Table:
+    """Order and LIMIT are applied after merging: a delta can move any group into the top N"""
+    if not spec["dimension"]:
+        return table
+    order = "descending" if spec["order"] == "DESC" else "ascending"
+    table = table.take(pc.sort_indices(table, sort_keys=[(spec["alias"], order)]))
+    return table.slice(0, spec["limit"]) if spec["limit"] else table
+
+def _refresh(metabase_client, database_id: int, spec: Dict, key: tuple) -> Optional[Dict]:
+    cache = get_cache("incremental")
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and now - entry["refreshed_at"] < INCREMENTAL_REFRESH_AFTER:
+        return entry
+    full = entry is None or entry["hwm"] is None or now - entry["full_at"] >= INCREMENTAL_FULL_REFRESH
+    run = _run(metabase_client, database_id, spec, None if full else entry["hwm"])
+    if run is None:
+        return None
+    if full:
+        table, hwm = run
+        entry = {"table": table, "hwm": hwm, "full_at": now, "refreshed_at": now, "deltas": 0}
+    else:
+        delta, hwm = run
+        entry = dict(entry, table=merge(entry["table"], delta, spec), hwm=max(entry["hwm"], hwm or entry["hwm"]),
+                     refreshed_at=now, deltas=entry["deltas"] + 1)
+    cache.set(key, entry)
+    return entry
+
+def execute_query(metabase_client, database_id: int, sql: str) -> pa.Table:
+    """Run SQL; registered current-period aggregates only read rows past their stored watermark.
+
+    The stored aggregate is kept per window start ("bulan ini" starts a new
+    entry on the 1st) and is stored again on every top-up, so a window that
+    keeps being asked about is refreshed rather than expired. Anything else
+    goes through the local mirror / Metabase as usual.
+    """
+    spec = spec_for(sql) if INCREMENTAL_ENABLED else None
+    if spec is None:
+        return local_mirror.execute_query(metabase_client, database_id, sql)
+    key = (metabase_client.base_url, getattr(metabase_client, "cache_scope", None), database_id, sql)
+    try:
+        entry = metabase_flights.do(("incremental",) + key,
+                                    lambda: _refresh(metabase_client, database_id, spec, key))
+    except QueryError:
+        entry = None
+    if entry is None:
+        # The window query failed (e.g. the TIMESTAMP literal): the template SQL itself may still run
+        return local_mirror.execute_query(metabase_client, database_id, sql)
+    return _present(entry["table"], spec)
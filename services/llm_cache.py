@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+
+from config.settings import LLM_CACHE_ENABLED
+from services.llm_usage import note_cache_hit
+from utils.cache import get_cache
+
+# Client settings that do not change the completion (and vary per request, e.g. deadline-bounded timeouts)
+TRANSPORT_PARAMS = {"request_timeout", "max_retries", "openai_api_key", "stream_usage", "http_client"}
+
+def model_identity(llm_string: str) -> str:
+    """LangChain's llm_string without transport-only settings, plus the endpoint it talks to"""
+    spec_text, separator, call_params = llm_string.partition("---")
+    try:
+        spec = json.loads(spec_text)
+    except ValueError:
+        return llm_string
+    kwargs = {k: v for k, v in spec.get("kwargs", {}).items() if k not in TRANSPORT_PARAMS}
+    identity = {"id": spec.get("id"), "kwargs": kwargs, "base_url": os.getenv("OPENAI_BASE_URL")}
+    return json.dumps(identity, sort_keys=True) + separator + call_params
+
+class SharedLLMCache(BaseCache):
+    """Exact-match completion cache on the shared "llm" cache (SQLite on disk, TTL and size bounded).
+
+    Keys are the model identity (name, temperature, stop words, ...) and a
+    hash of the rendered prompt, so only byte-identical requests hit.
+    """
+
+    def _key(self, prompt: str, llm_string: str) -> tuple:
+        digest = hashlib.sha256(f"{model_identity(llm_string)}\0{prompt}".encode("utf-8")).hexdigest()
+        return ("completion", digest)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        cached = get_cache("llm").get(self._key(prompt, llm_string))
+        if cached is not None:
+            note_cache_hit()
+        return cached
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        get_cache("llm").set(self._key(prompt, llm_string), list(return_val))
+
+    def clear(self, **kwargs: Any) -> None:
+        get_cache("llm").clear()
+
+llm_cache = SharedLLMCache() if LLM_CACHE_ENABLED else None
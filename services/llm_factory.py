@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import openai
+from langchain_openai import ChatOpenAI
+
+from config.settings import LLM_MAX_RETRIES, LLM_TIMEOUT
+from services.llm_cache import llm_cache
+from services.llm_usage import usage_recorder
+from utils.resilience import RateLimiter, bounded_timeout, current_deadline, get_breaker
+from utils.tracing import span
+
+# Optional process-wide cap on LLM calls (set by the batch runner)
+_rate_limiter: Optional[RateLimiter] = None
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """Errors that mean OpenRouter is degraded (counted by the circuit breaker)"""
+    return isinstance(error, (
+        openai.APIConnectionError,  # includes APITimeoutError
+        openai.InternalServerError,
+        openai.RateLimitError
+    ))
+
+def create_llm(model: str, temperature: float) -> ChatOpenAI:
+    """ChatOpenAI with a timeout bounded by the current request deadline and the shared response cache"""
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        timeout=bounded_timeout(LLM_TIMEOUT),
+        max_retries=LLM_MAX_RETRIES,
+        cache=llm_cache,
+        stream_usage=True  # token counts for streamed answers too (usage accounting)
+    )
+
+def set_rate_limit(calls_per_minute: Optional[float]):
+    """Limit chain invocations per minute across all threads (None removes the limit)"""
+    global _rate_limiter
+    _rate_limiter = RateLimiter(calls_per_minute / 60.0) if calls_per_minute else None
+
+@contextmanager
+def _accounted(name: str):
+    """Callback config that records the chain's token usage, latency and cost under name"""
+    recorder = usage_recorder(name)
+    if recorder is None:
+        yield {}
+        return
+    with recorder:
+        yield {"callbacks": [recorder], "run_name": name}
+
+def invoke_chain(chain, inputs: dict, name: str = "chain"):
+    """Invoke a chain through the OpenRouter circuit breaker, honouring the deadline and rate limit.
+
+    name is the chain's label in the LLM usage accounting (services/llm_usage.py).
+    """
+    if _rate_limiter is not None:
+        _rate_limiter.acquire()
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+    breaker = get_breaker("openrouter")
+    with span("llm.invoke", chain=name), _accounted(name) as config:
+        return breaker.call(lambda: chain.invoke(inputs, config=config), is_failure=_is_upstream_failure)
+
+def stream_chain(chain, inputs: dict, on_token: Callable[[str], None], name: str = "chain") -> str:
+    """Like invoke_chain, but passes each output chunk to on_token as it arrives; returns the full text"""
+    if _rate_limiter is not None:
+        _rate_limiter.acquire()
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check()
+
+    def consume(config):
+        parts = []
+        for chunk in chain.stream(inputs, config=config):
+            parts.append(chunk)
+            on_token(chunk)
+        return "".join(parts)
+
+    breaker = get_breaker("openrouter")
+    with span("llm.stream", chain=name), _accounted(name) as config:
+        return breaker.call(lambda: consume(config), is_failure=_is_upstream_failure)
@@ -0,0 +1,231 @@
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config.settings import LLM_PRICES, LLM_USAGE_ENABLED, LLM_USAGE_PATH, get_cache_dir
+from utils.tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+GROUPINGS = {"day", "chain", "user", "model"}
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    if not model:
+        return None
+    if model.endswith(":free"):
+        return 0.0
+    price = LLM_PRICES.get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+def _approximate_tokens(chars: int) -> int:
+    """~4 characters per token, for responses that came back without a usage block"""
+    return max(1, chars // 4) if chars else 0
+
+class UsageStore:
+    """Daily LLM usage totals per (day, chain, user, model) in a local SQLite file.
+
+    Each call is folded into its row with an upsert, so the file grows with
+    the number of distinct combinations per day, not with traffic. Worker
+    processes on one host share the file (WAL mode).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(get_cache_dir("usage"), "llm_usage.sqlite")
+        self._local = threading.local()
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                day TEXT NOT NULL,
+                chain TEXT NOT NULL,
+                user TEXT NOT NULL,
+                model TEXT NOT NULL,
+                calls INTEGER NOT NULL DEFAULT 0,
+                cache_hits INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                latency_sum REAL NOT NULL DEFAULT 0,
+                ttft_sum REAL NOT NULL DEFAULT 0,
+                ttft_count INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                unpriced_calls INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, chain, user, model)
+            )
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, call: Dict[str, Any]):
+        """Add one call: chain, user, model, prompt/completion tokens, latency, ttft, cache_hit, error, cost"""
+        day = datetime.fromtimestamp(call.get("at", time.time())).date().isoformat()
+        cost = call.get("cost")
+        ttft = call.get("ttft")
+        self._connect().execute("""
+            INSERT INTO llm_usage (day, chain, user, model, calls, cache_hits, errors, prompt_tokens,
+                                   completion_tokens, latency_sum, ttft_sum, ttft_count, cost, unpriced_calls)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, chain, user, model) DO UPDATE SET
+                calls = calls + 1,
+                cache_hits = cache_hits + excluded.cache_hits,
+                errors = errors + excluded.errors,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                latency_sum = latency_sum + excluded.latency_sum,
+                ttft_sum = ttft_sum + excluded.ttft_sum,
+                ttft_count = ttft_count + excluded.ttft_count,
+                cost = cost + excluded.cost,
+                unpriced_calls = unpriced_calls + excluded.unpriced_calls
+        """, (
+            day, call["chain"], call.get("user") or "", call.get("model") or "",
+            int(bool(call.get("cache_hit"))), int(bool(call.get("error"))),
+            call.get("prompt_tokens", 0), call.get("completion_tokens", 0), call.get("latency", 0.0),
+            ttft or 0.0, int(ttft is not None), cost or 0.0, int(cost is None)
+        ))
+
+    def summary(self, by: Sequence[str] = ("day", "chain"), days: int = 7,
+                user: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Totals of the last days grouped by any of day/chain/user/model, most expensive first"""
+        columns = [column for column in by if column in GROUPINGS]
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        where, params = "day >= ?", [since]
+        if user is not None:
+            where += " AND user = ?"
+            params.append(user)
+        select = ", ".join(columns + [
+            "SUM(calls)", "SUM(cache_hits)", "SUM(errors)", "SUM(prompt_tokens)", "SUM(completion_tokens)",
+            "SUM(latency_sum) / SUM(calls)", "SUM(ttft_sum) / NULLIF(SUM(ttft_count), 0)", "SUM(cost)",
+            "SUM(unpriced_calls)"
+        ])
+        group = f" GROUP BY {', '.join(columns)}" if columns else ""
+        rows = self._connect().execute(
+            f"SELECT {select} FROM llm_usage WHERE {where}{group} ORDER BY SUM(cost) DESC, SUM(prompt_tokens) DESC",
+            params
+        ).fetchall()
+        names = columns + ["calls", "cache_hits", "errors", "prompt_tokens", "completion_tokens",
+                           "avg_latency", "avg_ttft", "cost", "unpriced_calls"]
+        return [dict(zip(names, row)) for row in rows if row[len(columns)]]
+
+_store: Optional[UsageStore] = None
+_store_lock = threading.Lock()
+
+def get_usage_store() -> UsageStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UsageStore(LLM_USAGE_PATH or None)
+        return _store
+
+# The recorder of the chain invocation in progress; the LLM cache reports hits to it
+_active_recorder: contextvars.ContextVar = contextvars.ContextVar("llm_usage_recorder", default=None)
+
+def note_cache_hit():
+    recorder = _active_recorder.get()
+    if recorder is not None:
+        recorder.cache_hits += 1
+
+class UsageRecorder(BaseCallbackHandler):
+    """Callback handler for one chain invocation: times each model call and reads its token usage.
+
+    Token counts come from the provider's usage block (requested for streams
+    with stream_usage); responses without one are approximated from the
+    text. Cache hits cost nothing and are recorded with zero tokens.
+    """
+
+    def __init__(self, chain: str):
+        self.chain = chain
+        self.cache_hits = 0
+        self.calls: List[Dict[str, Any]] = []
+        self._runs: Dict[Any, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        metadata = kwargs.get("metadata") or {}
+        self._runs[run_id] = {
+            "start": time.perf_counter(), "first_token": None, "cache_hits": self.cache_hits,
+            "model": params.get("model_name") or params.get("model") or metadata.get("ls_model_name"),
+            "prompt_chars": sum(len(str(message.content)) for batch in messages for message in batch)
+        }
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None and token:
+            run["first_token"] = time.perf_counter()
+
+    def _finish(self, run_id, error: Optional[str], response=None):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        now = time.perf_counter()
+        cache_hit = self.cache_hits > run["cache_hits"]
+        prompt_tokens = completion_tokens = 0
+        if response is not None and not cache_hit:
+            prompt_tokens, completion_tokens = self._tokens(response, run)
+        self.calls.append({
+            "at": time.time(), "chain": self.chain, "model": run["model"], "cache_hit": cache_hit, "error": error,
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "latency": now - run["start"],
+            "ttft": run["first_token"] - run["start"] if run["first_token"] is not None else None,
+            "cost": 0.0 if cache_hit else estimate_cost(run["model"], prompt_tokens, completion_tokens)
+        })
+
+    @staticmethod
+    def _tokens(response, run: Dict[str, Any]) -> tuple:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens") is not None:
+            return usage["prompt_tokens"], usage.get("completion_tokens") or 0
+        generations = [generation for batch in response.generations for generation in batch]
+        metadata = [getattr(getattr(g, "message", None), "usage_metadata", None) for g in generations]
+        if metadata and all(metadata):
+            return (sum(m.get("input_tokens", 0) for m in metadata),
+                    sum(m.get("output_tokens", 0) for m in metadata))
+        return (_approximate_tokens(run["prompt_chars"]),
+                sum(_approximate_tokens(len(g.text)) for g in generations))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, None, response)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs):
+        self._finish(run_id, type(error).__name__)
+
+    def __enter__(self):
+        self._token = _active_recorder.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_recorder.reset(self._token)
+        self.flush()
+
+    def flush(self):
+        """Write the recorded calls, attributed to the user of the current request"""
+        trace = current_trace()
+        user = trace.attrs.get("user") if trace is not None else None
+        calls, self.calls = self.calls, []
+        for call in calls:
+            call["user"] = user
+            try:
+                get_usage_store().record(call)
+            except sqlite3.Error as e:
+                logger.warning("Could not record LLM usage: %s", e)
+
+def usage_recorder(chain: str) -> Optional[UsageRecorder]:
+    """A recorder for one invocation of chain, or None when LLM_USAGE_ENABLED is off"""
+    return UsageRecorder(chain) if LLM_USAGE_ENABLED else None
+
+def usage_summary(by: Sequence[str] = ("day", "chain"), days: int = 7,
+                  user: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_usage_store().summary(by, days, user)
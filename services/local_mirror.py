@@ -0,0 +1,314 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from clients.metabase_client import raise_query_errors
+from config.settings import (
+    LOCAL_MIRROR_ENABLED, LOCAL_MIRROR_LOOKBACK_DAYS, LOCAL_MIRROR_MAX_STALENESS, LOCAL_MIRROR_PAGE_ROWS,
+    LOCAL_MIRROR_REFRESH, LOCAL_MIRROR_TABLES, RESULT_QUERY_MAX_MB, get_cache_dir
+)
+from utils.arrow_results import is_truncated, mark_truncated
+from utils.helpers import quote_identifier
+from utils.resilience import current_cancel_token
+
+try:
+    import duckdb
+except ImportError:  # optional: pip install duckdb
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_ROWS = 16384
+
+_ALIAS = re.compile(r"\s+AS\s+.*$", re.IGNORECASE)
+
+def parse_mirror_tables(spec: str) -> Dict[str, str]:
+    """{"schema.table": "DATE_COLUMN"} from LOCAL_MIRROR_TABLES"""
+    tables = {}
+    for item in spec.split(","):
+        name, _, date_column = item.strip().partition(":")
+        if name and date_column:
+            tables[name.lower()] = date_column.strip()
+    return tables
+
+def referenced_tables(sql: str) -> List[str]:
+    """Lower-cased "schema.table" names the SQL reads (DuckDB parser); [] when DuckDB cannot parse it"""
+    try:
+        names = duckdb.get_table_names(sql, qualified=True)
+    except duckdb.Error:
+        return []
+    return sorted({_ALIAS.sub("", name).replace('"', "").lower() for name in names})
+
+def is_single_select(sql: str) -> bool:
+    """Exactly one statement and it is a query: user SQL never writes, attaches or changes settings"""
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error:
+        return False
+    return len(statements) == 1 and statements[0].type == duckdb.StatementType.SELECT
+
+def _visible_tables(metabase_client, database_id: int) -> set:
+    """Tables the user's Metabase permissions expose (cached metadata)"""
+    return {f"{t['schema']}.{t['table']}".lower() for t in metabase_client.get_tables(database_id)}
+
+def _naive(value):
+    """Watermarks are kept as naive timestamps (UTC wall time for tz-aware columns)"""
+    return value.replace(tzinfo=None) if isinstance(value, datetime) else value
+
+def _timestamp_literal(value) -> str:
+    # Full precision: the local DELETE and the paging compare against the same value
+    value = _naive(value)
+    return f"TIMESTAMP '{value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()}'"
+
+class LocalMirror:
+    """Hot Metabase tables copied into an embedded DuckDB file for sub-second queries.
+
+    Each table is refreshed incrementally: rows at or after the stored date
+    watermark (minus LOCAL_MIRROR_LOOKBACK_DAYS) are re-read through Metabase
+    and replace their local copies. SQL runs locally only when every table it
+    references is mirrored and refreshed within LOCAL_MIRROR_MAX_STALENESS.
+
+    User SQL runs as a single SELECT in a read-only transaction, on a
+    connection that cannot touch files, install extensions or change its
+    configuration.
+    """
+
+    def __init__(self, path: str, tables: Dict[str, str]):
+        self.path = path
+        self.tables = tables
+        self._conn = duckdb.connect(path, config={"enable_external_access": False, "lock_configuration": True})
+        self._write_lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stats = {"local": 0, "fallback": 0, "refreshes": 0, "refresh_errors": 0}
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_state "
+            "(name VARCHAR PRIMARY KEY, watermark TIMESTAMP, refreshed_at DOUBLE, row_count BIGINT)"
+        )
+
+    def _state(self) -> Dict[str, Dict]:
+        rows = self._conn.cursor().execute("SELECT name, watermark, refreshed_at, row_count FROM _mirror_state")
+        return {
+            name: {"watermark": watermark, "refreshed_at": refreshed_at, "row_count": row_count}
+            for name, watermark, refreshed_at, row_count in rows.fetchall()
+        }
+
+    def covers(self, sql: str) -> bool:
+        """Whether every table the SQL reads is mirrored and fresh enough"""
+        tables = referenced_tables(sql)
+        if not tables:
+            return False
+        state = self._state()
+        now = time.time()
+        return all(
+            name in state and now - state[name]["refreshed_at"] <= LOCAL_MIRROR_MAX_STALENESS for name in tables
+        )
+
+    def query(self, sql: str, max_bytes: Optional[int] = None) -> pa.Table:
+        """Run one SELECT, holding at most max_bytes (RESULT_QUERY_MAX_MB) of rows.
+
+        Rows are read in batches; once the budget is used up the leading rows
+        are kept and the result is flagged as truncated, like a Metabase result.
+        """
+        max_bytes = max_bytes or int(RESULT_QUERY_MAX_MB * 1024 * 1024)
+        if not is_single_select(sql):
+            raise ValueError("Only a single SELECT statement can run on the local mirror")
+        cursor = self._conn.cursor()
+        token = current_cancel_token()
+        unregister = token.on_cancel(cursor.interrupt) if token is not None else None
+        try:
+            cursor.execute("BEGIN TRANSACTION READ ONLY")
+            reader = cursor.execute(sql).to_arrow_reader(QUERY_BATCH_ROWS)
+            batches, size, complete = [], 0, True
+            for batch in reader:
+                if size > max_bytes:
+                    complete = False
+                    break
+                batches.append(batch)
+                size += batch.nbytes
+            result = pa.Table.from_batches(batches, schema=reader.schema)
+        finally:
+            if unregister is not None:
+                unregister()
+            cursor.close()
+        if token is not None:
+            token.check()
+        return result if complete else mark_truncated(result)
+
+    def try_query(self, sql: str, visible: set) -> Optional[pa.Table]:
+        """Local result, or None when the mirror cannot answer (Metabase should run the query)"""
+        if is_single_select(sql) and set(referenced_tables(sql)) <= visible and self.covers(sql):
+            try:
+                result = self.query(sql)
+                self._stats["local"] += 1
+                return result
+            except duckdb.Error as e:
+                logger.info("Local mirror could not run query, using Metabase: %s", e)
+        self._stats["fallback"] += 1
+        return None
+
+    def _fetch_page(self, metabase_client, database_id: int, name: str, since) -> tuple:
+        """One page of the copy, oldest first: (rows, complete)"""
+        column = quote_identifier(self.tables[name])
+        where = f" WHERE {column} >= {_timestamp_literal(since)}" if since is not None else ""
+        # Runs on a background thread: a failed page must raise, not come back as an empty result
+        with raise_query_errors():
+            batch = metabase_client.execute_query(
+                database_id, f"SELECT * FROM {name}{where} ORDER BY {column}", use_cache=False,
+                as_arrow=True, max_rows=LOCAL_MIRROR_PAGE_ROWS
+            )
+        # A full page counts as cut even when Metabase did not flag rows_truncated
+        return batch, not is_truncated(batch) and batch.num_rows < LOCAL_MIRROR_PAGE_ROWS
+
+    def refresh_table(self, metabase_client, database_id: int, name: str) -> int:
+        """Pull rows at or after the watermark through Metabase; returns rows written.
+
+        Pages are collected in a temporary table and replace the local rows in
+        one transaction once the last page is in; the watermark and refresh
+        time are only recorded then, so a failed or cut copy changes nothing.
+        """
+        date_column = self.tables[name]
+        state = self._state().get(name)
+        since = None
+        if state is not None and state["watermark"] is not None:
+            since = state["watermark"] - timedelta(days=LOCAL_MIRROR_LOOKBACK_DAYS)
+        target = ".".join(quote_identifier(part) for part in name.split("."))
+        column = quote_identifier(date_column)
+        schema = name.rsplit(".", 1)[0] if "." in name else None
+        watermark = state["watermark"] if state else None
+
+        cursor = self._conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS _mirror_copy")
+        page_since, staged = since, False
+        try:
+            while True:
+                batch, complete = self._fetch_page(metabase_client, database_id, name, page_since)
+                values = batch.column(date_column)
+                batch_max = pc.max(values).as_py() if batch.num_rows else None
+                if not complete:
+                    if batch_max is None or _naive(batch_max) == page_since:
+                        raise MemoryError(f"{name}: rows for {batch_max} do not fit in one page")
+                    # The page may end mid-date: the last date is re-read by the next page
+                    batch = batch.filter(pc.less(values, pa.scalar(batch_max, type=values.type)))
+                if batch_max is not None and (watermark is None or _naive(batch_max) > watermark):
+                    watermark = _naive(batch_max)
+                cursor.register("_mirror_batch", batch)
+                if staged:
+                    cursor.execute("INSERT INTO _mirror_copy SELECT * FROM _mirror_batch")
+                else:
+                    cursor.execute("CREATE TEMP TABLE _mirror_copy AS SELECT * FROM _mirror_batch")
+                    staged = True
+                cursor.unregister("_mirror_batch")
+                if complete:
+                    break
+                page_since = _naive(batch_max)
+
+            with self._write_lock:
+                cursor.execute("BEGIN TRANSACTION")
+                try:
+                    if schema:
+                        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_identifier(schema)}")
+                    cursor.execute(f"CREATE TABLE IF NOT EXISTS {target} AS SELECT * FROM _mirror_copy LIMIT 0")
+                    if since is not None:
+                        cursor.execute(f"DELETE FROM {target} WHERE {column} >= ?", [since])
+                    cursor.execute(f"INSERT INTO {target} SELECT * FROM _mirror_copy")
+                    row_count = cursor.execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0]
+                    cursor.execute("INSERT OR REPLACE INTO _mirror_state VALUES (?, ?, ?, ?)",
+                                   [name, watermark, time.time(), row_count])
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            return cursor.execute("SELECT COUNT(*) FROM _mirror_copy").fetchone()[0]
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS _mirror_copy")
+            cursor.close()
+
+    def refresh(self, metabase_client, database_id: int):
+        """Refresh every mirrored table the client can see; one refresh at a time"""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            visible = _visible_tables(metabase_client, database_id)
+            for name in self.tables:
+                if name not in visible:
+                    continue
+                try:
+                    rows = self.refresh_table(metabase_client, database_id, name)
+                    self._stats["refreshes"] += 1
+                    logger.info("Mirror refresh %s: %d rows", name, rows)
+                except Exception as e:
+                    self._stats["refresh_errors"] += 1
+                    logger.warning("Mirror refresh of %s failed: %s", name, e)
+        finally:
+            self._refreshing.release()
+
+    def refresh_due(self) -> bool:
+        state = self._state()
+        now = time.time()
+        return any(name not in state or now - state[name]["refreshed_at"] >= LOCAL_MIRROR_REFRESH
+                   for name in self.tables)
+
+    def schedule_refresh(self, metabase_client, database_id: int):
+        """Start a background refresh when one is due and none is running"""
+        if self.refresh_due() and not self._refreshing.locked():
+            threading.Thread(
+                target=self.refresh, args=(metabase_client, database_id), name="mirror-refresh", daemon=True
+            ).start()
+
+    def stats(self) -> Dict:
+        return dict(self._stats, tables={
+            name: {"row_count": entry["row_count"], "age": round(time.time() - entry["refreshed_at"]),
+                   "watermark": str(entry["watermark"])}
+            for name, entry in self._state().items()
+        })
+
+_mirrors: Dict[tuple, LocalMirror] = {}
+_mirrors_lock = threading.Lock()
+
+def get_mirror(metabase_client, database_id: int) -> Optional[LocalMirror]:
+    """The mirror for this Metabase URL, permission scope and database, or None when disabled or DuckDB is missing.
+
+    Rows are copied with the permissions of whoever triggers the refresh, so
+    a mirror is only shared within one cache_scope, like the shared caches:
+    Metabase row sandboxing still applies to what each user is served.
+    """
+    if not LOCAL_MIRROR_ENABLED or duckdb is None:
+        return None
+    tables = parse_mirror_tables(LOCAL_MIRROR_TABLES)
+    if not tables:
+        return None
+    key = (metabase_client.base_url, getattr(metabase_client, "cache_scope", None), database_id)
+    with _mirrors_lock:
+        if key not in _mirrors:
+            digest = hashlib.sha256("|".join(map(str, key)).encode()).hexdigest()[:16]
+            _mirrors[key] = LocalMirror(os.path.join(get_cache_dir("mirror"), f"{digest}.duckdb"), tables)
+        return _mirrors[key]
+
+def mirror_stats() -> List[Dict]:
+    with _mirrors_lock:
+        mirrors = list(_mirrors.items())
+    return [dict(mirror.stats(), database_id=key[2]) for key, mirror in mirrors]
+
+def execute_query(metabase_client, database_id: int, sql: str, use_cache: bool = True) -> pa.Table:
+    """Run SQL on the local mirror when it covers every table, otherwise on Metabase.
+
+    Local results only go to users whose Metabase permissions include every
+    referenced table; a DuckDB error (e.g. warehouse-specific syntax) falls
+    back to Metabase as well. use_cache=False skips the shared result cache
+    for queries whose answer must be current.
+    """
+    mirror = get_mirror(metabase_client, database_id)
+    if mirror is not None:
+        mirror.schedule_refresh(metabase_client, database_id)
+        result = mirror.try_query(sql, _visible_tables(metabase_client, database_id))
+        if result is not None:
+            return result
+    return metabase_client.execute_query(database_id, sql, use_cache=use_cache, as_arrow=True)
@@ -0,0 +1,268 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+from clients.metabase_client import QueryError
+from config.settings import CARD_MATCH_ENABLED
+from services.card_matcher import match_card
+from services.catalog_index import search_catalog
+from services.data_context import format_profile, get_table_profile, main_table
+from services.incremental import execute_query
+from services.llm_factory import create_llm, invoke_chain, stream_chain
+from services.query_classifier import classify_query_type
+from services.query_generator import generate_sql_query
+from utils.arrow_results import empty_table, is_truncated, summarize_table
+from utils.tracing import current_trace, span, start_trace
+
+class PipelineObserver:
+    """Front-end hooks for answer_question; every hook is optional and does nothing by default.
+
+    The pipeline itself never touches a UI: Streamlit, the HTTP API and the
+    batch runner each subclass this to show progress in their own way.
+    """
+
+    streams_tokens = False  # True: the final answer is streamed and passed to on_token
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
+
+    def on_query_type(self, query_type: str):
+        pass
+
+    def on_sql(self, sql: str, source: str, title: Optional[str]):
+        pass
+
+    def on_result(self, table):
+        pass
+
+    def run_query(self, run: Callable[[], Any], description: str):
+        """Run a warehouse query; front ends may run it as a cancellable job instead"""
+        return run()
+
+    def on_token(self, text: str):
+        pass
+
+    def wants_structure_analysis(self) -> bool:
+        return False
+
+@contextmanager
+def _stage(observer: PipelineObserver, name: str):
+    """A pipeline stage: shown by the front end and recorded as a tracing span"""
+    with span(name), observer.stage(name):
+        yield
+
+def _run_chain(chain, inputs: dict, observer: Optional[PipelineObserver], name: str) -> str:
+    if observer is not None and observer.streams_tokens:
+        return stream_chain(chain, inputs, observer.on_token, name=name)
+    return invoke_chain(chain, inputs, name=name)
+
+def _format_catalog_item(item: Dict) -> str:
+    collection = f" [{item['collection']}]" if item.get("collection") else ""
+    return f"- {item['name']}{collection}: {item['description']}"
+
+def analyze_result(llm, user_query: str, sql_query: str, table, observer: Optional[PipelineObserver] = None) -> str:
+    """LLM analysis of a query result"""
+    # Instructions first, query-specific data last (provider-side prompt caching works on prefixes)
+    prompt = ChatPromptTemplate.from_template("""
+Sebagai analis data ahli, berikan analisis mendalam berdasarkan hasil query di bawah.
+
+Tugas Anda:
+1. Berikan ringkasan eksekutif dari hasil analisis
+2. Identifikasi insight utama dan pola menarik
+3. Berikan interpretasi bisnis yang actionable
+4. Sertakan rekomendasi strategis jika relevan
+5. Gunakan bahasa Indonesia yang profesional namun mudah dipahami
+
+Format response dengan struktur yang jelas dan numbering untuk kemudahan pembacaan.
+
+SQL Query: {query}
+Jumlah Data: {row_count} baris
+Kolom: {columns}
+
+Data Sample (5 baris pertama):
+{sample_data}
+
+Statistik Ringkas:
+{data_summary}
+
+Pertanyaan User: {question}
+""")
+    
+    # Prepare data summary (only the 5-row sample is converted to pandas)
+    sample_data = table.slice(0, 5).to_pandas().to_string(index=False)
+    data_summary = summarize_table(table)
+    
+    chain = prompt | llm | StrOutputParser()
+    return _run_chain(chain, {
+        "question": user_query,
+        "query": sql_query,
+        "row_count": f"{table.num_rows} (terpotong karena batas memori)" if is_truncated(table) else table.num_rows,
+        "columns": ", ".join(table.column_names),
+        "sample_data": sample_data,
+        "data_summary": data_summary
+    }, observer, "analysis")
+
+def answer_question(user_query: str, metabase_client, database_id: int, chat_history: list,
+                    observer: Optional[PipelineObserver] = None) -> str:
+    """Classify the question and answer it; front ends follow along through the observer"""
+    observer = observer or PipelineObserver()
+    with start_trace("answer_question", question=user_query[:200],
+                     user=getattr(metabase_client, "username", None), database_id=database_id):
+        return _answer(user_query, metabase_client, database_id, chat_history, observer)
+
+def _answer(user_query: str, metabase_client, database_id: int, chat_history: list,
+            observer: PipelineObserver) -> str:
+    with _stage(observer, "classify"):
+        query_type = classify_query_type(user_query)
+    current_trace().attrs["query_type"] = query_type
+    observer.on_query_type(query_type)
+    llm = create_llm("deepseek/deepseek-chat:free", 0.4)
+    
+    if query_type == "data_query":
+        table = empty_table()
+        
+        # A saved question that already answers this skips SQL generation (and hits Metabase's cache)
+        with _stage(observer, "card_match"):
+            card_match = match_card(user_query, metabase_client, database_id) if CARD_MATCH_ENABLED else None
+        if card_match:
+            card = card_match["card"]
+            sql_query = card.get("query") or f"-- Saved question #{card['id']}: {card['name']}"
+            observer.on_sql(sql_query, f"card:{card['id']}", card["name"])
+            with _stage(observer, "execute_card"):
+                try:
+                    table = observer.run_query(
+                        lambda: metabase_client.execute_card(card["id"], card_match["parameters"], as_arrow=True),
+                        f"Saved question #{card['id']}"
+                    )
+                except QueryError:
+                    pass  # a broken saved question falls back to generated SQL
+        
+        if table.num_rows == 0:
+            # Get detailed table information
+            with _stage(observer, "schema"):
+                tables = metabase_client.get_tables(database_id)
+            
+            if not tables:
+                return "❌ Tidak dapat mengakses tabel database. Pastikan koneksi database sudah benar."
+            
+            # Generate SQL query with enhanced logic
+            with _stage(observer, "sql"):
+                sql_query = generate_sql_query(
+                    user_query, tables, chat_history, metabase_client, database_id,
+                    analyze_structure=observer.wants_structure_analysis()
+                )
+            observer.on_sql(sql_query, "generated", None)
+            
+            # Execute query
+            with _stage(observer, "execute"):
+                table = observer.run_query(
+                    lambda: execute_query(metabase_client, database_id, sql_query), sql_query
+                )
+        
+        if table.num_rows > 0:
+            observer.on_result(table)
+            with _stage(observer, "analyze"):
+                return analyze_result(llm, user_query, sql_query, table, observer)
+            
+        else:
+            return "❌ Query tidak mengembalikan hasil. Coba pertanyaan yang lebih spesifik atau periksa ketersediaan data."
+    
+    elif query_type == "dashboard_info":
+        # Only the dashboards most relevant to the question go into the prompt
+        dashboards = search_catalog(metabase_client, user_query, "dashboard")
+        if dashboards:
+            dashboard_list = "\n".join([_format_catalog_item(dash) for dash in dashboards])
+            
+            prompt = ChatPromptTemplate.from_template("""
+Berikan informasi yang relevan tentang dashboard yang diminta, serta saran dashboard mana yang paling sesuai untuk kebutuhan user.
+
+Daftar Dashboard yang Tersedia:
+{dashboard_list}
+
+User bertanya tentang dashboard: {question}
+""")
+            
+            chain = prompt | llm | StrOutputParser()
+            with _stage(observer, "answer"):
+                return _run_chain(chain, {"question": user_query, "dashboard_list": dashboard_list}, observer,
+                                  "dashboard_info")
+        else:
+            return "❌ Tidak dapat mengakses daftar dashboard."
+    
+    elif query_type == "card_info":
+        cards = search_catalog(metabase_client, user_query, "card")
+        if cards:
+            card_list = "\n".join([_format_catalog_item(card) for card in cards])
+            
+            prompt = ChatPromptTemplate.from_template("""
+Berikan informasi yang relevan tentang cards yang diminta, serta saran cards mana yang paling sesuai untuk kebutuhan user.
+
+Daftar Cards/Questions yang Tersedia:
+{card_list}
+
+User bertanya tentang cards/questions: {question}
+""")
+            
+            chain = prompt | llm | StrOutputParser()
+            with _stage(observer, "answer"):
+                return _run_chain(chain, {"question": user_query, "card_list": card_list}, observer,
+                                  "card_info")
+        else:
+            return "❌ Tidak dapat mengakses daftar cards/questions."
+    
+    elif query_type == "recommendation":
+        # Whole-table statistics computed by the warehouse in one aggregate query
+        table_info = main_table(metabase_client.get_tables(database_id))
+        if table_info:
+            with _stage(observer, "execute"):
+                profile = observer.run_query(
+                    lambda: get_table_profile(metabase_client, database_id, table_info),
+                    f"Profil tabel {table_info['schema']}.{table_info['table']}"
+                )
+            
+            if profile:
+                data_context = format_profile(profile)
+                
+                prompt = ChatPromptTemplate.from_template("""
+Sebagai konsultan bisnis berpengalaman, berikan rekomendasi strategis berdasarkan pertanyaan user di bawah.
+
+Berikan rekomendasi yang:
+1. Actionable dan praktis
+2. Berdasarkan data yang tersedia
+3. Mengidentifikasi peluang bisnis
+4. Mencakup langkah implementasi
+5. Mempertimbangkan risiko dan mitigasi
+
+Format dalam bahasa Indonesia yang profesional dan terstruktur.
+
+Konteks Data:
+{data_context}
+
+Pertanyaan User: {question}
+""")
+                
+                chain = prompt | llm | StrOutputParser()
+                with _stage(observer, "answer"):
+                    return _run_chain(chain, {
+                        "question": user_query,
+                        "data_context": data_context
+                    }, observer, "recommendation")
+            else:
+                return "❌ Tidak dapat mengakses data untuk memberikan rekomendasi."
+        else:
+            return "❌ Tidak dapat mengakses tabel untuk analisis rekomendasi."
+    
+    else:  # general
+        prompt = ChatPromptTemplate.from_template("""
+Sebagai asisten analitik data yang ramah, jawab pertanyaan umum dengan informatif.
+Berikan jawaban yang membantu dan jika relevan, arahkan user untuk mengajukan pertanyaan analitik yang lebih spesifik tentang data mereka.
+
+Pertanyaan: {question}
+""")
+        
+        chain = prompt | llm | StrOutputParser()
+        with _stage(observer, "answer"):
+            return _run_chain(chain, {"question": user_query}, observer, "general")
\ No newline at end of file
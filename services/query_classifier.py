@@ -1,6 +1,6 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from services.llm_factory import create_llm, invoke_chain
 
 def classify_query_type(question: str) -> str:
     try:
@@ -16,8 +16,8 @@ Classify the user question into one of these categories:
 Respond ONLY with the category label."""),
             ("human", "{question}")
         ])
-        llm = ChatOpenAI(model="deepseek/deepseek-chat:free", temperature=0.2)
+        llm = create_llm("deepseek/deepseek-chat:free", 0.2)
         chain = prompt | llm | StrOutputParser()
-        return chain.invoke({"question": question}).strip().lower()
+        return invoke_chain(chain, {"question": question}, name="classify").strip().lower()
     except Exception:
         return "data_query"
\ No newline at end of file
@@ -1,11 +1,21 @@
-import streamlit as st
+import logging
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_openai import ChatOpenAI
+from services.llm_factory import create_llm, invoke_chain
 from typing import Dict, List
+import hashlib
+from services.incremental import register as register_incremental, warehouse_today
+from config.settings import SQL_TEMPLATES_ENABLED, VALUE_INDEX_ENABLED
+from services.sql_templates import match_template
+from services.value_lookup import format_literals, resolve_literals
+from utils.cache import get_cache
+from utils.helpers import generate_fallback_query
 
-def generate_sql_query(question: str, tables_info: List[Dict], chat_history: list, metabase_client, database_id: int):
+logger = logging.getLogger(__name__)
+
+def generate_sql_query(question: str, tables_info: List[Dict], chat_history: list, metabase_client, database_id: int,
+                       analyze_structure: bool = False):
     try:
         # Build comprehensive schema information
         schema_details = ""
@@ -33,30 +43,66 @@ def generate_sql_query(question: str, tables_info: List[Dict], chat_history: lis
         if not main_table and tables_info:
             main_table = f"{tables_info[0]['schema']}.{tables_info[0]['table']}"
         
-        # Analyze table structure if needed
-        if main_table and not st.session_state.table_structure_analyzed:
-            with st.spinner("Menganalisis struktur tabel..."):
-                structure_info = metabase_client.analyze_table_structure(database_id, main_table)
-                if structure_info:
-                    st.session_state.table_structure_analyzed = True
-                    schema_details += f"\nTable Analysis for {main_table}:\n"
-                    schema_details += f"- Total columns: {len(structure_info.get('columns', []))}\n"
-                    schema_details += f"- Sample data available: {len(structure_info.get('sample_data', []))} rows\n"
-                    if 'total_rows' in structure_info:
-                        schema_details += f"- Estimated total rows: {structure_info['total_rows']}\n"
+        main_info = next(
+            (table for table in tables_info if f"{table['schema']}.{table['table']}" == main_table), None
+        )
+        
+        # Column values mentioned in the question, spelled as they are in the data
+        literals = []
+        if VALUE_INDEX_ENABLED and main_info:
+            try:
+                literals = resolve_literals(question, main_info, metabase_client)
+            except Exception as e:
+                logger.warning("Value lookup failed: %s", e)
+        filter_values = format_literals(literals)
+        
+        # Common question shapes are answered from templates built on the table's real columns
+        if SQL_TEMPLATES_ENABLED and main_info:
+            template = match_template(question, main_info, literals,
+                                      today=warehouse_today(metabase_client, database_id))
+            if template:
+                if template.get("incremental"):
+                    register_incremental(template["sql"], template["incremental"])
+                return template["sql"]
+        
+        # Prepare chat context
+        chat_context = ""
+        if len(chat_history) > 2:
+            recent_messages = chat_history[-4:]  # Last 2 Q&A pairs
+            for msg in recent_messages:
+                if isinstance(msg, HumanMessage):
+                    chat_context += f"Q: {msg.content}\n"
+                elif isinstance(msg, AIMessage):
+                    chat_context += f"A: {msg.content[:100]}...\n"
+        
+        # Same question against the same schema and context -> reuse the generated SQL
+        sql_cache = get_cache("sql")
+        sql_cache_key = (
+            getattr(metabase_client, "base_url", None),
+            database_id,
+            hashlib.sha256(schema_details.encode("utf-8")).hexdigest(),
+            " ".join(question.lower().split()),
+            chat_context,
+            filter_values
+        )
+        cached_sql = sql_cache.get(sql_cache_key)
+        if cached_sql:
+            return cached_sql
+        
+        # Analyze table structure if the caller asks for it (the UI does so once per session)
+        if main_table and analyze_structure:
+            structure_info = metabase_client.analyze_table_structure(database_id, main_table)
+            if structure_info:
+                schema_details += f"\nTable Analysis for {main_table}:\n"
+                schema_details += f"- Total columns: {len(structure_info.get('columns', []))}\n"
+                schema_details += f"- Sample data available: {len(structure_info.get('sample_data', []))} rows\n"
+                if 'total_rows' in structure_info:
+                    schema_details += f"- Estimated total rows: {structure_info['total_rows']}\n"
         
+        # Static instructions, then schema, then per-question parts: the shared prefix can be cached by the provider
         prompt = ChatPromptTemplate.from_template("""
 You are an expert SQL analyst. Generate a precise SQL query to answer the user's question based on the provided database schema.
 
-Database Schema Information:
-{schema_details}
-
-Main Table: {main_table}
-
-User Question: {question}
-
-Previous Context: {chat_context}
-
 SQL Generation Rules:
 1. Generate ONLY the SQL query, no explanations or markdown
 2. Use proper table names with schema prefixes
@@ -70,6 +116,7 @@ SQL Generation Rules:
 10. Add LIMIT clause for top/bottom results
 11. Handle NULL values appropriately
 12. Use proper date formatting and filtering
+13. When Known Filter Values are given, use exactly those column/value pairs (same spelling and casing) for filters
 
 Query Generation Strategy:
 - Identify key entities in the question (customer, product, time period, metric)
@@ -78,28 +125,31 @@ Query Generation Strategy:
 - Apply filters based on question context
 - Sort results meaningfully
 
+Database Schema Information:
+{schema_details}
+
+Main Table: {main_table}
+
+Previous Context: {chat_context}
+
+Known Filter Values:
+{filter_values}
+
+User Question: {question}
+
 Generate the SQL query:
 """)
         
-        llm = ChatOpenAI(model="mistralai/mistral-small-3.2-24b-instruct:free", temperature=0)
+        llm = create_llm("mistralai/mistral-small-3.2-24b-instruct:free", 0)
         chain = prompt | llm | StrOutputParser()
         
-        # Prepare chat context
-        chat_context = ""
-        if len(chat_history) > 2:
-            recent_messages = chat_history[-4:]  # Last 2 Q&A pairs
-            for msg in recent_messages:
-                if isinstance(msg, HumanMessage):
-                    chat_context += f"Q: {msg.content}\n"
-                elif isinstance(msg, AIMessage):
-                    chat_context += f"A: {msg.content[:100]}...\n"
-        
-        sql_query = chain.invoke({
+        sql_query = invoke_chain(chain, {
             "question": question,
             "schema_details": schema_details,
             "main_table": main_table or "mb.khs_customer_transactions",
-            "chat_context": chat_context
-        })
+            "chat_context": chat_context,
+            "filter_values": filter_values
+        }, name="sql")
         
         # Clean the SQL query
         sql_query = sql_query.strip()
@@ -108,26 +158,11 @@ Generate the SQL query:
         elif sql_query.startswith("```"):
             sql_query = sql_query.replace("```", "").strip()
         
+        if sql_query:
+            sql_cache.set(sql_cache_key, sql_query)
         return sql_query
         
     except Exception as e:
-        st.warning(f"SQL generation failed: {e}")
-        # Intelligent fallback based on question content
-        question_lower = question.lower()
-        
-        if any(word in question_lower for word in ["penjualan", "sales", "revenue", "omzet"]):
-            if any(word in question_lower for word in ["tertinggi", "terbesar", "highest", "top"]):
-                return "SELECT CUSTOMER_NAME, SUM(TOTAL_PRICE) as total_sales FROM mb.khs_customer_transactions GROUP BY CUSTOMER_NAME ORDER BY total_sales DESC LIMIT 10"
-            elif any(word in question_lower for word in ["bulan", "month", "bulanan"]):
-                return "SELECT EXTRACT(MONTH FROM REQUEST_DATE) as month, SUM(TOTAL_PRICE) as monthly_sales FROM mb.khs_customer_transactions GROUP BY EXTRACT(MONTH FROM REQUEST_DATE) ORDER BY month"
-            else:
-                return "SELECT CUSTOMER_NAME, ITEM_DESCRIPTION, TOTAL_PRICE, REQUEST_DATE FROM mb.khs_customer_transactions ORDER BY TOTAL_PRICE DESC LIMIT 20"
-        
-        elif any(word in question_lower for word in ["customer", "pelanggan", "pembeli"]):
-            return "SELECT CUSTOMER_NAME, CUSTOMER_CITY, COUNT(*) as transaction_count, SUM(TOTAL_PRICE) as total_spent FROM mb.khs_customer_transactions GROUP BY CUSTOMER_NAME, CUSTOMER_CITY ORDER BY total_spent DESC LIMIT 15"
-        
-        elif any(word in question_lower for word in ["produk", "product", "item", "barang"]):
-            return "SELECT ITEM_DESCRIPTION, COUNT(*) as sold_count, SUM(QUANTITY) as total_quantity, SUM(TOTAL_PRICE) as total_revenue FROM mb.khs_customer_transactions GROUP BY ITEM_DESCRIPTION ORDER BY total_revenue DESC LIMIT 15"
-        
-        else:
-            return "SELECT * FROM mb.khs_customer_transactions ORDER BY REQUEST_DATE DESC LIMIT 10"
\ No newline at end of file
+        logger.warning("SQL generation failed: %s", e)
+        # Keyword fallback with fixed SQL
+        return generate_fallback_query(question)
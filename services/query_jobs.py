@@ -0,0 +1,148 @@
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config.settings import QUERY_JOB_RETENTION, QUERY_JOB_WORKERS, QUERY_JOBS_PER_USER
+from utils.resilience import CancelToken, Cancelled, cancel_scope
+
+ACTIVE_STATES = ("queued", "running")
+
+class JobLimitError(Exception):
+    """The user already has QUERY_JOBS_PER_USER queries running"""
+
+class QueryJob:
+    """One submitted query: status, progress and, once finished, its result or error"""
+
+    def __init__(self, owner: str, description: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.description = description
+        self.status = "queued"  # queued -> running -> done | failed | cancelled
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.token = CancelToken()
+        self.error: Optional[BaseException] = None
+        self._result: Any = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def rows_read(self) -> int:
+        return self.token.rows_read
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Abort the query: closes its HTTP response, which also cancels it in Metabase"""
+        self.token.cancel()
+
+    def result(self) -> Any:
+        """The query result; raises the job's error (Cancelled if it was cancelled)"""
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self._result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "owner": self.owner,
+            "description": self.description,
+            "status": self.status,
+            "rows_read": self.rows_read,
+            "elapsed": round(self.elapsed, 3),
+            "error": str(self.error) if self.error is not None and self.status == "failed" else None
+        }
+
+class QueryJobManager:
+    """Runs queries on a shared thread pool, at most per_user_limit at a time for each owner.
+
+    submit() returns immediately; callers poll the job (or wait on it) and may
+    cancel it at any time. The submitting context (deadline, ...) is carried
+    over to the worker thread. Finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(self, max_workers: int, per_user_limit: int, retention: float):
+        self.per_user_limit = per_user_limit
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-job")
+        self._jobs: Dict[str, QueryJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner: str, fn: Callable[[], Any], description: str = "") -> QueryJob:
+        job = QueryJob(owner, description)
+        with self._lock:
+            self._prune()
+            active = sum(1 for other in self._jobs.values() if other.owner == owner and other.status in ACTIVE_STATES)
+            if active >= self.per_user_limit:
+                raise JobLimitError(
+                    f"Masih ada {active} query berjalan; tunggu selesai atau batalkan salah satunya"
+                )
+            self._jobs[job.id] = job
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, job, fn)
+        return job
+
+    def _run(self, job: QueryJob, fn: Callable[[], Any]):
+        job.started_at = time.time()
+        try:
+            with cancel_scope(job.token):
+                job.token.check()  # cancelled while queued
+                job.status = "running"
+                job._result = fn()
+                job.token.check()
+            job.status = "done"
+        except Cancelled as e:
+            job.error, job.status = e, "cancelled"
+        except BaseException as e:
+            job.error, job.status = e, "failed"
+        finally:
+            job.finished_at = time.time()
+            job._done.set()
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[QueryJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> bool:
+        job = self.get(job_id, owner)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def list(self, owner: Optional[str] = None) -> List[QueryJob]:
+        with self._lock:
+            self._prune()
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+            for job in self._jobs.values():
+                stats[job.status] += 1
+            return stats
+
+query_jobs = QueryJobManager(QUERY_JOB_WORKERS, QUERY_JOBS_PER_USER, QUERY_JOB_RETENTION)
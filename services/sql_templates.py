@@ -0,0 +1,365 @@
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set
+
+from utils.arrow_results import TEMPORAL_TYPES
+from utils.helpers import quote_identifier
+from utils.search_index import STOPWORDS
+
+NUMERIC_TYPES = {"type/Integer", "type/BigInteger", "type/Float", "type/Decimal", "type/Number"}
+TEXT_TYPES = {"type/Text", "type/Category", "type/City", "type/State", "type/Country", "type/Name"}
+
+# Question words -> field-name tokens they refer to
+FIELD_SYNONYMS = {
+    "penjualan": {"price", "amount", "revenue", "sales", "total"},
+    "sales": {"price", "amount", "revenue", "sales", "total"},
+    "omzet": {"price", "amount", "revenue", "sales", "total"},
+    "revenue": {"price", "amount", "revenue", "sales", "total"},
+    "pendapatan": {"price", "amount", "revenue", "sales", "total"},
+    "harga": {"price"},
+    "kuantitas": {"quantity", "qty"},
+    "terjual": {"quantity", "qty"},
+    "unit": {"quantity", "qty"},
+    "terlaris": {"quantity", "qty"},
+    "kota": {"city"},
+    "pelanggan": {"customer"},
+    "pembeli": {"customer"},
+    "konsumen": {"customer"},
+    "produk": {"item", "product"},
+    "barang": {"item", "product"},
+    "kategori": {"category"},
+    "cabang": {"branch", "store"},
+    "toko": {"store", "branch"},
+    "wilayah": {"region", "area"},
+    "provinsi": {"province", "state"},
+    "tanggal": {"date"}
+}
+# Among equally good matches, prefer the field that reads as the label; an aggregate-like
+# column (TOTAL_PRICE) only wins when the question asks for it ("penjualan", not "harga")
+LABEL_TOKENS = {"name", "description"}
+AGGREGATE_TOKENS = {"total", "amount"}
+# Ranking a dimension without a named metric ("top 5 pelanggan") ranks it by sales
+DEFAULT_MEASURE_WORD = "penjualan"
+IGNORED_FIELD_TOKENS = {"id", "uuid", "code", "kode"}
+
+TOP_WORDS = {"top", "tertinggi", "terbesar", "terbanyak", "terlaris", "teratas", "highest", "largest", "best",
+             "terbaik"}
+BOTTOM_WORDS = {"terendah", "terkecil", "tersedikit", "lowest", "smallest", "worst", "terburuk"}
+SUM_WORDS = {"total", "jumlah", "sum", "keseluruhan"}
+AVG_WORDS = {"rata", "average", "avg", "mean"}
+COUNT_NOUNS = {"transaksi", "transaction", "transactions", "order", "orders", "pesanan"}
+COUNT_WORDS = {"banyak", "banyaknya", "count", "many"}
+# "jumlah pelanggan", "berapa (banyak) pelanggan", "how many customers": count distinct values
+COUNT_LEAD_WORDS = COUNT_WORDS | {"jumlah", "berapa", "number"}
+GRAIN_WORDS = {
+    "hari": "day", "harian": "day", "daily": "day", "day": "day",
+    "bulan": "month", "bulanan": "month", "monthly": "month", "month": "month",
+    "tahun": "year", "tahunan": "year", "yearly": "year", "year": "year"
+}
+TREND_WORDS = {"tren", "trend", "perkembangan"}
+# Current period: "minggu ini", "bulan ini", "this week"
+WINDOW_WORDS = {
+    "hari": "day", "today": "day", "day": "day", "minggu": "week", "pekan": "week", "week": "week",
+    "bulan": "month", "month": "month", "tahun": "year", "year": "year"
+}
+CURRENT_WORDS = {"ini", "this"}
+MONTHS = {
+    "januari": 1, "january": 1, "jan": 1, "februari": 2, "february": 2, "feb": 2, "maret": 3, "march": 3,
+    "april": 4, "apr": 4, "mei": 5, "may": 5, "juni": 6, "june": 6, "juli": 7, "july": 7,
+    "agustus": 8, "august": 8, "agu": 8, "aug": 8, "september": 9, "sep": 9, "oktober": 10, "october": 10,
+    "okt": 10, "oct": 10, "november": 11, "nov": 11, "desember": 12, "december": 12, "des": 12, "dec": 12
+}
+FILLER_WORDS = STOPWORDS | {
+    "tampilkan", "tunjukkan", "lihat", "berikan", "sebutkan", "daftar", "list", "data", "semua", "all",
+    "by", "berdasarkan", "setiap", "tiap", "masing", "paling", "most", "dalam", "selama", "during",
+    "siapa", "who", "give", "get", "find", "cari", "mohon", "please", "nilai", "value", "per", "adalah",
+    "sepanjang", "tahun", "bulan", "its", "their", "was", "were", "has", "have", "yg"
+}
+
+# Words that shape a question rather than name a value (the value lookup skips them)
+VOCABULARY = (set(FIELD_SYNONYMS) | TOP_WORDS | BOTTOM_WORDS | SUM_WORDS | AVG_WORDS | COUNT_NOUNS | COUNT_LEAD_WORDS
+              | set(GRAIN_WORDS) | TREND_WORDS | set(WINDOW_WORDS) | CURRENT_WORDS | set(MONTHS) | FILLER_WORDS)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+def _literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _field_tokens(field: Dict) -> Set[str]:
+    return set(_words(field.get("name"))) | set(_words(field.get("display_name")))
+
+def _kind(field: Dict) -> Optional[str]:
+    field_type = field.get("type")
+    if _field_tokens(field) & IGNORED_FIELD_TOKENS:
+        return None
+    if field_type in NUMERIC_TYPES:
+        return "metric"
+    if field_type in TEMPORAL_TYPES:
+        return "date"
+    if field_type in TEXT_TYPES:
+        return "dimension"
+    return None
+
+def _refers_to(word: str, tokens: Set[str]) -> bool:
+    return word in tokens or bool(FIELD_SYNONYMS.get(word, set()) & tokens)
+
+def _pick_field(words: List[str], fields: List[Dict], explained: Set[str]) -> Optional[Dict]:
+    """Field best matching the question words.
+
+    Ranked by words matched, then field tokens the words account for, then
+    fewest unasked-for aggregate tokens, then label-like fields, then schema order.
+    """
+    best, best_score = None, None
+    for field in fields:
+        tokens = _field_tokens(field)
+        hits = {word for word in words if _refers_to(word, tokens)}
+        covered = {token for token in tokens if any(_refers_to(word, {token}) for word in hits)}
+        score = (len(hits), len(covered), -len((tokens - covered) & AGGREGATE_TOKENS), len(tokens & LABEL_TOKENS))
+        if hits and (best_score is None or score > best_score):
+            best, best_score = field, score
+    if best is not None:
+        tokens = _field_tokens(best)
+        explained.update(word for word in words if _refers_to(word, tokens))
+    return best
+
+def extract_entities(question: str, fields: List[Dict], literals: Optional[List[Dict]] = None) -> Optional[Dict]:
+    """Metric, dimension, filters, time grain/range, N and order from the question.
+
+    literals are column values already resolved from the question (see
+    services/value_lookup.py) and become equality filters. Returns None when
+    any content word is left unexplained (an unknown value, a relative range
+    like "bulan lalu", a second dimension...): such questions go to the LLM
+    instead of a template that would silently ignore part of them.
+    """
+    filters: Dict[str, str] = {}
+    literal_words: Set[str] = set()
+    for literal in literals or []:
+        if filters.get(literal["field"], literal["value"]) != literal["value"]:
+            return None
+        if any(other["text"] == literal["text"] and other["field"] != literal["field"] for other in literals):
+            return None  # same mention found in two columns
+        filters[literal["field"]] = literal["value"]
+        literal_words.update(literal["words"])
+    words = [word for word in _words(question) if word not in literal_words]
+    explained: Set[str] = set()
+    by_kind: Dict[str, List[Dict]] = {"metric": [], "dimension": [], "date": []}
+    for field in fields:
+        kind = _kind(field)
+        if kind is not None:
+            by_kind[kind].append(field)
+
+    entities = {"metric": None, "aggregate": None, "dimension": None, "counted": None, "filters": filters,
+                "grain": None, "year": None, "month": None, "window": None, "limit": None, "order": None}
+
+    # Current period: "bulan ini" / "this month" (checked first, "bulan" alone is a grain)
+    window_positions: Set[int] = set()
+    for i, word in enumerate(words):
+        if word not in WINDOW_WORDS:
+            continue
+        if word == "today":
+            span = {i}
+        elif i + 1 < len(words) and words[i + 1] == "ini":
+            span = {i, i + 1}
+        elif i > 0 and words[i - 1] == "this":
+            span = {i - 1, i}
+        else:
+            continue
+        if entities["window"] not in (None, WINDOW_WORDS[word]):
+            return None
+        entities["window"] = WINDOW_WORDS[word]
+        window_positions |= span
+    explained.update(words[i] for i in window_positions)
+
+    # Time range: "2024", "Januari 2024"; grain: "per bulan", "bulanan", but not "bulan Januari"/"tahun 2024"
+    numbers = []
+    for i, word in enumerate(words):
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if i in window_positions:
+            continue
+        if re.fullmatch(r"(19|20)\d{2}", word):
+            if entities["year"] is not None:
+                return None
+            entities["year"] = int(word)
+        elif word.isdigit():
+            numbers.append(int(word))
+        elif word in MONTHS and word not in FILLER_WORDS | {"may"}:
+            entities["month"] = MONTHS[word]
+        elif word in GRAIN_WORDS and following not in MONTHS and not re.fullmatch(r"(19|20)\d{2}", following):
+            if entities["grain"] not in (None, GRAIN_WORDS[word]):
+                return None
+            entities["grain"] = GRAIN_WORDS[word]
+        else:
+            continue
+        explained.add(word)
+    if entities["month"] is not None and entities["year"] is None:
+        return None  # "Januari" of which year?
+    if entities["window"] is not None and entities["year"] is not None:
+        return None
+
+    if TOP_WORDS & set(words):
+        entities["order"] = "desc"
+    if BOTTOM_WORDS & set(words):
+        if entities["order"]:
+            return None
+        entities["order"] = "asc"
+    explained |= (TOP_WORDS | BOTTOM_WORDS) & set(words)
+    if len(numbers) > 1 or (numbers and (not entities["order"] or not 0 < numbers[0] <= 1000)):
+        return None
+    if entities["order"]:
+        entities["limit"] = numbers[0] if numbers else 10
+
+    # Aggregate words never name a field ("total transaksi" is a count, not TOTAL_PRICE)
+    field_words = [word for word in words if word not in SUM_WORDS | COUNT_WORDS]
+    # "jumlah pelanggan": the noun after a count word is what gets counted, not a grouping
+    for i, word in enumerate(words[:-1]):
+        noun = words[i + 2] if words[i + 1] in COUNT_WORDS and i + 2 < len(words) else words[i + 1]
+        if word in COUNT_LEAD_WORDS and not _pick_field([noun], by_kind["metric"], set()):
+            entities["counted"] = _pick_field([noun], by_kind["dimension"], explained)
+            if entities["counted"] is not None:
+                field_words.remove(noun)
+                break
+    entities["metric"] = _pick_field(field_words, by_kind["metric"], explained)
+    entities["dimension"] = _pick_field(field_words, by_kind["dimension"], explained)
+    if entities["dimension"] is not None and entities["dimension"]["name"] in filters:
+        entities["dimension"] = None  # "kota Surabaya": the column word only labels the value
+    mentioned_date = _pick_field(field_words, by_kind["date"], explained)
+    needs_date = entities["grain"] or entities["year"] or entities["window"]
+    if needs_date:
+        dates = by_kind["date"]
+        preferred = [field for field in dates if "date" in _field_tokens(field) or "tanggal" in _field_tokens(field)]
+        candidates = preferred or dates
+        if entities["window"]:
+            # A timestamp column (CREATION_DATE over REQUEST_DATE) lets the window refresh incrementally
+            candidates = sorted(candidates, key=lambda field: field.get("type") == "type/Date")
+        entities["date"] = mentioned_date or (candidates or [None])[0]
+        if entities["date"] is None:
+            return None
+
+    explained |= (SUM_WORDS | AVG_WORDS | COUNT_LEAD_WORDS | COUNT_NOUNS | TREND_WORDS) & set(words)
+    if entities["counted"] is not None:
+        if entities["metric"] is not None or AVG_WORDS & set(words):
+            return None
+        entities["aggregate"] = "COUNT DISTINCT"
+    else:
+        if entities["metric"] is None and entities["order"] and entities["dimension"] is not None \
+                and not COUNT_NOUNS & set(words):
+            entities["metric"] = _pick_field([DEFAULT_MEASURE_WORD], by_kind["metric"], set())
+        if entities["metric"] is None:
+            if AVG_WORDS & set(words):
+                return None  # average of what?
+            entities["aggregate"] = "COUNT"
+        else:
+            entities["aggregate"] = "AVG" if AVG_WORDS & set(words) else "SUM"
+
+    if any(word not in explained and word not in FILLER_WORDS for word in words):
+        return None
+    return entities
+
+def window_start(window: str, today: date) -> date:
+    """First day of the current day/week (Monday)/month/year"""
+    if window == "week":
+        return today - timedelta(days=today.weekday())
+    if window == "month":
+        return today.replace(day=1)
+    if window == "year":
+        return today.replace(month=1, day=1)
+    return today
+
+def _conditions(entities: Dict) -> List[str]:
+    """Filters and fixed time range; the current-period window is added by build_sql"""
+    conditions = [f"{quote_identifier(field)} = {_literal(value)}" for field, value in entities["filters"].items()]
+    if entities["year"] is not None:
+        date_column = quote_identifier(entities["date"]["name"])
+        conditions.append(f"EXTRACT(YEAR FROM {date_column}) = {entities['year']}")
+        if entities["month"] is not None:
+            conditions.append(f"EXTRACT(MONTH FROM {date_column}) = {entities['month']}")
+    return conditions
+
+def _where(conditions: List[str]) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+def _aggregate(entities: Dict):
+    metric = entities["metric"]
+    if entities["aggregate"] == "COUNT":
+        return "COUNT(*)", "jumlah_transaksi"
+    if entities["aggregate"] == "COUNT DISTINCT":
+        counted = entities["counted"]["name"]
+        return f"COUNT(DISTINCT {quote_identifier(counted)})", "jumlah_" + re.sub(r"\W+", "_", counted.lower())
+    prefix = "rata_rata" if entities["aggregate"] == "AVG" else "total"
+    name = re.sub(r"\W+", "_", metric["name"].lower())
+    alias = name if name.startswith(prefix + "_") else f"{prefix}_{name}"
+    return f"{entities['aggregate']}({quote_identifier(metric['name'])})", alias
+
+def build_sql(entities: Dict, table_name: str, today: Optional[date] = None) -> Optional[Dict]:
+    """Pick a template for the extracted entities; {"template", "sql"} or None.
+
+    Sums and counts over the current period also carry an "incremental" spec
+    (see services/incremental.py) so repeats only aggregate the new rows.
+    """
+    conditions = _conditions(entities)
+    window = None
+    if entities["window"] is not None:
+        start = window_start(entities["window"], today or date.today())
+        window = (quote_identifier(entities["date"]["name"]), start)
+        conditions.append(f"{window[0]} >= DATE '{start.isoformat()}'")
+    where = _where(conditions)
+    expression, alias = _aggregate(entities)
+    dimension, grain = entities["dimension"], entities["grain"]
+    incremental = None
+    # Date-only columns cannot tell which rows of the watermark day were already counted
+    if window is not None and grain is None and entities["aggregate"] in ("SUM", "COUNT") \
+            and entities["date"].get("type") != "type/Date":
+        incremental = {
+            "table": table_name, "date": window[0], "start": window[1].isoformat(),
+            "conditions": conditions[:-1], "dimension": quote_identifier(dimension["name"]) if dimension else None,
+            "expression": expression, "alias": alias,
+            "order": (entities["order"] or "desc").upper(), "limit": entities["limit"]
+        }
+
+    if dimension is not None and grain is not None:
+        return None
+    if dimension is not None:
+        column = quote_identifier(dimension["name"])
+        sql = (f"SELECT {column}, {expression} AS {alias} FROM {table_name}{where} "
+               f"GROUP BY {column} ORDER BY {alias} {(entities['order'] or 'desc').upper()}")
+        if entities["limit"]:
+            return {"template": "top_n", "sql": f"{sql} LIMIT {entities['limit']}", "incremental": incremental}
+        return {"template": "breakdown", "sql": sql, "incremental": incremental}
+    if grain is not None:
+        if entities["limit"]:
+            return None
+        date_column = quote_identifier(entities["date"]["name"])
+        periods = {
+            "year": [f"EXTRACT(YEAR FROM {date_column}) AS tahun"],
+            "month": [f"EXTRACT(YEAR FROM {date_column}) AS tahun", f"EXTRACT(MONTH FROM {date_column}) AS bulan"],
+            "day": [f"CAST({date_column} AS DATE) AS tanggal"]
+        }[grain]
+        names = [period.rsplit(" AS ", 1)[1] for period in periods]
+        group = ", ".join(period.rsplit(" AS ", 1)[0] for period in periods)
+        return {
+            "template": "trend",
+            "sql": (f"SELECT {', '.join(periods)}, {expression} AS {alias} FROM {table_name}{where} "
+                    f"GROUP BY {group} ORDER BY {', '.join(names)}")
+        }
+    if entities["limit"]:
+        if entities["metric"] is None:
+            return None
+        return {
+            "template": "top_rows",
+            "sql": (f"SELECT * FROM {table_name}{where} ORDER BY {quote_identifier(entities['metric']['name'])} "
+                    f"{entities['order'].upper()} LIMIT {entities['limit']}")
+        }
+    return {"template": "total", "sql": f"SELECT {expression} AS {alias} FROM {table_name}{where}",
+            "incremental": incremental}
+
+def match_template(question: str, table_info: Dict, literals: Optional[List[Dict]] = None,
+                   today: Optional[date] = None) -> Optional[Dict]:
+    """SQL for a high-frequency question shape against one table's real columns, or None"""
+    entities = extract_entities(question, table_info.get("fields") or [], literals)
+    if entities is None:
+        return None
+    table_name = f"{table_info['schema']}.{table_info['table']}"
+    return build_sql(entities, table_name, today)
@@ -0,0 +1,108 @@
+import re
+import threading
+from typing import Dict, List, Set
+
+from config.settings import VALUE_INDEX_MAX_DISTINCT, VALUE_INDEX_MIN_SCORE, VALUE_INDEX_RETRY_AFTER
+from services.sql_templates import TEXT_TYPES, VOCABULARY
+from utils.cache import get_cache
+from utils.search_index import STOPWORDS, ValueIndex, normalize_value
+
+# Longer phrases are tried first
+MAX_PHRASE_WORDS = 3
+
+_indexes: Dict[tuple, ValueIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_value_index(metabase_client, table_id) -> ValueIndex:
+    """Process-wide value index per Metabase URL, permission scope and table"""
+    key = (metabase_client.base_url, getattr(metabase_client, "cache_scope", None), table_id)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ValueIndex()
+        return _indexes[key]
+
+def _indexable(field: Dict) -> bool:
+    if field.get("id") is None or field.get("type") not in TEXT_TYPES:
+        return False
+    if field.get("has_field_values") not in (None, "list", "auto-list"):
+        return False
+    distinct = field.get("distinct_count")
+    return distinct is None or distinct <= VALUE_INDEX_MAX_DISTINCT
+
+def _field_values(metabase_client, field_id: int) -> Dict:
+    """Field values, or {} when the request failed; a failure is remembered for VALUE_INDEX_RETRY_AFTER
+    seconds (the client does not cache it) so every question does not request it again"""
+    key = ("unavailable", metabase_client.base_url, getattr(metabase_client, "cache_scope", None), field_id)
+    cache = get_cache("field_values")
+    if cache.get(key):
+        return {}
+    entry = metabase_client.get_field_values(field_id)
+    if not entry:
+        cache.set(key, True, ttl=VALUE_INDEX_RETRY_AFTER)
+    return entry
+
+def sync_value_index(metabase_client, table_info: Dict) -> ValueIndex:
+    """Bring the table's index in line with Metabase field values, re-indexing only fields that changed"""
+    index = get_value_index(metabase_client, table_info.get("id"))
+    fields = [field for field in table_info.get("fields") or [] if _indexable(field)]
+    for field in fields:
+        entry = _field_values(metabase_client, field["id"])
+        if entry:
+            index.sync_field(field["name"], entry["values"], entry.get("fetched_at"))
+    for name in set(index.fields()) - {field["name"] for field in fields}:
+        index.remove_field(name)
+    return index
+
+def _is_structural(words: List[str], field_words: Set[str]) -> bool:
+    """Phrases made only of question vocabulary or column names ("per kota", "item type") are not literals"""
+    return all(word in STOPWORDS or word in VOCABULARY or word in field_words or word.isdigit() for word in words)
+
+def resolve_literals(question: str, table_info: Dict, metabase_client) -> List[Dict]:
+    """Column values mentioned in the question, with their exact spelling in the data.
+
+    Returns [{"field", "value", "text", "words", "score"}]; phrases of up to
+    MAX_PHRASE_WORDS words are matched longest first without overlapping.
+    A value found in several columns is returned once per column.
+    """
+    if table_info.get("id") is None:
+        return []
+    index = sync_value_index(metabase_client, table_info)
+    if not len(index):
+        return []
+
+    field_words = {
+        word for field in table_info.get("fields") or []
+        for word in normalize_value(f"{field.get('name')} {field.get('display_name') or ''}").split()
+    }
+    words = re.findall(r"[\w.&/-]+", question)
+    used = [False] * len(words)
+    literals = []
+    for size in range(min(MAX_PHRASE_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            if any(used[start:start + size]):
+                continue
+            text = " ".join(words[start:start + size])
+            normalized = normalize_value(text).split()
+            if not normalized or len("".join(normalized)) < 3:
+                continue
+            # A phrase never starts or ends with a structural word ("di Surabaya" is just "Surabaya")
+            if _is_structural(normalized[:1], field_words) or _is_structural(normalized[-1:], field_words):
+                continue
+            matches = index.lookup(text, min_score=VALUE_INDEX_MIN_SCORE)
+            if not matches:
+                continue
+            best = matches[0][0]
+            for score, field, value in matches:
+                if score == best:
+                    literals.append({"field": field, "value": value, "text": text, "words": normalized,
+                                     "score": round(score, 3)})
+            used[start:start + size] = [True] * size
+    return literals
+
+def format_literals(literals: List[Dict]) -> str:
+    """Prompt lines telling the LLM the exact literal to use for each mention"""
+    if not literals:
+        return "-"
+    return "\n".join(
+        f"- \"{literal['text']}\" -> {literal['field']} = '{literal['value']}'" for literal in literals
+    )
@@ -0,0 +1,158 @@
+import json
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+import pyarrow as pa
+from starlette.testclient import TestClient
+
+from api.app import ARROW_STREAM, APIError, _client_for, app
+from clients.metabase_client import QueryError
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestAPI(unittest.TestCase):
+    """Test cases for the headless HTTP API"""
+
+    def setUp(self):
+        self.client = Mock()
+        self.client.execute_query.return_value = pa.table({"city": ["Bandung", "Medan"], "total": [10, 20]})
+        self.patcher = patch('api.app._client_for', side_effect=self._login)
+        self.patcher.start()
+        self.http = TestClient(app)
+        self.auth = ("admin@example.com", "secret")
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def _login(self, username, password):
+        if password == "WRONG":
+            raise APIError(401, "Tidak dapat login ke Metabase")
+        return self.client
+
+    def test_ask_streams_stage_sql_result_token_and_answer_events(self):
+        def fake_answer(question, client, database_id, history, observer):
+            with observer.stage("sql"):
+                observer.on_sql("SELECT 1", "generated", None)
+            observer.on_result(client.execute_query(database_id, "SELECT 1", as_arrow=True))
+            for token in ("Total ", "naik"):
+                observer.on_token(token)
+            return "Total naik"
+
+        with patch('api.app.answer_question', side_effect=fake_answer):
+            response = self.http.post("/ask", json={"question": "omzet per kota", "database_id": 1}, auth=self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = _events(response.text)
+        self.assertEqual([name for name, _ in events],
+                         ["stage", "sql", "stage", "result", "token", "token", "answer"])
+        self.assertEqual(events[3][1]["row_count"], 2)
+        self.assertEqual(events[3][1]["preview"][0], ["Bandung", 10])
+        self.assertEqual(events[-1][1], {"text": "Total naik"})
+
+    def test_ask_without_stream_returns_json_and_errors_map_to_status(self):
+        with patch('api.app.answer_question', return_value="Halo"):
+            response = self.http.post("/ask", json={"question": "hai", "database_id": 1, "stream": False},
+                                      auth=self.auth)
+        self.assertEqual(response.json()["answer"], "Halo")
+
+        self.assertEqual(self.http.post("/ask", json={"question": "hai", "database_id": 1}).status_code, 401)
+        self.assertEqual(self.http.post("/ask", json={"question": "hai"}, auth=self.auth).status_code, 400)
+
+    def test_execute_returns_json_or_arrow_ipc(self):
+        body = {"database_id": 1, "sql": "SELECT city, total FROM sales"}
+
+        payload = self.http.post("/execute", json=body, auth=self.auth).json()
+        self.assertEqual(payload["rows"], [["Bandung", 10], ["Medan", 20]])
+        self.assertFalse(payload["truncated"])
+
+        response = self.http.post("/execute", json=body, auth=self.auth, headers={"Accept": ARROW_STREAM})
+        table = pa.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column("total").to_pylist(), [10, 20])
+
+    def test_failed_queries_and_bad_max_rows_are_client_errors(self):
+        self.client.execute_query.side_effect = QueryError('Table "SALE" not found')
+        response = self.http.post("/execute", json={"database_id": 1, "sql": "SELECT * FROM sale"}, auth=self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("SALE", response.json()["error"])
+
+        self.client.execute_query.side_effect = None
+        self.client.execute_query.return_value = pa.table({})
+        payload = self.http.post("/execute", json={"database_id": 1, "sql": "SELECT 1"}, auth=self.auth).json()
+        self.assertEqual((payload["columns"], payload["rows"], payload["row_count"]), ([], [], 0))
+
+        for max_rows in (-1, 10 ** 9, "semua"):
+            response = self.http.post("/execute", json={"database_id": 1, "sql": "SELECT 1", "max_rows": max_rows},
+                                      auth=self.auth)
+            self.assertEqual(response.status_code, 400)
+
+    def test_health_is_liveness_only(self):
+        self.assertEqual(self.http.get("/health").json(), {"status": "ok"})
+        self.assertEqual(self.http.get("/status").status_code, 401)
+        self.assertIn("breakers", self.http.get("/status", auth=self.auth).json())
+
+    def test_traces_and_metrics_need_a_valid_login(self):
+        wrong = (self.auth[0], "WRONG")
+        self.assertEqual(self.http.get("/traces", auth=wrong).status_code, 401)
+        self.assertIn("traces", self.http.get("/traces", auth=self.auth).json())
+
+        self.assertEqual(self.http.get("/metrics").status_code, 401)
+        self.assertEqual(self.http.get("/metrics", auth=wrong).status_code, 401)
+        self.assertEqual(self.http.get("/metrics", auth=self.auth).status_code, 200)
+        with patch('api.app.API_METRICS_PUBLIC', True):
+            self.assertEqual(self.http.get("/metrics").status_code, 200)
+
+    def test_usage_needs_a_valid_login(self):
+        self.assertEqual(self.http.get("/usage", auth=(self.auth[0], "WRONG")).status_code, 401)
+        with patch('api.app.usage_summary', return_value=[]) as summary:
+            self.assertEqual(self.http.get("/usage?days=3", auth=self.auth).json(), {"days": 3, "usage": []})
+        summary.assert_called_once_with(["day", "chain"], 3, self.auth[0])
+
+    def test_idle_clients_are_released_to_the_pool(self):
+        pool = Mock()
+        pool._key.side_effect = lambda url, username, password: (url, username)
+        pool.acquire.side_effect = lambda url, username, password: Mock(username=username)
+        self.patcher.stop()
+        try:
+            with patch('api.app.client_pool', pool), patch('api.app._clients', {}), \
+                    patch('api.app.API_CLIENT_IDLE_TTL', -1):
+                first = _client_for("a", "x")
+                _client_for("b", "y")
+        finally:
+            self.patcher.start()
+        pool.release.assert_called_once_with(first)
+
+    def test_jobs_submit_poll_result_and_owner_isolation(self):
+        response = self.http.post("/jobs", json={"database_id": 1, "sql": "SELECT 1"}, auth=self.auth)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+
+        for _ in range(100):
+            status = self.http.get(f"/jobs/{job_id}", auth=self.auth).json()["status"]
+            if status == "done":
+                break
+            time.sleep(0.01)
+        self.assertEqual(status, "done")
+        result = self.http.get(f"/jobs/{job_id}/result", auth=self.auth).json()
+        self.assertEqual(result["row_count"], 2)
+
+        self.assertEqual(self.http.delete(f"/jobs/{job_id}", auth=("other", "pw")).status_code, 404)
+
+        # The owner's name without the owner's password gets nothing
+        wrong = (self.auth[0], "WRONG")
+        self.assertEqual(self.http.get("/jobs", auth=wrong).status_code, 401)
+        self.assertEqual(self.http.get(f"/jobs/{job_id}/result", auth=wrong).status_code, 401)
+        self.assertEqual(self.http.delete(f"/jobs/{job_id}", auth=wrong).status_code, 401)
+        self.assertIn(job_id, [job["id"] for job in self.http.get("/jobs", auth=self.auth).json()])
+
+
+if __name__ == '__main__':
+    unittest.main()
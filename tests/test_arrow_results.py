@@ -0,0 +1,67 @@
+import unittest
+
+import pyarrow as pa
+
+from utils.arrow_results import column_stats, filter_table, sort_table, summarize_table, table_from_result
+
+
+def _result(cols, rows):
+    return {"data": {"cols": cols, "rows": rows}}
+
+
+class TestArrowResults(unittest.TestCase):
+    """Test cases for decoding Metabase results into Arrow tables"""
+
+    def test_columns_typed_from_base_type(self):
+        table = table_from_result(_result(
+            [
+                {"name": "city", "base_type": "type/Text"},
+                {"name": "total", "base_type": "type/Decimal"},
+                {"name": "orders", "base_type": "type/BigInteger"},
+                {"name": "day", "base_type": "type/Date"}
+            ],
+            [["Surabaya", 10.5, 3, "2024-01-01"], ["Jakarta", 20, 5, "2024-01-02"]]
+        ))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.schema.field("city").type, pa.string())
+        self.assertEqual(table.schema.field("total").type, pa.float64())
+        self.assertEqual(table.schema.field("orders").type, pa.int64())
+        self.assertTrue(pa.types.is_timestamp(table.schema.field("day").type))
+
+    def test_mixed_values_fall_back_to_strings(self):
+        table = table_from_result(_result(
+            [{"name": "value", "base_type": "type/Integer"}], [[1], ["n/a"], [None]]
+        ))
+        self.assertEqual(table.column("value").to_pylist(), ["1", "n/a", None])
+
+    def test_duplicate_names_and_empty_rows(self):
+        cols = [{"name": "count"}, {"name": "count"}]
+        table = table_from_result(_result(cols, []))
+        self.assertEqual(table.column_names, ["count", "count_1"])
+        self.assertEqual(table.num_rows, 0)
+
+    def test_summary_matches_prompt_format(self):
+        table = pa.table({"city": ["A", "B", "A"], "total": [1.0, 2.0, 3.0]})
+        summary = summarize_table(table)
+        self.assertIn("- total: Min=1.0, Max=3.0, Avg=2.00", summary)
+        self.assertIn("- city: A(2), B(1)", summary)
+
+    def test_filter_and_sort_on_cached_table(self):
+        table = pa.table({"city": ["Jakarta", "bandung", None, "Bandar"], "total": [5.0, 1.0, 3.0, None]})
+
+        self.assertEqual(filter_table(table, "city", "BAND").column("city").to_pylist(), ["bandung", "Bandar"])
+        self.assertEqual(filter_table(table, "total", ">=3").column("total").to_pylist(), [5.0, 3.0])
+        self.assertEqual(sort_table(table, "total", descending=True).column("total").to_pylist(), [5.0, 3.0, 1.0, None])
+
+    def test_column_stats(self):
+        table = pa.table({"city": ["A", "B", "A", None], "total": [1.0, 2.0, 3.0, 4.0]})
+
+        numeric = column_stats(table, "total")
+        self.assertEqual((numeric["min"], numeric["max"], numeric["quartiles"][1]), (1.0, 4.0, 2.5))
+        text = column_stats(table, "city")
+        self.assertEqual((text["nulls"], text["distinct"], text["top"][0]), (1, 2, ("A", 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+import pyarrow as pa
+
+from services.batch_runner import load_questions, run_batch, summarize
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Test cases for the headless batch question runner"""
+
+    def setUp(self):
+        self.client = Mock()
+        self.client.get_tables.return_value = [{"schema": "mb", "table": "sales", "fields": []}]
+        self.client.execute_query.return_value = pa.table({"total": [10, 20]})
+
+    @patch('services.pipeline.create_llm')
+    @patch('services.pipeline.analyze_result', return_value="Analisis")
+    @patch('services.pipeline.generate_sql_query', return_value="SELECT total FROM mb.sales")
+    @patch('services.pipeline.match_card', return_value=None)
+    @patch('services.pipeline.classify_query_type', return_value="data_query")
+    def test_records_sql_rows_answer_and_timings(self, *_):
+        questions = [{"id": i, "question": f"total penjualan {i}"} for i in range(5)]
+
+        records = list(run_batch(questions, self.client, 1, workers=3))
+
+        self.assertEqual(sorted(record["id"] for record in records), list(range(5)))
+        for record in records:
+            self.assertEqual(record["sql"], "SELECT total FROM mb.sales")
+            self.assertEqual(record["row_count"], 2)
+            self.assertEqual(record["answer"], "Analisis")
+            self.assertIsNone(record["error"])
+            self.assertTrue({"classify", "sql", "execute", "analyze", "total"} <= set(record["timings"]))
+
+    @patch('services.pipeline.classify_query_type', side_effect=RuntimeError("boom"))
+    def test_failures_are_recorded_not_raised(self, _):
+        records = list(run_batch([{"id": 1, "question": "x"}], self.client, 1))
+
+        self.assertEqual(records[0]["error"], "RuntimeError: boom")
+        self.assertEqual(summarize(records, 1.0)["errors"], 1)
+
+    def test_load_questions_txt_and_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            txt = os.path.join(tmpdir, "q.txt")
+            with open(txt, "w", encoding="utf-8") as f:
+                f.write("# nightly\nproduk terlaris?\n\nomzet per kota\n")
+            jsonl = os.path.join(tmpdir, "q.jsonl")
+            with open(jsonl, "w", encoding="utf-8") as f:
+                f.write('{"id": "a1", "question": "produk terlaris?"}\n')
+
+            self.assertEqual([q["question"] for q in load_questions(txt)], ["produk terlaris?", "omzet per kota"])
+            self.assertEqual(load_questions(jsonl), [{"id": "a1", "question": "produk terlaris?"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
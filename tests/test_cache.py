@@ -0,0 +1,168 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.cache import SharedCache, estimate_size
+from utils.cache_backends import CacheBackend, SQLiteCacheBackend, deserialize_value, serialize_value
+from utils.result_store import ResultStore
+
+
+class TestSharedCache(unittest.TestCase):
+    """Test cases for the process-wide shared cache"""
+
+    def test_lru_eviction_by_bytes(self):
+        """Least recently used entries are evicted once max_bytes is exceeded"""
+        frame = pd.DataFrame({"a": range(100)})
+        size = estimate_size(frame)
+        cache = SharedCache("test", max_bytes=int(size * 2.5))
+
+        cache.set("a", frame)
+        cache.set("b", frame.copy())
+        cache.get("a")
+        cache.set("c", frame.copy())
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.bytes_used, cache.max_bytes)
+
+    def test_ttl_expiry(self):
+        """Expired entries count as misses and release their bytes"""
+        cache = SharedCache("test", max_bytes=1024 * 1024, default_ttl=10)
+        with patch('utils.cache.time.time', return_value=1000):
+            cache.set("k", [1, 2, 3])
+        with patch('utils.cache.time.time', return_value=1011):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.bytes_used, 0)
+
+    def test_empty_results_not_cached(self):
+        """Empty frames (the client's error value) are never stored"""
+        cache = SharedCache("test", max_bytes=1024 * 1024)
+        cache.get_or_load("k", pd.DataFrame)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_incomplete_backend_fails_on_construction(self):
+        """A backend missing part of the interface cannot be instantiated"""
+        class GetOnlyBackend(CacheBackend):
+            def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            GetOnlyBackend(1024)
+
+
+class TestSQLiteCacheBackend(unittest.TestCase):
+    """Test cases for the multi-process SQLite backend"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_entries_shared_between_workers(self):
+        """A value written by one worker is visible to another using the same file"""
+        worker_a = SharedCache("query_results", backend=SQLiteCacheBackend(self.path, "query_results", 1024 * 1024))
+        worker_b = SharedCache("query_results", backend=SQLiteCacheBackend(self.path, "query_results", 1024 * 1024))
+        frame = pd.DataFrame({"city": ["Surabaya", "Jakarta"], "total": [10.5, 20.0]})
+
+        worker_a.set(("db", 1, "SELECT 1"), frame)
+        cached = worker_b.get(("db", 1, "SELECT 1"))
+
+        pd.testing.assert_frame_equal(cached, frame)
+        self.assertEqual(worker_b.stats()["hits"], 1)
+
+    def test_namespaces_are_isolated(self):
+        schemas = SQLiteCacheBackend(self.path, "schemas", 1024 * 1024)
+        cards = SQLiteCacheBackend(self.path, "cards", 1024 * 1024)
+        schemas.set("k", [1, 2], None)
+        self.assertIsNone(cards.get("k"))
+
+    def test_size_based_eviction(self):
+        """Least recently used entries go first once serialized bytes exceed max_bytes"""
+        blob = "x" * 4000
+        backend = SQLiteCacheBackend(self.path, "sql", 10000)
+        backend.set("a", blob, None)
+        backend.set("b", blob, None)
+        backend.get("a")
+        evicted = backend.set("c", blob, None)
+
+        self.assertEqual(evicted, 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertIsNotNone(backend.get("a"))
+        self.assertLessEqual(backend.stats()["bytes"], 10000)
+
+    def test_hits_do_not_write(self):
+        """Access times are batched into the next write instead of an UPDATE per hit"""
+        backend = SQLiteCacheBackend(self.path, "sql", 1024 * 1024)
+        backend.set("a", [1], None)
+        conn = backend._connect()
+        changes = conn.total_changes
+
+        for _ in range(10):
+            self.assertEqual(backend.get("a")[0], [1])
+
+        self.assertEqual(conn.total_changes, changes)
+        last_access = lambda: conn.execute("SELECT last_access FROM cache_entries WHERE key = ?",
+                                           (backend._key("a"),)).fetchone()[0]
+        before = last_access()
+        backend.set("b", [2], None)
+        self.assertGreater(last_access(), before)
+
+    def test_dataframes_use_arrow_ipc(self):
+        frame = pd.DataFrame({"a": range(1000), "b": ["x"] * 1000})
+        fmt, blob = serialize_value(frame)
+        self.assertEqual(fmt, "arrow")
+        pd.testing.assert_frame_equal(deserialize_value(fmt, blob), frame)
+
+    def test_mixed_type_columns_fall_back_to_pickle(self):
+        frame = pd.DataFrame({"a": [1, "two", 3.0]})
+        fmt, blob = serialize_value(frame)
+        self.assertEqual(fmt, "pickle")
+        pd.testing.assert_frame_equal(deserialize_value(fmt, blob), frame)
+
+    def test_arrow_tables_round_trip_without_pandas(self):
+        table = pa.table({"a": list(range(1000)), "b": ["x"] * 1000})
+        fmt, blob = serialize_value(table)
+        self.assertEqual(fmt, "arrow_table")
+        restored = deserialize_value(fmt, blob)
+        self.assertIsInstance(restored, pa.Table)
+        self.assertTrue(restored.equals(table))
+
+
+
+class TestResultStore(unittest.TestCase):
+    """Test cases for session and process-wide result memory budgets"""
+
+    def _table(self, rows):
+        return pa.table({"a": list(range(rows))})
+
+    def test_session_budget_evicts_oldest_result(self):
+        size = self._table(100).nbytes
+        store = ResultStore(session_max_bytes=int(size * 2.5), total_max_bytes=10 * size, session_max_results=10)
+        first = store.put("s1", self._table(100), "a")
+        second = store.put("s1", self._table(100), "b")
+        store.put("s1", self._table(100), "c")
+
+        self.assertIsNone(store.get("s1", first))
+        self.assertIsNotNone(store.get("s1", second))
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_total_budget_spans_sessions(self):
+        size = self._table(100).nbytes
+        store = ResultStore(session_max_bytes=10 * size, total_max_bytes=int(size * 1.5), session_max_results=10)
+        other = store.put("s1", self._table(100), "a")
+        mine = store.put("s2", self._table(100), "b")
+
+        self.assertIsNone(store.get("s1", other))
+        self.assertIsNotNone(store.get("s2", mine))
+        self.assertLessEqual(store.stats()["bytes"], int(size * 1.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from services.card_matcher import match_card
+from utils.cache import clear_caches
+
+
+class TestCardMatcher(unittest.TestCase):
+    """Test cases for answering questions from saved Metabase cards"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = Mock()
+        self.client.base_url = "http://matcher.test:3000"
+        self.client.cache_scope = "groups:1"
+        self.client.get_cards.return_value = [
+            {"id": 10, "name": "Penjualan Bulanan per Kota", "description": "Omzet bulanan",
+             "collection": "Sales", "updated_at": "t1"},
+            {"id": 11, "name": "Stok Gudang", "description": "Sisa stok", "collection": "Ops", "updated_at": "t1"}
+        ]
+        self.details = {
+            10: {"id": 10, "name": "Penjualan Bulanan per Kota", "description": "Omzet bulanan",
+                 "database_id": 1, "query": "SELECT CUSTOMER_CITY, SUM(TOTAL_PRICE) FROM t WHERE {{kota}}",
+                 "template_tags": [{"name": "kota", "display-name": "Kota", "type": "text"}]},
+            11: {"id": 11, "name": "Stok Gudang", "description": "Sisa stok", "database_id": 1,
+                 "query": "SELECT * FROM stok", "template_tags": []}
+        }
+        self.client.get_card.side_effect = lambda card_id: self.details[card_id]
+
+    def test_confident_match_with_parameter(self):
+        match = match_card("penjualan bulanan per kota Surabaya", self.client, 1)
+
+        self.assertEqual(match["card"]["id"], 10)
+        self.assertEqual(match["parameters"], [{
+            "type": "category", "target": ["variable", ["template-tag", "kota"]], "value": "Surabaya"
+        }])
+
+    def test_partial_overlap_is_not_confident(self):
+        """Sharing one word with a card name is not enough to skip SQL generation"""
+        self.assertIsNone(match_card("penjualan tertinggi per customer tahun lalu", self.client, 1))
+
+    def test_card_from_other_database_ignored(self):
+        self.details[11]["database_id"] = 2
+        self.assertIsNone(match_card("stok gudang", self.client, 1))
+
+    def test_required_parameter_missing(self):
+        self.details[10]["template_tags"][0]["required"] = True
+        self.assertIsNone(match_card("penjualan bulanan per kota", self.client, 1))
+
+    def test_failed_listing_is_logged_and_not_retried_on_every_question(self):
+        self.client.get_cards.side_effect = ConnectionError("Metabase unreachable")
+
+        with patch('streamlit.error') as shown, self.assertLogs('services.card_matcher', level='WARNING'):
+            self.assertIsNone(match_card("penjualan bulanan per kota Surabaya", self.client, 1))
+        self.assertIsNone(match_card("stok gudang", self.client, 1))
+
+        shown.assert_not_called()
+        self.client.get_cards.assert_called_once_with(report_errors=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+import pyarrow as pa
+
+from utils.charting import PERIOD_COLUMN, build_chart, detect_chart, lttb
+
+
+class TestCharting(unittest.TestCase):
+    """Test cases for auto-charting and LTTB downsampling"""
+
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        x = np.arange(10, dtype=np.float64)
+        y = np.array([0, 0, 5, 0, 0, 0, -5, 0, 0, 0], dtype=np.float64)
+
+        self.assertEqual(lttb(x, y, 4).tolist(), [0, 2, 6, 9])
+        self.assertEqual(lttb(x, y, 20).tolist(), list(range(10)))
+
+    def test_long_time_series_is_downsampled_to_the_budget(self):
+        n = 50000
+        table = pa.table({
+            "tanggal": pa.array(np.arange(n).astype("datetime64[s]")),
+            "total": np.sin(np.arange(n) / 1000.0),
+            "id": np.arange(n)
+        })
+        chart = build_chart(table, max_points=500, max_categories=30)
+
+        self.assertEqual((chart["kind"], chart["x"], chart["y"]), ("line", "tanggal", ["total"]))
+        self.assertEqual(chart["data"].num_rows, 500)
+        self.assertEqual(chart["rows"], n)
+        totals = chart["data"].column("total").to_numpy()
+        self.assertAlmostEqual(totals.max(), 1.0, places=3)
+        self.assertAlmostEqual(totals.min(), -1.0, places=3)
+
+    def test_period_columns_and_group_by_shapes(self):
+        trend = build_chart(pa.table({"tahun": [2024, 2023, 2023], "bulan": [1, 11, 12],
+                                      "total_price": [3.0, 1.0, 2.0]}), 1000, 30)
+        self.assertEqual(trend["x"], PERIOD_COLUMN)
+        self.assertEqual([row[PERIOD_COLUMN].strftime("%Y-%m") for row in trend["data"].to_pylist()],
+                         ["2023-11", "2023-12", "2024-01"])
+
+        bar = build_chart(pa.table({"CUSTOMER_CITY": ["Bandung", "Medan", "Surabaya"], "total": [1, 3, 2]}), 1000, 2)
+        self.assertEqual(bar["kind"], "bar")
+        self.assertEqual(bar["data"].column("CUSTOMER_CITY").to_pylist(), ["Medan", "Surabaya"])
+
+        # Raw rows with several text columns have no obvious chart
+        self.assertIsNone(detect_chart(pa.table({"NAME": ["a", "b"], "CITY": ["x", "y"], "QUANTITY": [1, 2]})))
+
+
+if __name__ == '__main__':
+    unittest.main()
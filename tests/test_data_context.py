@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import Mock
+
+import pyarrow as pa
+
+from clients.metabase_client import QueryError
+from services.data_context import format_profile, get_table_profile, main_table, profile_sql, profile_statements
+from utils.cache import clear_caches
+
+TABLE = {
+    "schema": "mb",
+    "table": "khs_customer_transactions",
+    "fields": [
+        {"name": "ID", "type": "type/Integer"},
+        {"name": "CUSTOMER_CITY", "type": "type/Text", "distinct_count": 3},
+        {"name": "CUSTOMER_NAME", "type": "type/Text", "distinct_count": 90000},
+        {"name": "QUANTITY", "type": "type/Integer"},
+        {"name": "TOTAL_PRICE", "type": "type/Float"},
+        {"name": "REQUEST_DATE", "type": "type/DateTime"}
+    ]
+}
+
+# GROUPING SETS ((), (CUSTOMER_CITY)) output, aliases upper-cased as Oracle returns them
+RESULT = pa.table({
+    "C0": [None, "Bandung", "Medan", "Surabaya"],
+    "G0": [1, 0, 0, 0],
+    "N_ROWS": [10, 6, 3, 1],
+    "S0": [20, 12, 6, 2], "MN0": [1, 1, 1, 2], "MX0": [5, 5, 3, 2], "A0": [2.0, 2.0, 2.0, 2.0],
+    "S1": [1000.0, 700.0, 250.0, 50.0], "MN1": [10.0, 10.0, 50.0, 50.0], "MX1": [300.0, 300.0, 100.0, 50.0],
+    "A1": [100.0, 116.7, 83.3, 50.0],
+    "D0": [3, 1, 1, 1], "D1": [8, 5, 3, 1],
+    "TMN0": ["2024-01-01", "2024-01-01", "2024-02-01", "2024-03-01"],
+    "TMX0": ["2024-06-30", "2024-06-30", "2024-05-01", "2024-03-01"]
+})
+
+
+class TestDataContext(unittest.TestCase):
+    """Test cases for the warehouse-side table profile used by recommendations"""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_profile_is_one_grouping_sets_statement(self):
+        sql = profile_sql(TABLE)
+
+        self.assertTrue(sql.startswith("SELECT CUSTOMER_CITY AS c0, GROUPING(CUSTOMER_CITY) AS g0, COUNT(*) AS n_rows"))
+        self.assertIn("SUM(TOTAL_PRICE) AS s1", sql)
+        self.assertIn("COUNT(DISTINCT CUSTOMER_NAME) AS d1", sql)
+        self.assertTrue(sql.endswith("FROM mb.khs_customer_transactions GROUP BY GROUPING SETS ((), (CUSTOMER_CITY))"))
+        self.assertNotIn("SUM(ID)", sql)
+        # High-cardinality text columns are counted, not grouped
+        self.assertNotIn("(CUSTOMER_NAME)", sql)
+
+    def test_column_names_that_are_not_plain_identifiers_are_quoted(self):
+        table = {"schema": "mb", "table": "Sales 2024", "fields": [
+            {"name": "Total Price", "type": "type/Float"},
+            {"name": "Kota", "type": "type/Text", "distinct_count": 3}
+        ]}
+
+        sql = profile_sql(table)
+        self.assertIn('SUM("Total Price") AS s0', sql)
+        self.assertTrue(sql.endswith('FROM mb."Sales 2024" GROUP BY GROUPING SETS ((), ("Kota"))'))
+        self.assertEqual(profile_statements(table)[1],
+                         'SELECT "Kota" AS c0, COUNT(*) AS n_rows, SUM("Total Price") AS s0 FROM mb."Sales 2024" '
+                         'GROUP BY "Kota"')
+
+    def test_profile_is_parsed_cached_and_formatted(self):
+        client = Mock(base_url="http://mb", cache_scope=None)
+        client.execute_query.return_value = RESULT
+
+        profile = get_table_profile(client, 1, TABLE)
+        get_table_profile(client, 1, TABLE)
+
+        client.execute_query.assert_called_once()
+        self.assertEqual(profile["rows"], 10)
+        self.assertEqual(profile["columns"]["TOTAL_PRICE"]["sum"], 1000.0)
+        self.assertEqual([item["value"] for item in profile["columns"]["CUSTOMER_CITY"]["top"]],
+                         ["Bandung", "Medan", "Surabaya"])
+        text = format_profile(profile)
+        self.assertIn("Tabel mb.khs_customer_transactions: 10 baris", text)
+        self.assertIn("teratas (baris, TOTAL_PRICE): Bandung (6 baris, 700.00)", text)
+
+    def test_per_column_statements_without_grouping_sets(self):
+        totals = RESULT.slice(0, 1).drop_columns(["C0", "G0"])
+        by_city = RESULT.slice(1).select(["C0", "N_ROWS", "S0", "S1"])
+
+        # MySQL has no GROUPING SETS; on other engines a failed statement falls back the same way
+        cases = (("mysql", [totals, by_city]), ("oracle", [QueryError("ORA-00904"), totals, by_city]))
+        for engine, responses in cases:
+            clear_caches()
+            client = Mock(base_url="http://mb", cache_scope=None)
+            client.get_database.return_value = {"id": 1, "engine": engine}
+            client.execute_query.side_effect = responses
+
+            profile = get_table_profile(client, 1, TABLE)
+
+            sqls = [call.args[1] for call in client.execute_query.call_args_list]
+            self.assertNotIn("GROUPING", sqls[-2])
+            self.assertTrue(sqls[-1].endswith("GROUP BY CUSTOMER_CITY"), engine)
+            self.assertEqual(profile["rows"], 10)
+            self.assertEqual(profile["columns"]["CUSTOMER_NAME"]["distinct"], 8)
+            self.assertEqual(profile["columns"]["CUSTOMER_CITY"]["top"][0],
+                             {"value": "Bandung", "rows": 6, "sum": 700.0})
+
+    def test_main_table_prefers_transactions(self):
+        tables = [{"schema": "mb", "table": "items", "fields": [{}]}, TABLE]
+        self.assertIs(main_table(tables), TABLE)
+        self.assertIsNone(main_table([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
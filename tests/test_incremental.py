@@ -0,0 +1,112 @@
+import unittest
+from datetime import date, datetime, timezone
+from unittest.mock import Mock, patch
+
+import pyarrow as pa
+
+from services import incremental
+from services.incremental import execute_query, register, window_sql
+from services.sql_templates import match_template
+from tests.test_sql_templates import REAL_TABLE, TABLE
+from utils.cache import clear_caches
+
+
+class TestIncrementalWindows(unittest.TestCase):
+    """Test cases for watermark-based refresh of current-period aggregates"""
+
+    def setUp(self):
+        clear_caches()
+        self.match = match_template("top 2 kota penjualan minggu ini", TABLE, today=date(2026, 10, 21))
+        self.spec = self.match["incremental"]
+        register(self.match["sql"], self.spec)
+        self.client = Mock(base_url="http://mb", cache_scope=None)
+
+    def test_current_period_templates_carry_a_spec(self):
+        self.assertIn("WHERE REQUEST_DATE >= DATE '2026-10-19' GROUP BY CUSTOMER_CITY", self.match["sql"])
+        self.assertEqual(self.spec["start"], "2026-10-19")
+        self.assertEqual(window_sql(self.spec, datetime(2026, 10, 21, 9, 30)), (
+            "SELECT CUSTOMER_CITY, SUM(TOTAL_PRICE) AS total_price, MAX(REQUEST_DATE) AS hwm "
+            "FROM mb.khs_customer_transactions WHERE REQUEST_DATE >= DATE '2026-10-19' "
+            "AND REQUEST_DATE > TIMESTAMP '2026-10-21 09:30:00' GROUP BY CUSTOMER_CITY"
+        ))
+        # Averages are not additive; trends stay plain templates
+        self.assertIsNone(match_template("rata-rata penjualan bulan ini per kota", TABLE)["incremental"])
+        self.assertIsNone(match_template("penjualan harian bulan ini", TABLE).get("incremental"))
+
+    def test_watermarks_keep_fractional_seconds_in_the_warehouse_time_zone(self):
+        self.assertIn("REQUEST_DATE > TIMESTAMP '2026-10-21 09:30:00.250000'",
+                      window_sql(self.spec, datetime(2026, 10, 21, 9, 30, 0, 250000)))
+
+        # Metabase renders the warehouse's 16:30:00.25 in Jakarta as an offset timestamp, parsed to UTC
+        self.client.get_database.return_value = {"id": 1, "timezone": "Asia/Jakarta"}
+        self.client.execute_query.side_effect = [
+            pa.table({"CUSTOMER_CITY": ["Bandung"], "TOTAL_PRICE": [1.0],
+                      "HWM": pa.array([datetime(2026, 10, 21, 9, 30, 0, 250000)], pa.timestamp("us", tz="UTC"))}),
+            pa.table({"CUSTOMER_CITY": ["Medan"], "TOTAL_PRICE": [2.0],
+                      "HWM": pa.array([None], pa.timestamp("us", tz="UTC"))})
+        ]
+        with patch.object(incremental, "INCREMENTAL_REFRESH_AFTER", 0):
+            execute_query(self.client, 1, self.match["sql"])
+            execute_query(self.client, 1, self.match["sql"])
+        self.assertIn("REQUEST_DATE > TIMESTAMP '2026-10-21 16:30:00.250000'",
+                      self.client.execute_query.call_args_list[1].args[1])
+
+    def test_windows_skip_the_result_cache_and_start_at_the_warehouse_midnight(self):
+        self.client.execute_query.return_value = pa.table({"CUSTOMER_CITY": ["Bandung"], "TOTAL_PRICE": [1.0],
+                                                           "HWM": pa.array([datetime(2026, 10, 21, 9, 30)])})
+        execute_query(self.client, 1, self.match["sql"])
+        self.assertFalse(self.client.execute_query.call_args.kwargs["use_cache"])
+
+        # 20:00 UTC on Sunday is already Monday in Jakarta, the start of a new week there
+        now = datetime(2026, 10, 18, 20, 0, tzinfo=timezone.utc)
+        with patch.object(incremental, "datetime", Mock(now=lambda tz: now.astimezone(tz))), \
+                patch.object(incremental, "INCREMENTAL_TIMEZONE", "Asia/Jakarta"):
+            today = incremental.warehouse_today(self.client, 1)
+        self.assertEqual(today, date(2026, 10, 19))
+        self.assertIn("DATE '2026-10-19'", match_template("total penjualan minggu ini", TABLE, today=today)["sql"])
+
+    def test_failed_window_queries_fall_back_to_the_template_sql(self):
+        template = pa.table({"CUSTOMER_CITY": ["Bandung"], "total_price": [1.0]})
+        self.client.execute_query.side_effect = [pa.table({}), template]
+
+        self.assertEqual(execute_query(self.client, 1, self.match["sql"]), template)
+        self.assertEqual(self.client.execute_query.call_args_list[1].args[1], self.match["sql"])
+
+    def test_windows_use_a_timestamp_column_on_the_real_schema(self):
+        match = match_template("total penjualan bulan ini", REAL_TABLE, today=date(2026, 10, 21))
+        self.assertIn("WHERE CREATION_DATE >= DATE '2026-10-01'", match["sql"])
+        self.assertEqual(match["incremental"]["date"], "CREATION_DATE")
+        # Fixed ranges keep the business date
+        self.assertIn("EXTRACT(YEAR FROM REQUEST_DATE) = 2024", match_template("penjualan 2024", REAL_TABLE)["sql"])
+
+    def test_repeats_only_read_rows_past_the_watermark(self):
+        full = pa.table({"CUSTOMER_CITY": ["Bandung", "Medan", "Surabaya"], "TOTAL_PRICE": [300.0, 200.0, 100.0],
+                         "HWM": pa.array([datetime(2026, 10, 21, 9, 30)] * 3)})
+        delta = pa.table({"CUSTOMER_CITY": ["Surabaya"], "TOTAL_PRICE": [250.0],
+                          "HWM": pa.array([datetime(2026, 10, 21, 11, 0)])})
+        self.client.execute_query.side_effect = [full, delta]
+
+        with patch.object(incremental, "INCREMENTAL_REFRESH_AFTER", 0):
+            first = execute_query(self.client, 1, self.match["sql"])
+            second = execute_query(self.client, 1, self.match["sql"])
+
+        self.assertEqual(first.to_pylist(), [{"CUSTOMER_CITY": "Bandung", "total_price": 300.0},
+                                             {"CUSTOMER_CITY": "Medan", "total_price": 200.0}])
+        # The delta moved Surabaya into the top 2
+        self.assertEqual(second.column("CUSTOMER_CITY").to_pylist(), ["Surabaya", "Bandung"])
+        self.assertEqual(second.column("total_price").to_pylist(), [350.0, 300.0])
+        delta_sql = self.client.execute_query.call_args_list[1].args[1]
+        self.assertIn("REQUEST_DATE > TIMESTAMP '2026-10-21 09:30:00'", delta_sql)
+
+    def test_fresh_entries_are_served_without_a_query(self):
+        self.client.execute_query.return_value = pa.table({
+            "CUSTOMER_CITY": ["Bandung"], "TOTAL_PRICE": [1.0], "HWM": pa.array([datetime(2026, 10, 21)])
+        })
+        execute_query(self.client, 1, self.match["sql"])
+        execute_query(self.client, 1, self.match["sql"])
+
+        self.client.execute_query.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
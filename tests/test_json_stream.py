@@ -0,0 +1,69 @@
+import json
+import unittest
+
+from utils.arrow_results import table_from_result
+from utils.json_stream import DatasetStreamDecoder, decode_stream
+
+
+def _body(rows):
+    cols = [
+        {"name": "id", "base_type": "type/Integer"},
+        {"name": "city", "base_type": "type/Text"},
+        {"name": "day", "base_type": "type/Date"}
+    ]
+    return json.dumps({"data": {"rows": rows, "cols": cols}, "row_count": len(rows)}).encode("utf-8")
+
+
+def _chunks(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class TestDatasetStreamDecoder(unittest.TestCase):
+    """Test cases for incremental decoding of /api/dataset responses"""
+
+    def test_any_chunking_matches_whole_body_decode(self):
+        rows = [[i, "Sürabaya \"],[\"" if i % 2 else None, f"2024-01-{i % 28 + 1:02d}"] for i in range(40)]
+        body = _body(rows)
+        expected = table_from_result(json.loads(body))
+
+        for size in (1, 5, 64, len(body)):
+            decoder = DatasetStreamDecoder(batch_rows=7)
+            for chunk in _chunks(body, size):
+                decoder.feed(chunk)
+            result = decoder.close()
+            table = decoder.table(result["data"]["cols"])
+
+            self.assertEqual(result["data"]["rows"], [])
+            self.assertEqual(result["row_count"], 40)
+            self.assertEqual(table.schema, expected.schema)
+            self.assertEqual(table.to_pylist(), expected.to_pylist())
+
+    def test_payload_without_rows_parsed_as_plain_json(self):
+        decoder = DatasetStreamDecoder()
+        decoder.feed(b'{"status": "failed", "error": "Syntax error"}')
+        self.assertEqual(decoder.close()["error"], "Syntax error")
+
+    def test_cut_off_stream_is_an_error(self):
+        decoder = DatasetStreamDecoder()
+        decoder.feed(_body([[1, "a", "2024-01-01"]] * 10)[:60])
+        with self.assertRaises(ValueError):
+            decoder.close()
+
+    def test_budget_keeps_leading_rows_and_skips_on_to_cols(self):
+        body = _body([[i, "x\"],\"" * 10, "2024-01-01"] for i in range(5000)])
+
+        for size in (3, 1024):
+            decoder, complete = decode_stream(iter(_chunks(body, size)), max_bytes=8192)
+            result = decoder.close()
+            table = decoder.table(result["data"]["cols"])
+
+            self.assertFalse(complete)
+            # Rows past the budget are skipped, not decoded
+            self.assertLess(decoder.rows_decoded, 5000)
+            self.assertEqual(result["row_count"], 5000)
+            self.assertEqual(table.column_names, ["id", "city", "day"])
+            self.assertLess(table.num_rows, 5000)
+            self.assertEqual(table.column("id").to_pylist(), list(range(table.num_rows)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+from services.llm_cache import SharedLLMCache, model_identity
+from utils.cache import SharedCache
+from utils.cache_backends import SQLiteCacheBackend
+
+
+class TestSharedLLMCache(unittest.TestCase):
+    """Test cases for the exact-match LLM response cache"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, "cache.sqlite")
+        self.cache = SharedCache("llm", default_ttl=60, backend=SQLiteCacheBackend(path, "llm", 1024 * 1024))
+        self.patcher = patch('services.llm_cache.get_cache', return_value=self.cache)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+    def _chain(self, responses):
+        prompt = ChatPromptTemplate.from_template("Jawab singkat.\n\nPertanyaan: {question}")
+        llm = FakeListChatModel(responses=responses, cache=SharedLLMCache())
+        return prompt | llm | StrOutputParser(), llm
+
+    def test_identical_prompt_served_from_cache(self):
+        chain, llm = self._chain(["pertama", "kedua"])
+
+        self.assertEqual(chain.invoke({"question": "berapa total?"}), "pertama")
+        self.assertEqual(chain.invoke({"question": "berapa total?"}), "pertama")
+        self.assertEqual(chain.invoke({"question": "berapa rata-rata?"}), "kedua")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_entries_survive_a_restart(self):
+        chain, _ = self._chain(["pertama", "kedua"])
+        chain.invoke({"question": "berapa total?"})
+
+        restarted = SharedCache("llm", default_ttl=60, backend=SQLiteCacheBackend(
+            os.path.join(self.tmpdir.name, "cache.sqlite"), "llm", 1024 * 1024
+        ))
+        with patch('services.llm_cache.get_cache', return_value=restarted):
+            self.assertEqual(chain.invoke({"question": "berapa total?"}), "pertama")
+        self.assertEqual(restarted.stats()["hits"], 1)
+
+    def test_identity_ignores_timeout_but_not_temperature(self):
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            short = ChatOpenAI(model="m", temperature=0.4, timeout=5, max_retries=1)._get_llm_string()
+            long = ChatOpenAI(model="m", temperature=0.4, timeout=60, max_retries=2)._get_llm_string()
+            other = ChatOpenAI(model="m", temperature=0, timeout=5, max_retries=1)._get_llm_string()
+
+        self.assertEqual(model_identity(short), model_identity(long))
+        self.assertNotEqual(model_identity(short), model_identity(other))
+
+
+if __name__ == '__main__':
+    unittest.main()
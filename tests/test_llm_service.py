@@ -172,6 +172,7 @@ class TestMetabaseClient(unittest.TestCase):
                 ]
             }
         }
+        mock_response.iter_content.return_value = [json.dumps(mock_response.json.return_value).encode("utf-8")]
         mock_response.raise_for_status.return_value = None
         mock_post.return_value = mock_response
         
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import (
+    FakeListChatModel, FakeMessagesListChatModel, GenericFakeChatModel
+)
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from services.llm_cache import SharedLLMCache
+from services.llm_factory import invoke_chain, stream_chain
+from services.llm_usage import UsageStore, estimate_cost
+from utils.cache import SharedCache
+from utils.tracing import start_trace
+
+
+class TestLLMUsage(unittest.TestCase):
+    """Test cases for per-chain, per-user and per-day LLM usage accounting"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = UsageStore(os.path.join(self.tmpdir.name, "usage.sqlite"))
+        self.llm_cache = SharedCache("llm", default_ttl=60)
+        self.patchers = [
+            patch('services.llm_usage.get_usage_store', return_value=self.store),
+            patch('services.llm_cache.get_cache', return_value=self.llm_cache)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.prompt = ChatPromptTemplate.from_template("Jawab singkat.\n\nPertanyaan: {question}")
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmpdir.cleanup()
+
+    def test_calls_are_attributed_to_chain_and_user_and_cache_hits_are_free(self):
+        llm = FakeListChatModel(responses=["data_query", "general"], cache=SharedLLMCache())
+        chain = self.prompt | llm | StrOutputParser()
+
+        with start_trace("answer_question", user="analyst"):
+            invoke_chain(chain, {"question": "berapa total penjualan?"}, name="classify")
+            invoke_chain(chain, {"question": "berapa total penjualan?"}, name="classify")
+
+        [row] = self.store.summary(by=("chain", "user"))
+        self.assertEqual((row["chain"], row["user"]), ("classify", "analyst"))
+        self.assertEqual((row["calls"], row["cache_hits"]), (2, 1))
+        # Only the call that reached the model used tokens (approximated, the fake has no usage block)
+        self.assertEqual(row["completion_tokens"], 2)
+        self.assertGreater(row["prompt_tokens"], 0)
+        self.assertIsNone(row["avg_ttft"])
+
+    def test_streams_record_time_to_first_token_and_provider_usage_is_preferred(self):
+        chain = self.prompt | GenericFakeChatModel(messages=iter(["Penjualan naik 10%."])) | StrOutputParser()
+        tokens = []
+        text = stream_chain(chain, {"question": "bagaimana tren?"}, tokens.append, name="analysis")
+
+        message = AIMessage(content="SELECT 1",
+                            usage_metadata={"input_tokens": 120, "output_tokens": 8, "total_tokens": 128})
+        chain = self.prompt | FakeMessagesListChatModel(responses=[message]) | StrOutputParser()
+        invoke_chain(chain, {"question": "total?"}, name="sql")
+
+        self.assertEqual(text, "".join(tokens))
+        rows = {row["chain"]: row for row in self.store.summary(by=("chain",))}
+        self.assertIsNotNone(rows["analysis"]["avg_ttft"])
+        self.assertLessEqual(rows["analysis"]["avg_ttft"], rows["analysis"]["avg_latency"])
+        self.assertEqual((rows["sql"]["prompt_tokens"], rows["sql"]["completion_tokens"]), (120, 8))
+
+    def test_daily_totals_and_cost_estimates(self):
+        with patch.dict('services.llm_usage.LLM_PRICES', {"openai/gpt-4o-mini": [0.15, 0.6]}):
+            cost = estimate_cost("openai/gpt-4o-mini", 1_000_000, 500_000)
+        self.assertAlmostEqual(cost, 0.45)
+        self.assertEqual(estimate_cost("deepseek/deepseek-chat:free", 5000, 500), 0.0)
+        self.assertIsNone(estimate_cost("unknown/model", 5000, 500))
+
+        for user, tokens, cost in (("a", 100, 0.01), ("a", 50, 0.02), ("b", 10, None)):
+            self.store.record({"chain": "sql", "user": user, "model": "m", "prompt_tokens": tokens,
+                               "completion_tokens": 5, "latency": 1.0, "cost": cost})
+
+        by_user = {row["user"]: row for row in self.store.summary(by=("day", "user"))}
+        self.assertEqual(by_user["a"]["calls"], 2)
+        self.assertEqual(by_user["a"]["prompt_tokens"], 150)
+        self.assertAlmostEqual(by_user["a"]["cost"], 0.03)
+        self.assertEqual(by_user["b"]["unpriced_calls"], 1)
+        self.assertEqual([row["user"] for row in self.store.summary(by=("user",), user="b")], ["b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
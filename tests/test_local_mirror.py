@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from clients.metabase_client import MetabaseClient, QueryError
+from services import local_mirror
+from services.local_mirror import LocalMirror, _timestamp_literal, execute_query, referenced_tables
+from utils.arrow_results import is_truncated, mark_truncated
+from utils.cache import clear_caches
+
+TABLE = "mb.khs_customer_transactions"
+
+
+def _rows(dates, cities, totals):
+    return pa.table({
+        "CUSTOMER_CITY": cities,
+        "TOTAL_PRICE": totals,
+        "REQUEST_DATE": pa.array([datetime(2024, 1, day) for day in dates])
+    })
+
+
+class FakeWarehouse:
+    """Answers the mirror's SELECT * ... WHERE REQUEST_DATE >= ... ORDER BY REQUEST_DATE queries"""
+
+    def __init__(self, rows, max_rows=None):
+        self.rows, self.max_rows, self.queries = rows, max_rows, []
+
+    def execute_query(self, database_id, sql, use_cache=True, as_arrow=False, max_rows=None):
+        self.queries.append(sql)
+        rows = self.rows
+        since = re.search(r"TIMESTAMP '([^']+)'", sql)
+        if since:
+            bound = pa.scalar(datetime.fromisoformat(since.group(1)), type=rows.schema.field("REQUEST_DATE").type)
+            rows = rows.filter(pc.greater_equal(rows.column("REQUEST_DATE"), bound))
+        if self.max_rows is not None and rows.num_rows > self.max_rows:
+            return mark_truncated(rows.slice(0, self.max_rows))
+        return rows
+
+
+def _dataset_response(payload, status_code=200):
+    response = Mock(status_code=status_code)
+    response.raise_for_status.return_value = None
+    response.iter_content.return_value = [json.dumps(payload).encode("utf-8")]
+    return response
+
+
+class TestLocalMirror(unittest.TestCase):
+    """Test cases for the local DuckDB mirror"""
+
+    @unittest.skipIf(local_mirror.duckdb is None, "duckdb is not installed")
+    def test_referenced_tables(self):
+        sql = ('SELECT a.x FROM mb.khs_customer_transactions a JOIN "MB"."ITEMS" i ON a.id = i.id '
+               'WHERE a.y IN (SELECT y FROM mb.other)')
+        self.assertEqual(referenced_tables(sql), ["mb.items", TABLE, "mb.other"])
+        self.assertEqual(referenced_tables(f"SELECT * FROM {TABLE}, mb.other"), [TABLE, "mb.other"])
+
+    def test_watermark_literals_keep_fractional_seconds(self):
+        self.assertEqual(_timestamp_literal(datetime(2024, 1, 2, 3, 4, 5, 120000)),
+                         "TIMESTAMP '2024-01-02 03:04:05.120000'")
+        self.assertEqual(_timestamp_literal(datetime(2024, 1, 2)), "TIMESTAMP '2024-01-02 00:00:00'")
+
+    def test_falls_back_to_metabase_when_disabled(self):
+        client = Mock(base_url="http://mb")
+        client.execute_query.return_value = pa.table({"n": [1]})
+
+        with patch.object(local_mirror, "LOCAL_MIRROR_ENABLED", False):
+            result = execute_query(client, 1, f"SELECT COUNT(*) AS n FROM {TABLE}")
+
+        self.assertEqual(result.column("n").to_pylist(), [1])
+        client.execute_query.assert_called_once_with(1, f"SELECT COUNT(*) AS n FROM {TABLE}", use_cache=True, as_arrow=True)
+
+    @unittest.skipIf(local_mirror.duckdb is None, "duckdb is not installed")
+    def test_mirrors_are_not_shared_across_permission_scopes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        alice = Mock(base_url="http://mb", cache_scope="user:alice")
+        bob = Mock(base_url="http://mb", cache_scope="user:bob")
+        with patch.object(local_mirror, "LOCAL_MIRROR_ENABLED", True), patch.object(local_mirror, "_mirrors", {}), \
+                patch.object(local_mirror, "get_cache_dir", return_value=directory):
+            self.assertIsNot(local_mirror.get_mirror(alice, 1), local_mirror.get_mirror(bob, 1))
+            self.assertIs(local_mirror.get_mirror(alice, 1), local_mirror.get_mirror(alice, 1))
+
+    @unittest.skipIf(local_mirror.duckdb is None, "duckdb is not installed")
+    def test_incremental_refresh_and_local_queries(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        mirror = LocalMirror(os.path.join(directory, "mirror.duckdb"), {TABLE: "REQUEST_DATE"})
+        warehouse = FakeWarehouse(_rows([1, 2, 2, 5], ["Bandung", "Medan", "Bandung", "Surabaya"],
+                                        [1.0, 2.0, 3.0, 4.0]), max_rows=3)
+
+        # The first load arrives in two batches; the date the first batch was cut at is re-read
+        self.assertEqual(mirror.refresh_table(warehouse, 1, TABLE), 4)
+        self.assertEqual(len(warehouse.queries), 2)
+
+        sql = f"SELECT CUSTOMER_CITY, SUM(TOTAL_PRICE) AS total FROM {TABLE} GROUP BY CUSTOMER_CITY ORDER BY 1"
+        result = mirror.try_query(sql, {TABLE})
+        self.assertEqual(result.to_pylist()[0], {"CUSTOMER_CITY": "Bandung", "total": 4.0})
+        self.assertIsNone(mirror.try_query(sql, set()))  # user may not see the table
+        self.assertIsNone(mirror.try_query(f"SELECT * FROM {TABLE} WHERE ROWNUM <= 5", {TABLE}))
+
+        # Only a single read-only SELECT runs, and it cannot read server files
+        secret = os.path.join(directory, "secret.env")
+        with open(secret, "w") as f:
+            f.write("OPENROUTER_API_KEY=sk-test")
+        for statement in (f"SELECT * FROM {TABLE}, read_text('{secret}')", f"DELETE FROM {TABLE}",
+                          f"SELECT 1 FROM {TABLE}; DELETE FROM {TABLE}", f"COPY {TABLE} TO '{secret}'"):
+            self.assertIsNone(mirror.try_query(statement, {TABLE}), statement)
+        self.assertEqual(mirror.query(f"SELECT COUNT(*) AS n FROM {TABLE}").to_pylist(), [{"n": 4}])
+
+        # Local results stay within the per-query memory budget, like Metabase results
+        with patch.object(local_mirror, "QUERY_BATCH_ROWS", 1):
+            cut = mirror.query(f"SELECT * FROM {TABLE} ORDER BY REQUEST_DATE", max_bytes=1)
+            whole = mirror.query(f"SELECT * FROM {TABLE} ORDER BY REQUEST_DATE")
+        self.assertTrue(is_truncated(cut))
+        self.assertEqual(cut.num_rows, 1)
+        self.assertEqual(cut.schema, whole.schema)
+        self.assertFalse(is_truncated(whole))
+        self.assertEqual(whole.num_rows, 4)
+
+        # A late update inside the lookback window replaces the local rows
+        warehouse.rows = _rows([1, 2, 2, 5, 6], ["Bandung", "Medan", "Bandung", "Surabaya", "Medan"],
+                               [1.0, 2.0, 3.0, 40.0, 5.0])
+        warehouse.max_rows = None
+        mirror.refresh_table(warehouse, 1, TABLE)
+        self.assertIn("WHERE REQUEST_DATE >= TIMESTAMP '2024-01-02 00:00:00'", warehouse.queries[-1])
+        totals = mirror.query(f"SELECT COUNT(*) AS n, SUM(TOTAL_PRICE) AS total FROM {TABLE}").to_pylist()[0]
+        self.assertEqual(totals, {"n": 5, "total": 51.0})
+
+    @unittest.skipIf(local_mirror.duckdb is None, "duckdb is not installed")
+    @patch('requests.Session.post')
+    def test_rows_cut_by_metabase_are_paged_and_nothing_is_recorded_before_the_last_page(self, mock_post):
+        clear_caches()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        mirror = LocalMirror(os.path.join(directory, "mirror.duckdb"), {TABLE: "REQUEST_DATE"})
+        client = MetabaseClient("http://mirror.test:3000", "analyst", "secret")
+        rows = [[f"2024-01-0{day}T00:00:00", city] for day, city in
+                ((1, "Bandung"), (2, "Medan"), (2, "Bandung"), (3, "Surabaya"), (4, "Medan"))]
+        cols = [{"name": "REQUEST_DATE", "base_type": "type/DateTime"}, {"name": "CUSTOMER_CITY"}]
+        pages = []
+
+        def metabase(url, json=None, **kwargs):
+            # Metabase keeps the first max-results-bare-rows rows and reports the cut in rows_truncated
+            pages.append(json)
+            if fail_after is not None and len(pages) > fail_after:
+                return _dataset_response({"status": "failed", "error": "Query timed out"}, 202)
+            since = re.search(r"TIMESTAMP '([^ ]+) ", json["native"]["query"])
+            matching = [row for row in rows if since is None or row[0][:10] >= since.group(1)]
+            limit = json["constraints"]["max-results-bare-rows"]
+            data = {"rows": matching[:limit], "cols": cols}
+            if len(matching) > limit:
+                data["rows_truncated"] = limit
+            return _dataset_response({"data": data, "row_count": len(data["rows"])})
+
+        mock_post.side_effect = metabase
+        with patch.object(local_mirror, "LOCAL_MIRROR_PAGE_ROWS", 3):
+            fail_after = 1
+            with self.assertRaises(QueryError):
+                mirror.refresh_table(client, 1, TABLE)
+            self.assertEqual(mirror._state(), {})
+
+            fail_after, pages[:] = None, []
+            self.assertEqual(mirror.refresh_table(client, 1, TABLE), 5)
+
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(page["constraints"]["max-results"] == 3 for page in pages))
+        self.assertEqual(mirror._state()[TABLE]["watermark"], datetime(2024, 1, 4))
+        self.assertEqual(mirror.query(f"SELECT COUNT(*) AS n FROM {TABLE}").to_pylist(), [{"n": 5}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,477 @@
+import gc
+import json
+import os
+import unittest
+from unittest.mock import Mock, patch
+import tempfile
+import threading
+import time
+
+from clients.client_pool import ClientPool
+from clients.metabase_client import MetabaseClient, QueryError, metabase_flights, raise_query_errors
+from clients.schema_snapshot import SchemaSnapshotStore
+from utils.arrow_results import is_truncated
+from utils.cache import clear_caches
+from utils.resilience import DeadlineExceeded, deadline_scope
+
+
+def _json_response(payload, status_code=200):
+    response = Mock(status_code=status_code)
+    response.json.return_value = payload
+    response.iter_content.return_value = [json.dumps(payload).encode("utf-8")]
+    response.raise_for_status.return_value = None
+    return response
+
+
+class TestSchemaSnapshot(unittest.TestCase):
+    """Test cases for the on-disk schema snapshot used by get_tables"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.client = MetabaseClient("http://localhost:3000", "test", "test")
+        self.client.schema_store = SchemaSnapshotStore(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _metadata(self):
+        return {
+            "tables": [
+                {"id": 1, "name": "orders", "schema": "mb", "updated_at": "t1",
+                 "fields": [{"name": "ID", "base_type": "type/Integer", "display_name": "ID"}]},
+                {"id": 2, "name": "customers", "schema": "mb", "updated_at": "t1",
+                 "fields": [{"name": "NAME", "base_type": "type/Text", "display_name": "Name"}]}
+            ]
+        }
+
+    @patch('requests.Session.get')
+    def test_cold_start_reads_snapshot(self, mock_get):
+        """Second client for the same server/database must not hit Metabase"""
+        mock_get.return_value = _json_response(self._metadata())
+        tables = self.client.get_tables(1)
+        self.assertEqual([t["table"] for t in tables], ["orders", "customers"])
+
+        clear_caches()  # simulate a process restart
+        other = MetabaseClient("http://localhost:3000", "test", "test")
+        other.schema_store = SchemaSnapshotStore(self.tmpdir.name)
+        mock_get.reset_mock()
+
+        tables = other.get_tables(1)
+
+        mock_get.assert_not_called()
+        self.assertEqual(len(tables), 2)
+        self.assertIn("mb.orders", other.table_schemas)
+
+    @patch('requests.Session.get')
+    def test_incremental_refresh_fetches_only_changed_tables(self, mock_get):
+        """Only tables with a new updated_at are re-fetched"""
+        mock_get.return_value = _json_response(self._metadata())
+        self.client.get_tables(1)
+
+        def side_effect(url, **kwargs):
+            if url.endswith("/api/database/1"):
+                return _json_response({"tables": [
+                    {"id": 1, "name": "orders", "schema": "mb", "updated_at": "t1"},
+                    {"id": 2, "name": "customers", "schema": "mb", "updated_at": "t2"}
+                ]})
+            if url.endswith("/api/table/2/query_metadata"):
+                return _json_response({"id": 2, "name": "customers", "schema": "mb", "fields": [
+                    {"name": "NAME", "base_type": "type/Text", "display_name": "Name"},
+                    {"name": "CITY", "base_type": "type/Text", "display_name": "City"}
+                ]})
+            raise AssertionError(f"unexpected request {url}")
+
+        mock_get.reset_mock()
+        mock_get.side_effect = side_effect
+        tables = self.client.get_tables(1, refresh=True)
+
+        requested = [call.args[0] for call in mock_get.call_args_list]
+        self.assertEqual(len(requested), 2)
+        self.assertNotIn("http://localhost:3000/api/table/1/query_metadata", requested)
+        self.assertEqual(len(tables[1]["fields"]), 2)
+
+    @patch('requests.Session.get')
+    def test_stale_snapshot_used_when_sync_fails(self, mock_get):
+        """A failed incremental sync keeps serving the last snapshot"""
+        mock_get.return_value = _json_response(self._metadata())
+        self.client.get_tables(1)
+
+        self.client.schema_snapshot_ttl = 0  # force a sync on the next call
+
+        mock_get.side_effect = Exception("connection refused")
+        with patch('streamlit.warning'):
+            tables = self.client.get_tables(1)
+
+        self.assertEqual([t["table"] for t in tables], ["orders", "customers"])
+
+
+class TestSharedClients(unittest.TestCase):
+    """Test cases for process-wide client reuse and shared caches"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"CHATORACLE_CACHE_DIR": self.tmpdir.name})
+        self.env.start()
+        self.pool = ClientPool()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_pool_reuses_authenticated_client(self, mock_post, mock_get):
+        """Sessions with the same credentials share one client and one login"""
+        mock_post.return_value = _json_response({"id": "token"})
+        mock_get.return_value = _json_response({"group_ids": [2, 1]})
+
+        first = self.pool.acquire("http://localhost:3000/", "analyst", "secret")
+        second = self.pool.acquire("http://localhost:3000", "analyst", "secret")
+
+        self.assertIs(first, second)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(first.cache_scope, "user:analyst")
+        self.assertEqual(self.pool.stats()[0]["sessions"], 2)
+
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertEqual(self.pool.stats(), [])
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_lease_is_returned_when_the_session_state_goes_away(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "token"})
+        mock_get.return_value = _json_response({"group_ids": [1]})
+        session_state = {"client_lease": self.pool.lease("http://localhost:3000", "analyst", "secret")}
+        reconnect = self.pool.lease("http://localhost:3000", "analyst", "secret")
+        session_state.pop("client_lease").release()
+        session_state["client_lease"] = reconnect
+        self.assertEqual(self.pool.stats()[0]["sessions"], 1)
+
+        del session_state, reconnect  # Streamlit drops a closed session's state
+        gc.collect()
+
+        self.assertEqual(self.pool.stats(), [])
+
+    @patch('clients.metabase_client.METABASE_CACHE_SCOPE', "groups")
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_group_scope_separates_sandbox_attributes(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "token"})
+        mock_get.side_effect = [
+            _json_response({"group_ids": [2, 1]}),
+            _json_response({"group_ids": [1, 2], "login_attributes": {"region": "Jawa Timur"}}),
+            _json_response({"group_ids": [1, 2], "login_attributes": {"region": "Sumatera"}})
+        ]
+
+        scopes = [self.pool.acquire("http://localhost:3000", user, "secret").cache_scope
+                  for user in ("analyst", "east", "west")]
+
+        self.assertEqual(scopes[0], "groups:1,2")
+        self.assertTrue(scopes[1].startswith("groups:1,2|attrs:"))
+        self.assertEqual(len(set(scopes)), 3)
+
+    @patch('requests.Session.post')
+    def test_pool_does_not_share_with_wrong_password(self, mock_post):
+        """A different password gets its own client and must authenticate itself"""
+        mock_post.return_value = _json_response({"id": "token"})
+        with patch('requests.Session.get'):
+            good = self.pool.acquire("http://localhost:3000", "analyst", "secret")
+
+        mock_post.side_effect = Exception("401 Unauthorized")
+        with patch('streamlit.error'):
+            bad = self.pool.acquire("http://localhost:3000", "analyst", "wrong")
+
+        self.assertIsNotNone(good)
+        self.assertIsNone(bad)
+        self.assertEqual(len(self.pool.stats()), 1)
+
+    @patch('requests.Session.post')
+    def test_query_results_shared_between_clients_in_same_scope(self, mock_post):
+        """Identical SQL from another session with the same scope is served from cache"""
+        mock_post.return_value = _json_response({
+            "data": {"cols": [{"name": "total"}], "rows": [[10]]}
+        })
+        first = MetabaseClient("http://localhost:3000", "analyst", "secret")
+        second = MetabaseClient("http://localhost:3000", "analyst", "secret")
+
+        df1 = first.execute_query(1, "SELECT SUM(x) AS total FROM t;")
+        df2 = second.execute_query(1, "SELECT SUM(x)   AS total\nFROM t")
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIs(df1, df2)
+
+    @patch('requests.Session.post')
+    def test_concurrent_identical_queries_share_one_request(self, mock_post):
+        """Identical in-flight queries are coalesced even when caching is bypassed"""
+        def slow_response(*args, **kwargs):
+            time.sleep(0.2)
+            return _json_response({"data": {"cols": [{"name": "total"}], "rows": [[10]]}})
+
+        mock_post.side_effect = slow_response
+        client = MetabaseClient("http://localhost:3000", "analyst", "secret")
+        coalesced_before = metabase_flights.stats()["coalesced"]
+        results = []
+
+        def run():
+            results.append(client.execute_query(1, "SELECT 1", use_cache=False))
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(metabase_flights.stats()["coalesced"] - coalesced_before, 4)
+
+
+class TestSessionTokens(unittest.TestCase):
+    """Test cases for session token reuse and re-authentication"""
+
+    def setUp(self):
+        clear_caches()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"CHATORACLE_CACHE_DIR": self.tmpdir.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def _client(self, password="secret"):
+        return MetabaseClient("http://tokens.test:3000", "analyst", password)
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_stored_token_reused_across_restarts(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "token-1"})
+        mock_get.return_value = _json_response({"group_ids": [1]})
+
+        self.assertTrue(self._client().authenticate())
+        restarted = self._client()
+        self.assertTrue(restarted.authenticate())
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(restarted.session_token, "token-1")
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_stored_token_requires_same_password(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "token-1"})
+        mock_get.return_value = _json_response({"group_ids": [1]})
+        self._client().authenticate()
+
+        mock_post.side_effect = Exception("401 Unauthorized")
+        with patch('streamlit.error'):
+            self.assertFalse(self._client(password="guess").authenticate())
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_401_triggers_one_relogin(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "token-2"})
+        client = self._client()
+        client._use_token("expired-on-server", time.time() + 3 * 24 * 3600)
+
+        databases = [{"id": 1, "name": "DB", "engine": "h2"}]
+        mock_get.side_effect = [
+            _json_response({}, status_code=401),   # /api/database with the dead token
+            _json_response({"group_ids": [1]}),    # /api/user/current after re-login
+            _json_response(databases)              # resend
+        ]
+
+        self.assertEqual(len(client.get_databases()), 1)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(client.session_token, "token-2")
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_concurrent_401s_log_in_once(self, mock_post, mock_get):
+        client = self._client()
+        client._use_token("expired-on-server", time.time() + 3 * 24 * 3600)
+        both_rejected = threading.Barrier(3)
+
+        def login(*args, **kwargs):
+            time.sleep(0.1)
+            return _json_response({"id": "token-2"})
+
+        def get(url, **kwargs):
+            if client.session.headers["X-Metabase-Session"] == "expired-on-server":
+                both_rejected.wait(timeout=5)
+                return _json_response({}, status_code=401)
+            if url.endswith("/api/user/current"):
+                return _json_response({"group_ids": [1]})
+            return _json_response([])
+
+        mock_post.side_effect = login
+        mock_get.side_effect = get
+        statuses = []
+        threads = [threading.Thread(target=lambda: statuses.append(client._request("get", "/api/database").status_code))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('requests.Session.get')
+    @patch('requests.Session.post')
+    def test_token_refreshed_before_expiry(self, mock_post, mock_get):
+        mock_post.return_value = _json_response({"id": "fresh"})
+        mock_get.return_value = _json_response([{"id": 1, "name": "DB", "engine": "h2"}])
+        client = self._client()
+        client._use_token("almost-expired", time.time() + 60)
+
+        client.get_databases()
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(client.session_token, "fresh")
+
+
+class TestListing(unittest.TestCase):
+    """Test cases for paginated, projected card/dashboard listing"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = MetabaseClient("http://listing.test:3000", "test", "test")
+
+    @patch('clients.metabase_client.METABASE_PAGE_SIZE', 2)
+    @patch('requests.Session.get')
+    def test_cards_listed_page_by_page(self, mock_get):
+        pages = [
+            {"total": 3, "data": [
+                {"id": 1, "model": "card", "name": "Penjualan Bulanan", "description": None,
+                 "collection": {"name": "Regional", "effective_ancestors": [{"name": "Sales"}]},
+                 "dataset_query": {"native": {"query": "SELECT ..."}}},
+                {"id": 2, "model": "card", "name": "Top Customer"}
+            ]},
+            {"total": 3, "data": [{"id": 3, "model": "card", "name": "Stok"}]}
+        ]
+        mock_get.side_effect = [_json_response(page) for page in pages]
+
+        cards = self.client.get_cards()
+
+        self.assertEqual([c["id"] for c in cards], [1, 2, 3])
+        self.assertEqual(cards[0]["collection"], "Sales / Regional")
+        self.assertEqual(cards[0]["description"], "No description")
+        self.assertNotIn("dataset_query", cards[0])
+        offsets = [call.kwargs["params"]["offset"] for call in mock_get.call_args_list]
+        self.assertEqual(offsets, [0, 2])
+
+    @patch('clients.metabase_client.METABASE_PAGE_SIZE', 2)
+    @patch('requests.Session.get')
+    def test_pages_without_total_are_read_until_a_short_page(self, mock_get):
+        pages = [
+            {"data": [{"id": 1, "model": "dashboard", "name": "A"}, {"id": 2, "model": "dashboard", "name": "B"}]},
+            {"data": [{"id": 3, "model": "dashboard", "name": "C"}, {"id": 4, "model": "dashboard", "name": "D"}]},
+            {"data": [{"id": 5, "model": "dashboard", "name": "E"}]}
+        ]
+        mock_get.side_effect = [_json_response(page) for page in pages]
+
+        dashboards = self.client.get_dashboards()
+
+        self.assertEqual([d["id"] for d in dashboards], [1, 2, 3, 4, 5])
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch('requests.Session.get')
+    def test_falls_back_to_legacy_listing(self, mock_get):
+        def side_effect(url, **kwargs):
+            if url.endswith("/api/search"):
+                return _json_response([])  # very old Metabase: no paginated search
+            return _json_response({"dashboards": [{"id": 7, "name": "Ops"}]})
+
+        mock_get.side_effect = side_effect
+        dashboards = self.client.get_dashboards()
+
+        self.assertEqual(dashboards, [{
+            "id": 7, "name": "Ops", "description": "No description", "collection": "", "updated_at": None
+        }])
+
+    @patch('requests.Session.post')
+    def test_execute_card_sends_parameters(self, mock_post):
+        mock_post.return_value = _json_response({"data": {"cols": [{"name": "total"}], "rows": [[5]]}})
+        parameters = [{"type": "category", "target": ["variable", ["template-tag", "kota"]], "value": "Surabaya"}]
+
+        df = self.client.execute_card(10, parameters)
+
+        self.assertEqual(df.iloc[0]["total"], 5)
+        self.assertTrue(mock_post.call_args.args[0].endswith("/api/card/10/query"))
+        self.assertEqual(mock_post.call_args.kwargs["json"], {"parameters": parameters})
+
+
+
+class TestResultBudget(unittest.TestCase):
+    """Test cases for the per-query memory budget on /api/dataset"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = MetabaseClient("http://localhost:3000", "analyst", "secret")
+
+    @patch('requests.Session.post')
+    def test_oversized_result_keeps_prefix_without_rerun(self, mock_post):
+        rows = [[i, "x" * 50] for i in range(1000)]
+        full = _json_response({"data": {"rows": rows, "cols": [{"name": "id"}, {"name": "note"}]}})
+        body = json.dumps(full.json.return_value).encode("utf-8")
+        full.iter_content.return_value = [body[i:i + 1024] for i in range(0, len(body), 1024)]
+        mock_post.return_value = full
+
+        table = self.client._run_query(1, "SELECT * FROM big", as_arrow=True, max_bytes=4096)
+
+        self.assertTrue(is_truncated(table))
+        self.assertEqual(table.column_names, ["id", "note"])
+        self.assertLess(table.num_rows, 1000)
+        self.assertEqual(table.column("id").to_pylist(), list(range(table.num_rows)))
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertNotIn("constraints", mock_post.call_args.kwargs["json"])
+
+    @patch('requests.Session.post')
+    def test_trickling_body_stops_at_the_request_deadline(self, mock_post):
+        response = _json_response({})
+
+        def trickle(chunk_size):
+            yield b'{"data": {"rows": ['
+            while not response.close.called:
+                time.sleep(0.01)
+                yield b'[1],'
+
+        response.iter_content.side_effect = trickle
+        mock_post.return_value = response
+
+        started = time.monotonic()
+        with deadline_scope(0.2), raise_query_errors(), self.assertRaises(DeadlineExceeded):
+            self.client._run_query(1, "SELECT * FROM slow", as_arrow=True)
+        self.assertLess(time.monotonic() - started, 2)
+        response.close.assert_called()
+
+    @patch('requests.Session.post')
+    def test_result_within_budget_not_flagged(self, mock_post):
+        mock_post.return_value = _json_response({"data": {"cols": [{"name": "total"}], "rows": [[10]]}})
+        df = self.client.execute_query(1, "SELECT 1")
+        self.assertFalse(is_truncated(df))
+        self.assertNotIn("constraints", mock_post.call_args.kwargs["json"])
+
+    @patch('requests.Session.post')
+    def test_failed_query_raises_only_for_front_ends_that_ask(self, mock_post):
+        # Metabase answers SQL the warehouse rejects with 202 and the error in the body
+        mock_post.return_value = _json_response(
+            {"status": "failed", "error": "Table \"SALE\" not found", "data": {"rows": [], "cols": []}}, 202
+        )
+        with raise_query_errors(), self.assertRaises(QueryError) as raised:
+            self.client.execute_query(1, "SELECT * FROM sale", as_arrow=True)
+        self.assertEqual(raised.exception.status, 400)
+        self.assertIn("SALE", str(raised.exception))
+
+        with patch('clients.metabase_client.st') as mock_st:
+            table = self.client.execute_query(1, "SELECT * FROM sale", as_arrow=True)
+        self.assertEqual(table.num_columns, 0)
+        mock_st.error.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
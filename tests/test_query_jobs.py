@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from clients.metabase_client import MetabaseClient, QueryError
+from services.llm_service import StreamlitObserver
+from services.query_jobs import JobLimitError, QueryJobManager
+from utils.cache import clear_caches
+from utils.resilience import Cancelled, CancelToken, cancel_scope
+from utils.single_flight import SingleFlight
+
+
+def _blocking_response():
+    """A streamed /api/dataset response that sends some rows, then hangs until closed"""
+    closed = threading.Event()
+    response = Mock(status_code=200)
+    response.raise_for_status.return_value = None
+    response.close.side_effect = closed.set
+
+    def iter_content(chunk_size):
+        yield b'{"data": {"rows": [[1], [2], [3]'
+        closed.wait(5)
+        raise ConnectionError("connection closed")
+
+    response.iter_content.side_effect = iter_content
+    return response
+
+
+class TestQueryJobs(unittest.TestCase):
+    """Test cases for cancellable query jobs"""
+
+    def setUp(self):
+        clear_caches()
+        self.jobs = QueryJobManager(max_workers=4, per_user_limit=1, retention=60)
+        self.client = MetabaseClient("http://localhost:3000", "analyst", "secret")
+
+    @patch('requests.Session.post')
+    def test_cancel_closes_the_streaming_response(self, mock_post):
+        response = _blocking_response()
+        mock_post.return_value = response
+        job = self.jobs.submit("analyst", lambda: self.client.execute_query(1, "SELECT slow", as_arrow=True))
+
+        for _ in range(100):
+            if job.rows_read:
+                break
+            time.sleep(0.01)
+        self.assertEqual(job.rows_read, 3)
+        job.cancel()
+
+        self.assertTrue(job.wait(2))
+        self.assertEqual(job.status, "cancelled")
+        response.close.assert_called()
+        with self.assertRaises(Cancelled):
+            job.result()
+
+    def test_per_user_limit(self):
+        release = threading.Event()
+        first = self.jobs.submit("analyst", lambda: release.wait(5))
+
+        with self.assertRaises(JobLimitError):
+            self.jobs.submit("analyst", lambda: 1)
+        other = self.jobs.submit("manager", lambda: 2)
+        self.assertEqual(other.result(), 2)
+
+        release.set()
+        first.result()
+        self.assertEqual(self.jobs.submit("analyst", lambda: 3).result(), 3)
+
+    def test_cancelled_leader_does_not_cancel_coalesced_waiters(self):
+        flights = SingleFlight("test")
+        token = CancelToken()
+        started, results = threading.Event(), []
+
+        def leader_fn():
+            started.set()
+            token.wait(5)
+            token.check()
+
+        def leader():
+            with cancel_scope(token):
+                try:
+                    flights.do("q", leader_fn)
+                except Cancelled:
+                    results.append("cancelled")
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(2)
+        waiter = threading.Thread(target=lambda: results.append(flights.do("q", lambda: "rows")))
+        waiter.start()
+        time.sleep(0.05)
+        token.cancel()
+        thread.join(2)
+        waiter.join(2)
+
+        self.assertEqual(sorted(results), ["cancelled", "rows"])
+
+    @patch('requests.Session.post')
+    def test_failed_query_is_shown_from_the_script_thread(self, mock_post):
+        response = Mock(status_code=202)
+        response.raise_for_status.return_value = None
+        response.iter_content.return_value = [b'{"status": "failed", "error": "Unknown column TOTAL"}']
+        mock_post.return_value = response
+
+        with patch('services.llm_service.query_jobs', self.jobs), patch('services.llm_service.st') as mock_st, \
+                patch('clients.metabase_client.st') as worker_st:
+            with self.assertRaises(QueryError):
+                StreamlitObserver("analyst").run_query(
+                    lambda: self.client.execute_query(1, "SELECT TOTAL FROM sales", as_arrow=True), "SELECT TOTAL"
+                )
+        worker_st.error.assert_not_called()
+        mock_st.error.assert_called_once_with("Unknown column TOTAL")
+
+
+if __name__ == '__main__':
+    unittest.main()
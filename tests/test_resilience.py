@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import requests
+
+from clients.metabase_client import MetabaseClient
+from utils.cache import clear_caches
+from utils.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, RateLimiter, bounded_timeout, deadline_scope, get_breaker,
+    retry_call
+)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the circuit breaker state machine"""
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+        failing = Mock(side_effect=ConnectionError("down"))
+
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                breaker.call(failing)
+
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(failing)
+        self.assertEqual(failing.call_count, 2)
+
+    def test_half_open_probe_closes_on_success(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        with self.assertRaises(ConnectionError):
+            breaker.call(Mock(side_effect=ConnectionError("down")))
+
+        self.assertEqual(breaker.state, "half_open")
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_non_failures_do_not_open(self):
+        breaker = CircuitBreaker("test", failure_threshold=1)
+        with self.assertRaises(ValueError):
+            breaker.call(Mock(side_effect=ValueError("bad sql")), is_failure=lambda e: False)
+        self.assertEqual(breaker.state, "closed")
+
+
+class TestRetryAndDeadline(unittest.TestCase):
+    """Test cases for retries and the request-wide deadline"""
+
+    @patch('utils.resilience.time.sleep')
+    def test_retry_until_success(self, mock_sleep):
+        fn = Mock(side_effect=[ConnectionError("x"), ConnectionError("x"), "ok"])
+        self.assertEqual(retry_call(fn, lambda e: True, max_retries=2), "ok")
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    def test_expired_deadline_blocks_calls(self):
+        with deadline_scope(0):
+            with self.assertRaises(DeadlineExceeded):
+                bounded_timeout(10)
+
+    def test_timeout_clamped_to_deadline(self):
+        with deadline_scope(5):
+            self.assertLessEqual(bounded_timeout(120), 5)
+        self.assertEqual(bounded_timeout(120), 120)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test cases for the token bucket used by the batch runner"""
+
+    @patch('utils.resilience.time.sleep')
+    @patch('utils.resilience.time.monotonic')
+    def test_waits_once_burst_is_spent(self, mock_monotonic, mock_sleep):
+        mock_monotonic.return_value = 100.0
+        limiter = RateLimiter(rate=2, burst=2)
+        limiter.acquire()
+        limiter.acquire()
+        mock_sleep.assert_not_called()
+
+        mock_sleep.side_effect = lambda seconds: setattr(mock_monotonic, "return_value", 100.0 + seconds)
+        limiter.acquire()
+        mock_sleep.assert_called_once_with(0.5)
+
+
+class TestMetabaseRequestPolicy(unittest.TestCase):
+    """Test cases for timeouts and retries on MetabaseClient requests"""
+
+    def setUp(self):
+        clear_caches()
+        self.client = MetabaseClient("http://resilience.test:3000", "test", "test")
+
+    @patch('utils.resilience.time.sleep')
+    @patch('requests.Session.get')
+    def test_idempotent_get_retried_with_timeout(self, mock_get, mock_sleep):
+        response = Mock(status_code=200)
+        response.json.return_value = [{"id": 1, "name": "DB", "engine": "h2"}]
+        mock_get.side_effect = [requests.ReadTimeout("slow"), response]
+
+        databases = self.client.get_databases()
+
+        self.assertEqual(len(databases), 1)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertIsInstance(mock_get.call_args.kwargs["timeout"], tuple)
+
+    @patch('requests.Session.post')
+    def test_query_not_retried_after_read_timeout(self, mock_post):
+        """The warehouse may still be running the query, so it is not re-sent"""
+        mock_post.side_effect = requests.ReadTimeout("slow")
+        with patch('streamlit.error'):
+            df = self.client.execute_query(1, "SELECT 1", use_cache=False)
+        self.assertTrue(df.empty)
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('requests.Session.get')
+    def test_plain_500s_open_the_breaker(self, mock_get):
+        """Non-retryable 5xx responses are returned as before but count as breaker failures"""
+        client = MetabaseClient("http://failing.test:3000", "test", "test")
+        mock_get.return_value = Mock(status_code=500)
+        mock_get.return_value.raise_for_status.side_effect = requests.HTTPError("500 Server Error")
+
+        for _ in range(5):
+            with patch('streamlit.error'):
+                self.assertEqual(client._fetch_databases(), [])
+
+        self.assertEqual(get_breaker("metabase:http://failing.test:3000").state, "open")
+        with self.assertRaises(CircuitOpenError):
+            client._request("get", "/api/database")
+        self.assertEqual(mock_get.call_count, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
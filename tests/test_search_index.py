@@ -0,0 +1,50 @@
+import unittest
+
+from utils.search_index import InvertedIndex
+
+
+class TestInvertedIndex(unittest.TestCase):
+    """Test cases for the local card/dashboard index"""
+
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.cards = [
+            {"id": 1, "name": "Penjualan Bulanan per Kota", "description": "Omzet per kota",
+             "collection": "Sales / Regional", "updated_at": "t1"},
+            {"id": 2, "name": "Stok Sparepart", "description": "Sisa stok gudang",
+             "collection": "Inventory", "updated_at": "t1"},
+            {"id": 3, "name": "Top Customer", "description": "Pelanggan dengan penjualan tertinggi",
+             "collection": "Sales", "updated_at": "t1"}
+        ]
+        self.index.sync("card", self.cards)
+
+    def test_name_match_ranks_first(self):
+        results = self.index.search("card penjualan bulanan", model="card")
+        self.assertEqual(results[0][1]["id"], 1)
+        self.assertIn(3, [doc["id"] for _, doc in results])
+        self.assertNotIn(2, [doc["id"] for _, doc in results])
+
+    def test_prefix_matches_longer_words(self):
+        results = self.index.search("sparep", model="card")
+        self.assertEqual(results[0][1]["id"], 2)
+
+    def test_incremental_sync(self):
+        """Unchanged items are skipped; changed and removed ones are updated"""
+        self.assertEqual(self.index.sync("card", self.cards), 0)
+
+        updated = [dict(self.cards[0], name="Penjualan Harian", updated_at="t2"), self.cards[1]]
+        self.assertEqual(self.index.sync("card", updated), 2)
+
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search("bulanan", model="card"), [])
+        self.assertEqual(self.index.search("harian", model="card")[0][1]["id"], 1)
+
+    def test_models_are_filtered(self):
+        self.index.sync("dashboard", [{"id": 1, "name": "Dashboard Penjualan", "description": ""}])
+        results = self.index.search("penjualan", model="dashboard")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][1]["name"], "Dashboard Penjualan")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from services.query_generator import generate_sql_query
+from services.sql_templates import match_template
+
+TABLE = {
+    "schema": "mb",
+    "table": "khs_customer_transactions",
+    "fields": [
+        {"name": "ID", "type": "type/Integer", "display_name": "ID"},
+        {"name": "CUSTOMER_NAME", "type": "type/Text", "display_name": "Customer Name"},
+        {"name": "CUSTOMER_CITY", "type": "type/Text", "display_name": "Customer City"},
+        {"name": "ITEM_DESCRIPTION", "type": "type/Text", "display_name": "Item Description"},
+        {"name": "QUANTITY", "type": "type/Integer", "display_name": "Quantity"},
+        {"name": "PRICE", "type": "type/Float", "display_name": "Price"},
+        {"name": "TOTAL_PRICE", "type": "type/Float", "display_name": "Total Price"},
+        {"name": "REQUEST_DATE", "type": "type/DateTime", "display_name": "Request Date"}
+    ]
+}
+# mb.khs_customer_transactions as Metabase syncs it (base types of the DATE/TIMESTAMP/DECIMAL columns)
+REAL_TABLE = {
+    "schema": "mb",
+    "table": "khs_customer_transactions",
+    "fields": [
+        {"name": "REQUEST_ID", "type": "type/Text", "display_name": "Request ID"},
+        {"name": "REQUEST_DATE", "type": "type/Date", "display_name": "Request Date"},
+        {"name": "CREATION_DATE", "type": "type/DateTime", "display_name": "Creation Date"},
+        {"name": "CUSTOMER_NAME", "type": "type/Text", "display_name": "Customer Name"},
+        {"name": "CUSTOMER_CITY", "type": "type/Text", "display_name": "Customer City"},
+        {"name": "CUSTOMER_PROVINCE", "type": "type/Text", "display_name": "Customer Province"},
+        {"name": "ITEM_CODE", "type": "type/Text", "display_name": "Item Code"},
+        {"name": "ITEM_DESCRIPTION", "type": "type/Text", "display_name": "Item Description"},
+        {"name": "ITEM_TYPE", "type": "type/Text", "display_name": "Item Type"},
+        {"name": "QUANTITY", "type": "type/Integer", "display_name": "Quantity"},
+        {"name": "PRICE", "type": "type/Decimal", "display_name": "Unit Price"},
+        {"name": "TOTAL_PRICE", "type": "type/Decimal", "display_name": "Total Price"},
+        {"name": "ORG_NAME", "type": "type/Text", "display_name": "Organization"},
+        {"name": "INVOICE_NUMBER", "type": "type/Text", "display_name": "Invoice Number"},
+        {"name": "SO_NUMBER", "type": "type/Text", "display_name": "SO Number"}
+    ]
+}
+
+
+class TestSQLTemplates(unittest.TestCase):
+    """Test cases for the template NL->SQL fast path"""
+
+    def test_top_n_with_year_filter(self):
+        match = match_template("Top 5 produk terlaris tahun 2024", TABLE)
+
+        self.assertEqual(match["template"], "top_n")
+        self.assertEqual(match["sql"], (
+            "SELECT ITEM_DESCRIPTION, SUM(QUANTITY) AS total_quantity FROM mb.khs_customer_transactions "
+            "WHERE EXTRACT(YEAR FROM REQUEST_DATE) = 2024 GROUP BY ITEM_DESCRIPTION "
+            "ORDER BY total_quantity DESC LIMIT 5"
+        ))
+
+    def test_trend_breakdown_and_count(self):
+        trend = match_template("tren penjualan per bulan", TABLE)
+        self.assertEqual(trend["template"], "trend")
+        self.assertIn("SUM(TOTAL_PRICE) AS total_price", trend["sql"])
+        self.assertIn("EXTRACT(MONTH FROM REQUEST_DATE) AS bulan", trend["sql"])
+
+        breakdown = match_template("rata-rata penjualan per kota", TABLE)
+        self.assertEqual(breakdown["template"], "breakdown")
+        self.assertIn("GROUP BY CUSTOMER_CITY", breakdown["sql"])
+        self.assertIn("AVG(TOTAL_PRICE)", breakdown["sql"])
+
+        count = match_template("berapa jumlah transaksi Januari 2024", TABLE)
+        self.assertEqual(count["sql"], (
+            "SELECT COUNT(*) AS jumlah_transaksi FROM mb.khs_customer_transactions "
+            "WHERE EXTRACT(YEAR FROM REQUEST_DATE) = 2024 AND EXTRACT(MONTH FROM REQUEST_DATE) = 1"
+        ))
+
+    def test_unexplained_words_go_to_the_llm(self):
+        for question in ("penjualan di Surabaya", "penjualan 3 bulan terakhir", "produk apa yang paling laku?",
+                         "penjualan per kota per bulan", "total penjualan Januari"):
+            self.assertIsNone(match_template(question, TABLE), question)
+
+    def test_customer_counts_price_and_ranking_on_the_real_schema(self):
+        for question in ("jumlah pelanggan", "berapa pelanggan", "berapa banyak pelanggan"):
+            self.assertEqual(match_template(question, REAL_TABLE)["sql"], (
+                "SELECT COUNT(DISTINCT CUSTOMER_NAME) AS jumlah_customer_name FROM mb.khs_customer_transactions"
+            ), question)
+        per_city = match_template("jumlah pelanggan per kota", REAL_TABLE)
+        self.assertIn("SELECT CUSTOMER_CITY, COUNT(DISTINCT CUSTOMER_NAME)", per_city["sql"])
+        # Distinct counts do not add up across deltas
+        self.assertIsNone(match_template("jumlah pelanggan bulan ini", TABLE)["incremental"])
+
+        price = match_template("rata-rata harga per kota", REAL_TABLE)
+        self.assertIn("SELECT CUSTOMER_CITY, AVG(PRICE) AS rata_rata_price", price["sql"])
+        self.assertIn("SUM(TOTAL_PRICE)", match_template("penjualan per kota", REAL_TABLE)["sql"])
+
+        top = match_template("top 5 pelanggan", REAL_TABLE)
+        self.assertEqual(top["sql"], (
+            "SELECT CUSTOMER_NAME, SUM(TOTAL_PRICE) AS total_price FROM mb.khs_customer_transactions "
+            "GROUP BY CUSTOMER_NAME ORDER BY total_price DESC LIMIT 5"
+        ))
+        self.assertIn("COUNT(*)", match_template("top 5 pelanggan dengan transaksi terbanyak", REAL_TABLE)["sql"])
+
+    @patch('services.query_generator.create_llm')
+    def test_generate_sql_query_skips_llm_for_templates(self, mock_create_llm):
+        sql = generate_sql_query("penjualan per kota", [TABLE], [], Mock(base_url="http://mb", **{"get_database.return_value": {}}), 1)
+
+        self.assertTrue(sql.startswith("SELECT CUSTOMER_CITY, SUM(TOTAL_PRICE)"))
+        mock_create_llm.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import pyarrow as pa
+
+from services.pipeline import answer_question
+from utils.tracing import (
+    latency_summary, metrics_text, recent_traces, reset_tracing, span, start_trace, traced
+)
+
+
+class TestTracing(unittest.TestCase):
+    """Test cases for request timelines and stage latency metrics"""
+
+    def setUp(self):
+        reset_tracing()
+
+    def test_spans_nest_inside_the_request_trace(self):
+        @traced("metabase.get_tables")
+        def get_tables():
+            return []
+
+        with start_trace("answer_question", user="analyst") as trace:
+            with span("schema"):
+                get_tables()
+            with self.assertRaises(ValueError):
+                with span("sql"):
+                    raise ValueError("bad")
+
+        spans = {s["name"]: s for s in trace.to_dict()["spans"]}
+        self.assertEqual(spans["metabase.get_tables"]["parent"], "schema")
+        self.assertIsNone(spans["schema"]["parent"])
+        self.assertEqual(spans["sql"]["error"], "ValueError")
+        self.assertEqual(set(trace.stage_totals()), {"schema", "sql"})
+        self.assertIs(recent_traces()[0], trace)
+        self.assertEqual(latency_summary()["sql"]["errors"], 1)
+
+    def test_metrics_text_is_prometheus_histograms(self):
+        for _ in range(3):
+            with span("execute"):
+                pass
+
+        text = metrics_text()
+        self.assertIn("# TYPE chatoracle_stage_duration_seconds histogram", text)
+        self.assertIn('chatoracle_stage_duration_seconds_bucket{stage="execute",le="+Inf"} 3', text)
+        self.assertIn('chatoracle_stage_duration_seconds_count{stage="execute"} 3', text)
+        self.assertIn('chatoracle_stage_errors_total{stage="execute"} 0', text)
+
+    @patch('services.pipeline.create_llm')
+    @patch('services.pipeline.analyze_result', return_value="Analisis")
+    @patch('services.pipeline.generate_sql_query', return_value="SELECT total FROM mb.sales")
+    @patch('services.pipeline.match_card', return_value=None)
+    @patch('services.pipeline.classify_query_type', return_value="data_query")
+    def test_answer_question_records_a_timeline(self, *_):
+        client = Mock(username="analyst")
+        client.get_tables.return_value = [{"schema": "mb", "table": "sales", "fields": []}]
+        client.execute_query.return_value = pa.table({"total": [10]})
+
+        answer_question("total penjualan", client, 1, [])
+
+        trace = recent_traces()[0]
+        self.assertEqual(trace.attrs["user"], "analyst")
+        self.assertEqual(trace.attrs["query_type"], "data_query")
+        self.assertEqual(list(trace.stage_totals()), ["classify", "card_match", "schema", "sql", "execute", "analyze"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import Mock
+
+from services.sql_templates import match_template
+from services.value_lookup import _indexes, format_literals, resolve_literals
+from utils.cache import clear_caches
+from utils.search_index import ValueIndex
+
+TABLE = {
+    "id": 7,
+    "schema": "mb",
+    "table": "khs_customer_transactions",
+    "fields": [
+        {"id": 1, "name": "ID", "type": "type/Integer", "display_name": "ID"},
+        {"id": 2, "name": "CUSTOMER_CITY", "type": "type/Text", "display_name": "Customer City",
+         "has_field_values": "list", "distinct_count": 3},
+        {"id": 3, "name": "ITEM_TYPE", "type": "type/Text", "display_name": "Item Type",
+         "has_field_values": "list", "distinct_count": 2},
+        {"id": 4, "name": "ITEM_DESCRIPTION", "type": "type/Text", "display_name": "Item Description",
+         "has_field_values": "search", "distinct_count": 90000},
+        {"id": 5, "name": "TOTAL_PRICE", "type": "type/Float", "display_name": "Total Price"},
+        {"id": 6, "name": "REQUEST_DATE", "type": "type/DateTime", "display_name": "Request Date"}
+    ]
+}
+
+VALUES = {
+    2: ["Bandung", "Surabaya", "Jakarta Selatan"],
+    3: ["SPAREPART", "UNIT"]
+}
+
+
+class TestValueIndex(unittest.TestCase):
+    """Test cases for the local column value index"""
+
+    def test_exact_and_fuzzy_lookup(self):
+        index = ValueIndex()
+        index.sync_field("CUSTOMER_CITY", VALUES[2], 1)
+
+        self.assertEqual(index.lookup("jakarta selatan")[0][1:], ("CUSTOMER_CITY", "Jakarta Selatan"))
+        score, _, value = index.lookup("surabya")[0]
+        self.assertEqual(value, "Surabaya")
+        self.assertLess(score, 1.0)
+        self.assertEqual(index.lookup("Medan"), [])
+
+    def test_fields_are_reindexed_only_when_the_version_changes(self):
+        index = ValueIndex()
+        self.assertTrue(index.sync_field("CUSTOMER_CITY", VALUES[2], 1))
+        self.assertFalse(index.sync_field("CUSTOMER_CITY", ["Medan"], 1))
+        self.assertEqual(index.lookup("Medan"), [])
+
+        self.assertTrue(index.sync_field("CUSTOMER_CITY", ["Medan"], 2))
+        self.assertEqual(index.lookup("Medan")[0][2], "Medan")
+        self.assertEqual(index.lookup("Bandung"), [])
+
+
+class TestResolveLiterals(unittest.TestCase):
+    """Test cases for resolving question literals against Metabase field values"""
+
+    def setUp(self):
+        clear_caches()
+        _indexes.clear()
+        self.client = Mock(base_url="http://mb", cache_scope=None)
+        self.client.get_field_values.side_effect = lambda field_id: {"values": VALUES.get(field_id, []),
+                                                                     "fetched_at": 1}
+
+    def test_literals_use_the_exact_spelling_from_the_data(self):
+        literals = resolve_literals("penjualan di surabya per bulan", TABLE, self.client)
+
+        self.assertEqual([(lit["field"], lit["value"]) for lit in literals], [("CUSTOMER_CITY", "Surabaya")])
+        self.assertIn("CUSTOMER_CITY = 'Surabaya'", format_literals(literals))
+        self.assertEqual(resolve_literals("penjualan di Medan", TABLE, self.client), [])
+        # High-cardinality search fields are never fetched
+        self.assertNotIn(4, [call.args[0] for call in self.client.get_field_values.call_args_list])
+
+    def test_literals_become_template_filters(self):
+        question = "total penjualan item type sparepart tahun 2024"
+        match = match_template(question, TABLE, resolve_literals(question, TABLE, self.client))
+
+        self.assertEqual(match["sql"], (
+            "SELECT SUM(TOTAL_PRICE) AS total_price FROM mb.khs_customer_transactions "
+            "WHERE ITEM_TYPE = 'SPAREPART' AND EXTRACT(YEAR FROM REQUEST_DATE) = 2024"
+        ))
+
+    def test_failed_field_values_are_not_requested_on_every_question(self):
+        self.client.get_field_values.side_effect = lambda field_id: {} if field_id == 2 else {
+            "values": VALUES.get(field_id, []), "fetched_at": 1}
+
+        for _ in range(3):
+            self.assertEqual(resolve_literals("penjualan di surabaya", TABLE, self.client), [])
+        requested = [call.args[0] for call in self.client.get_field_values.call_args_list]
+        self.assertEqual(requested.count(2), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
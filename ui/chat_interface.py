@@ -1,11 +1,15 @@
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
 from services.llm_service import get_response
+from ui.result_viewer import render_result
 
 def display_chat_history():
     for message in st.session_state.chat_history:
         if isinstance(message, AIMessage):
             with st.chat_message("assistant"):
+                result_id = message.additional_kwargs.get("result_id")
+                if result_id:
+                    render_result(result_id)
                 st.write(message.content)
         elif isinstance(message, HumanMessage):
             with st.chat_message("user"):
@@ -25,6 +29,7 @@ def handle_chat_input():
                 st.write(user_query)
             
             # Generate and display assistant response
+            st.session_state.pending_result_id = None
             with st.chat_message("assistant"):
                 with st.spinner("Menganalisis pertanyaan..."):
                     response = get_response(
@@ -36,7 +41,10 @@ def handle_chat_input():
                     st.write(response)
             
             # Add assistant response to chat history
-            st.session_state.chat_history.append(AIMessage(content=response))
+            result_id = st.session_state.pending_result_id
+            st.session_state.chat_history.append(
+                AIMessage(content=response, additional_kwargs={"result_id": result_id} if result_id else {})
+            )
     
     else:
         if not st.session_state.metabase_client:
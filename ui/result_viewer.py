@@ -0,0 +1,99 @@
+import json
+import math
+
+import pyarrow as pa
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from config.settings import CHART_MAX_CATEGORIES, CHART_MAX_POINTS, RESULT_PAGE_SIZE
+from utils.arrow_results import column_stats, filter_table, is_truncated, sort_table
+from utils.charting import build_chart
+from utils.result_store import result_store
+
+PAGE_SIZES = [50, 100, 200, 500]
+NO_SORT = "(tanpa urutan)"
+NO_STATS = "(pilih kolom)"
+
+def _session_id() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def register_result(table: pa.Table, title: str) -> str:
+    """Keep a result for this session (no copy, same Arrow buffers as the cache) and return its id"""
+    result_id = result_store.put(_session_id(), table, title)
+    st.session_state.pending_result_id = result_id
+    return result_id
+
+def _view(result_id: str, entry: dict, spec: tuple) -> pa.Table:
+    """Filtered/sorted table, recomputed only when the filter or sort changes"""
+    if entry["view"] is None or entry["view"][0] != spec:
+        filter_column, expression, sort_column, descending = spec
+        table = filter_table(entry["table"], filter_column, expression)
+        if sort_column != NO_SORT:
+            table = sort_table(table, sort_column, descending)
+        entry["view"] = (spec, table)
+        result_store.account(_session_id(), result_id)
+    return entry["view"][1]
+
+def _render_chart(entry: dict):
+    """Line/bar chart for time, numeric and GROUP BY results; the browser gets at most CHART_MAX_POINTS per series"""
+    if "chart" not in entry:
+        entry["chart"] = build_chart(entry["table"], CHART_MAX_POINTS, CHART_MAX_CATEGORIES)
+    chart = entry["chart"]
+    if chart is None:
+        return
+    frame = chart["data"].to_pandas()
+    if chart["kind"] == "line":
+        st.line_chart(frame, x=chart["x"], y=chart["y"])
+    else:
+        st.bar_chart(frame, x=chart["x"], y=chart["y"], sort=False)
+    if chart["data"].num_rows < chart["rows"]:
+        st.caption(f"Grafik menampilkan {chart['data'].num_rows:,} dari {chart['rows']:,} baris.")
+
+def render_result(result_id: str):
+    """Paginated viewer: only the visible page is sent to the browser"""
+    entry = result_store.get(_session_id(), result_id)
+    if entry is None:
+        st.caption("📊 Hasil query ini sudah tidak disimpan. Ajukan pertanyaan lagi untuk melihatnya.")
+        return
+
+    table = entry["table"]
+    columns = table.column_names
+    st.subheader(entry["title"])
+    if is_truncated(table):
+        st.warning(f"⚠️ Hasil dipotong menjadi {table.num_rows:,} baris karena melebihi batas memori per query.")
+
+    _render_chart(entry)
+
+    col_filter, col_expr, col_sort, col_desc = st.columns([2, 3, 2, 1])
+    filter_column = col_filter.selectbox("Filter kolom", columns, key=f"{result_id}_filter_col")
+    expression = col_expr.text_input("Nilai (teks, atau >100 / <=5 untuk angka)", key=f"{result_id}_filter")
+    sort_column = col_sort.selectbox("Urutkan", [NO_SORT] + columns, key=f"{result_id}_sort")
+    descending = col_desc.checkbox("Desc", key=f"{result_id}_desc")
+
+    view = _view(result_id, entry, (filter_column, expression, sort_column, descending))
+
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+    page_size = col_size.selectbox(
+        "Baris/halaman", PAGE_SIZES,
+        index=PAGE_SIZES.index(RESULT_PAGE_SIZE) if RESULT_PAGE_SIZE in PAGE_SIZES else 1,
+        key=f"{result_id}_page_size"
+    )
+    page_count = max(1, math.ceil(view.num_rows / page_size))
+    if st.session_state.get(f"{result_id}_page", 1) > page_count:
+        st.session_state[f"{result_id}_page"] = page_count  # filter shrank the result
+    page = col_page.number_input("Halaman", min_value=1, max_value=page_count, value=1, step=1, key=f"{result_id}_page")
+    offset = (min(page, page_count) - 1) * page_size
+    col_info.caption(
+        f"Baris {offset + 1 if view.num_rows else 0}–{min(offset + page_size, view.num_rows)} "
+        f"dari {view.num_rows:,} (total {table.num_rows:,})"
+    )
+
+    st.dataframe(view.slice(offset, page_size), use_container_width=True)
+
+    # Column statistics are computed only for the column the user asks for
+    stats_column = st.selectbox("📈 Statistik kolom", [NO_STATS] + columns, key=f"{result_id}_stats")
+    if stats_column != NO_STATS:
+        if stats_column not in entry["stats"]:
+            entry["stats"][stats_column] = column_stats(table, stats_column)
+        st.json(json.dumps(entry["stats"][stats_column], default=str), expanded=True)
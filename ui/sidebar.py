@@ -1,5 +1,13 @@
 import streamlit as st
-from clients.metabase_client import MetabaseClient
+from clients.client_pool import client_pool
+from config.settings import ADMIN_PANEL_ENABLED, TRACE_SLOW_SECONDS
+from clients.metabase_client import metabase_flights
+from services.llm_usage import usage_summary
+from services.local_mirror import mirror_stats
+from services.query_jobs import query_jobs
+from utils.cache import cache_stats
+from utils.result_store import result_store
+from utils.tracing import latency_summary, metrics_text, slow_traces
 
 def render_sidebar():
     with st.sidebar:
@@ -11,9 +19,14 @@ def render_sidebar():
         if st.button("Connect to Metabase"):
             with st.spinner("Menghubungkan ke Metabase..."):
                 try:
-                    client = MetabaseClient(metabase_url, metabase_username, metabase_password)
-                    if client.authenticate():
-                        st.session_state.metabase_client = client
+                    lease = client_pool.lease(metabase_url, metabase_username, metabase_password)
+                    if lease:
+                        # The session holds one reference; it goes back to the pool on reconnect or session end
+                        previous = st.session_state.get("client_lease")
+                        st.session_state.client_lease = lease
+                        if previous is not None:
+                            previous.release()
+                        st.session_state.metabase_client = lease.client
                         st.session_state.table_structure_analyzed = False
                         st.success("✅ Terhubung ke Metabase!")
                     else:
@@ -53,7 +66,12 @@ def render_additional_features():
     if st.sidebar.button("🔄 Refresh Connection"):
         if st.session_state.metabase_client:
             try:
-                st.session_state.metabase_client.authenticate()
+                st.session_state.metabase_client.authenticate(force=True)
+                if st.session_state.selected_database_id:
+                    # Incremental schema sync: only changed tables are re-fetched
+                    st.session_state.metabase_client.get_tables(
+                        st.session_state.selected_database_id, refresh=True
+                    )
                 st.sidebar.success("✅ Koneksi diperbarui!")
             except Exception as e:
                 st.sidebar.error(f"❌ Gagal refresh: {e}")
@@ -91,6 +109,77 @@ def render_status_info():
                 st.sidebar.markdown(f"**Jumlah Tabel:** {len(tables)}")
             except:
                 pass
+        
+        with st.sidebar.expander("📦 Cache Bersama"):
+            for name, stats in cache_stats().items():
+                st.caption(
+                    f"{name}: {stats['entries']} entri, {stats['bytes'] / 1024 / 1024:.1f} MB, "
+                    f"hit {stats['hits']} / miss {stats['misses']}"
+                )
+            st.caption(f"Sesi aktif per klien: {sum(c['sessions'] for c in client_pool.stats())}")
+            flights = metabase_flights.stats()
+            st.caption(f"Request digabung (single-flight): {flights['coalesced']} dari {flights['executed'] + flights['coalesced']}")
+            results = result_store.stats()
+            st.caption(
+                f"Hasil query di sesi: {results['results']} hasil dari {results['sessions']} sesi, "
+                f"{results['bytes'] / 1024 / 1024:.1f} MB (dibuang: {results['evictions']})"
+            )
+            jobs = query_jobs.stats()
+            st.caption(
+                f"Query job: {jobs['running']} berjalan, {jobs['queued']} antre, "
+                f"{jobs['cancelled']} dibatalkan, {jobs['failed']} gagal"
+            )
+            for mirror in mirror_stats():
+                tables = ", ".join(
+                    f"{name} ({table['row_count']:,} baris, {table['age'] // 60} menit lalu)"
+                    for name, table in mirror["tables"].items()
+                )
+                st.caption(
+                    f"Mirror lokal DB {mirror['database_id']}: {mirror['local']} query lokal, "
+                    f"{mirror['fallback']} ke Metabase; {tables or 'belum ada tabel'}"
+                )
     else:
         st.sidebar.markdown("---")
         st.sidebar.markdown("**Status Koneksi:** 🔴 Belum terhubung")
+
+def render_admin_panel():
+    """Slow requests with their per-stage timeline, and stage latency percentiles (ADMIN_PANEL_ENABLED)"""
+    if not ADMIN_PANEL_ENABLED:
+        return
+    with st.sidebar.expander("⏱️ Admin: Latensi"):
+        traces = slow_traces(limit=10)
+        st.caption(f"Request lebih dari {TRACE_SLOW_SECONDS:g} detik: {len(traces)}")
+        for trace in traces:
+            stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in trace.stage_totals().items())
+            st.markdown(f"**{trace.duration:.1f}s** · {trace.attrs.get('query_type') or '-'} · "
+                        f"{str(trace.attrs.get('question', ''))[:60]}")
+            st.caption(stages or "-")
+
+        summary = latency_summary()
+        if summary:
+            st.dataframe(
+                [{"tahap": name, "n": stats["count"], "error": stats["errors"],
+                  "rata2 (s)": round(stats["avg"], 3) if stats["avg"] is not None else None,
+                  "p95 ≤ (s)": stats["p95"]}
+                 for name, stats in summary.items()],
+                use_container_width=True, hide_index=True
+            )
+        st.download_button("⬇️ Metrics (Prometheus)", metrics_text(), file_name="metrics.txt", mime="text/plain")
+
+    with st.sidebar.expander("🪙 Admin: Pemakaian LLM (7 hari)"):
+        usage = usage_summary(by=("chain", "model"))
+        if not usage:
+            st.caption("Belum ada pemanggilan LLM tercatat.")
+        else:
+            st.dataframe(
+                [{"chain": row["chain"], "model": row["model"], "n": row["calls"], "cache": row["cache_hits"],
+                  "token in": row["prompt_tokens"], "token out": row["completion_tokens"],
+                  "rata2 (s)": round(row["avg_latency"], 2),
+                  "TTFT (s)": round(row["avg_ttft"], 2) if row["avg_ttft"] is not None else None,
+                  "biaya ($)": round(row["cost"], 4)}
+                 for row in usage],
+                use_container_width=True, hide_index=True
+            )
+            users = usage_summary(by=("user",))
+            st.caption(" · ".join(f"{row['user'] or '-'}: {row['prompt_tokens'] + row['completion_tokens']:,} token"
+                                  for row in users[:10]))
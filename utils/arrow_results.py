@@ -0,0 +1,185 @@
+import re
+from operator import itemgetter
+from typing import Dict, List, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Metabase base_type -> Arrow type; anything else is inferred by Arrow
+ARROW_TYPES = {
+    "type/Integer": pa.int64(),
+    "type/BigInteger": pa.int64(),
+    "type/Float": pa.float64(),
+    "type/Decimal": pa.float64(),
+    "type/Boolean": pa.bool_(),
+    "type/Text": pa.string(),
+    "type/UUID": pa.string()
+}
+TEMPORAL_TYPES = {"type/Date", "type/DateTime", "type/DateTimeWithTZ", "type/DateTimeWithLocalTZ", "type/Instant"}
+
+_OFFSET = re.compile(r"(Z|[+-]\d{2}:?\d{2})$")
+
+def _parse_temporal(values: pa.Array) -> pa.Array:
+    """ISO strings -> timestamps (UTC when an offset is present); unparseable values stay strings"""
+    sample = next((v for v in values.drop_null().slice(0, 1).to_pylist()), "")
+    # Pick the target from the first value; a failed cast costs as much as a successful one
+    target = pa.timestamp("us", tz="UTC") if _OFFSET.search(sample) else pa.timestamp("us")
+    try:
+        return pc.cast(values, target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return values
+
+def column_array(values: Sequence, base_type: str = None) -> pa.Array:
+    """Build one typed Arrow column from JSON values, falling back to strings on mixed types"""
+    try:
+        if base_type in TEMPORAL_TYPES:
+            return _parse_temporal(pa.array(values, type=pa.string()))
+        target = ARROW_TYPES.get(base_type)
+        return pa.array(values, type=target) if target is not None else pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def _stringify(chunk: pa.Array) -> pa.Array:
+    try:
+        return chunk.cast(pa.string())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in chunk.to_pylist()], type=pa.string())
+
+def combine_chunks(chunks: List[pa.Array], base_type: str = None) -> pa.ChunkedArray:
+    """Merge batch arrays (types inferred per batch) into one column, typed like column_array"""
+    types = {chunk.type for chunk in chunks if not pa.types.is_null(chunk.type)}
+    if base_type in TEMPORAL_TYPES:
+        target = pa.string()
+    elif base_type in ARROW_TYPES:
+        target = ARROW_TYPES[base_type]
+    elif len(types) <= 1:
+        target = next(iter(types), pa.null())
+    elif all(is_numeric(t) for t in types):
+        target = pa.float64()
+    else:
+        target = pa.string()
+    try:
+        column = pa.chunked_array([chunk.cast(target) for chunk in chunks], type=target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        column = pa.chunked_array([_stringify(chunk) for chunk in chunks], type=pa.string())
+    if base_type in TEMPORAL_TYPES:
+        column = _parse_temporal(column)
+    return column
+
+def unique_names(cols: List[Dict]) -> List[str]:
+    names, seen = [], {}
+    for col in cols:
+        name = col.get("name") or "column"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def table_from_result(result: Dict) -> pa.Table:
+    """Decode a Metabase {"data": {"cols", "rows"}} result straight into an Arrow Table"""
+    cols = result["data"]["cols"]
+    rows = result["data"]["rows"]
+    # One itemgetter pass per column; zip(*rows) builds a huge tuple per column and is ~5x slower
+    arrays = [column_array(list(map(itemgetter(i), rows)), col.get("base_type")) for i, col in enumerate(cols)]
+    return pa.Table.from_arrays(arrays, names=unique_names(cols))
+
+def empty_table() -> pa.Table:
+    return pa.table({})
+
+def is_numeric(data_type: pa.DataType) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type)
+
+def summarize_table(table: pa.Table, max_categorical: int = 3) -> str:
+    """Numeric min/max/avg and top categories, computed in Arrow without converting to pandas"""
+    summary = ""
+    numeric = [name for name, field in zip(table.column_names, table.schema) if is_numeric(field.type)]
+    if numeric:
+        summary += "Statistik Numerik:\n"
+        for name in numeric:
+            column = table.column(name)
+            min_max = pc.min_max(column)
+            mean = pc.mean(column).as_py()
+            mean_text = f"{mean:.2f}" if mean is not None else "-"
+            summary += f"- {name}: Min={min_max['min'].as_py()}, Max={min_max['max'].as_py()}, Avg={mean_text}\n"
+
+    categorical = [
+        name for name, field in zip(table.column_names, table.schema)
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+    ][:max_categorical]
+    if categorical:
+        summary += "\nTop Values per Kategori:\n"
+        for name in categorical:
+            counts = pc.value_counts(table.column(name).drop_null())
+            order = pc.sort_indices(counts.field("counts"), sort_keys=[("", "descending")])
+            top = pc.take(counts, order[:3]).to_pylist()
+            top_text = ", ".join(f"{item['values']}({item['counts']})" for item in top)
+            summary += f"- {name}: {top_text}\n"
+    return summary
+
+_COMPARISON = re.compile(r"^\s*(>=|<=|!=|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*$")
+_COMPARE_FUNCS = {
+    ">=": pc.greater_equal, "<=": pc.less_equal, "!=": pc.not_equal,
+    ">": pc.greater, "<": pc.less, "=": pc.equal
+}
+
+def filter_table(table: pa.Table, column: str, expression: str) -> pa.Table:
+    """Rows where column matches expression: ">100"/"<=5"/"=3" on numeric columns, otherwise a case-insensitive substring"""
+    expression = (expression or "").strip()
+    if not expression or column not in table.column_names:
+        return table
+    values = table.column(column)
+    comparison = _COMPARISON.match(expression)
+    if comparison and is_numeric(values.type):
+        op, number = comparison.groups()
+        mask = _COMPARE_FUNCS[op](values, pa.scalar(float(number)))
+    else:
+        mask = pc.match_substring(pc.cast(values, pa.string()), expression, ignore_case=True)
+    return table.filter(pc.fill_null(mask, False))
+
+def sort_table(table: pa.Table, column: str, descending: bool = False) -> pa.Table:
+    if column not in table.column_names:
+        return table
+    order = pc.sort_indices(table, sort_keys=[(column, "descending" if descending else "ascending")])
+    return table.take(order)
+
+def column_stats(table: pa.Table, column: str) -> Dict:
+    """Count/nulls/distinct plus range and quartiles (numeric) or top values (everything else)"""
+    values = table.column(column)
+    stats = {
+        "count": len(values) - values.null_count,
+        "nulls": values.null_count,
+        "distinct": pc.count_distinct(values).as_py()
+    }
+    if is_numeric(values.type):
+        min_max = pc.min_max(values)
+        stats.update({
+            "min": min_max["min"].as_py(),
+            "max": min_max["max"].as_py(),
+            "mean": pc.mean(values).as_py(),
+            "stddev": pc.stddev(values).as_py(),
+            "quartiles": pc.quantile(values, q=[0.25, 0.5, 0.75]).to_pylist()
+        })
+    elif pa.types.is_temporal(values.type):
+        min_max = pc.min_max(values)
+        stats.update({"min": min_max["min"].as_py(), "max": min_max["max"].as_py()})
+    else:
+        counts = pc.value_counts(values.drop_null())
+        order = pc.sort_indices(counts.field("counts"), sort_keys=[("", "descending")])
+        stats["top"] = [(item["values"], item["counts"]) for item in pc.take(counts, order[:5]).to_pylist()]
+    return stats
+
+TRUNCATED_KEY = b"chatoracle.truncated"
+
+def mark_truncated(table: pa.Table) -> pa.Table:
+    """Flag a table cut short by the memory budget (kept in schema metadata, survives the IPC cache)"""
+    metadata = dict(table.schema.metadata or {})
+    metadata[TRUNCATED_KEY] = b"true"
+    return table.replace_schema_metadata(metadata)
+
+def is_truncated(frame) -> bool:
+    if isinstance(frame, pa.Table):
+        return (frame.schema.metadata or {}).get(TRUNCATED_KEY) == b"true"
+    return bool(getattr(frame, "attrs", {}).get("truncated"))
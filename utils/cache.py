@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from config.settings import (
+    DATA_CONTEXT_TTL, INCREMENTAL_TTL, LLM_CACHE_MAX_MB, LLM_CACHE_TTL, VALUE_INDEX_TTL, get_cache_dir
+)
+from utils.cache_backends import CacheBackend, MemoryCacheBackend, SQLiteCacheBackend, estimate_size
+
+def is_cacheable(value: Any) -> bool:
+    """Empty lists/frames are what the client returns on errors, so they are never cached"""
+    if isinstance(value, pd.DataFrame):
+        return not value.empty
+    if isinstance(value, pa.Table):
+        return value.num_rows > 0
+    return bool(value)
+
+class SharedCache:
+    """Process-wide cache with TTL and hit/miss accounting over a pluggable backend.
+
+    Values are shared between Streamlit sessions (and, with the SQLite backend,
+    between worker processes) and must be treated as read-only.
+    """
+
+    def __init__(self, name: str, max_bytes: int = 16 * 1024 * 1024, default_ttl: Optional[float] = None,
+                 backend: Optional[CacheBackend] = None):
+        self.name = name
+        self.default_ttl = default_ttl
+        self.backend = backend or MemoryCacheBackend(max_bytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self.backend.max_bytes
+
+    @property
+    def bytes_used(self) -> int:
+        return self.backend.stats()["bytes"]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.backend.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.time():
+            self.backend.delete(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        evicted = self.backend.set(key, value, expires_at)
+        with self._lock:
+            self.evictions += evicted
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Return cached value or call loader; empty results (errors) are not stored"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        value = loader()
+        if is_cacheable(value):
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: Hashable):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"name": self.name, "backend": type(self.backend).__name__}
+        stats.update(self.backend.stats())
+        with self._lock:
+            stats.update({"hits": self.hits, "misses": self.misses, "evictions": self.evictions})
+        return stats
+
+_MB = 1024 * 1024
+
+# name -> (max bytes, default TTL in seconds)
+CACHE_DEFAULTS = {
+    "databases": (8 * _MB, 600),
+    "schemas": (32 * _MB, 600),
+    "dashboards": (16 * _MB, 600),
+    "cards": (32 * _MB, 600),
+    "sql": (8 * _MB, int(os.getenv("SQL_CACHE_TTL", "86400"))),
+    "query_results": (int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * _MB,
+                      int(os.getenv("RESULT_CACHE_TTL", "300"))),
+    "llm": (LLM_CACHE_MAX_MB * _MB, LLM_CACHE_TTL),
+    "field_values": (32 * _MB, VALUE_INDEX_TTL),
+    "data_context": (8 * _MB, DATA_CONTEXT_TTL),
+    "incremental": (16 * _MB, INCREMENTAL_TTL)
+}
+
+# Kept on disk whatever CACHE_BACKEND says, so they survive restarts
+PERSISTENT_CACHES = {"llm"}
+
+# "memory" (per process) or "sqlite" (shared by all workers on the host)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+
+_caches: Dict[str, SharedCache] = {}
+_caches_lock = threading.Lock()
+
+def create_backend(name: str, max_bytes: int) -> CacheBackend:
+    """Build the configured backend for one named cache"""
+    if CACHE_BACKEND == "sqlite" or name in PERSISTENT_CACHES:
+        path = os.getenv("CACHE_SQLITE_PATH") or os.path.join(get_cache_dir(), "shared_cache.sqlite")
+        return SQLiteCacheBackend(path, name, max_bytes)
+    return MemoryCacheBackend(max_bytes)
+
+def get_cache(name: str) -> SharedCache:
+    """Return the process-wide cache with the given name (created on first use)"""
+    with _caches_lock:
+        if name not in _caches:
+            max_bytes, ttl = CACHE_DEFAULTS.get(name, (16 * _MB, 600))
+            _caches[name] = SharedCache(name, default_ttl=ttl, backend=create_backend(name, max_bytes))
+        return _caches[name]
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Memory accounting for every shared cache"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+def clear_caches():
+    """Drop every shared cache entry (used by the admin button and tests)"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
@@ -0,0 +1,292 @@
+import hashlib
+import io
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pyarrow ships with streamlit
+    pa = None
+
+def estimate_size(value: Any) -> int:
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if pa is not None and isinstance(value, pa.Table):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class CacheBackend(ABC):
+    """Storage interface behind SharedCache.
+
+    Implementations store (value, expires_at) per key, enforce max_bytes by
+    evicting least recently used entries and report entries/bytes in stats().
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[Tuple[Any, Optional[float]]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float]) -> int:
+        """Store value; return the number of entries evicted to make room"""
+
+    @abstractmethod
+    def delete(self, key: Hashable):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU storage; sizes are estimated from the live objects"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(max_bytes)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.RLock()
+        self.bytes_used = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[2]
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float]) -> int:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return 0  # never let a single value flush the whole cache
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        return evicted
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self.bytes_used -= size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes_used, "max_bytes": self.max_bytes}
+
+def _arrow_ipc(table: "pa.Table") -> bytes:
+    sink = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def serialize_value(value: Any) -> Tuple[str, bytes]:
+    """Encode a cache value; tables/DataFrames use compressed Arrow IPC, everything else pickle"""
+    if pa is not None and isinstance(value, pa.Table):
+        return "arrow_table", _arrow_ipc(value)
+    if isinstance(value, pd.DataFrame) and pa is not None:
+        try:
+            return "arrow", _arrow_ipc(pa.Table.from_pandas(value, preserve_index=False))
+        except (pa.ArrowException, ValueError, TypeError):
+            pass  # mixed-type object columns, fall back to pickle
+    return "pickle", pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def deserialize_value(fmt: str, blob: bytes) -> Any:
+    if fmt in ("arrow", "arrow_table"):
+        with pa.ipc.open_stream(pa.BufferReader(blob)) as reader:
+            table = reader.read_all()
+        return table if fmt == "arrow_table" else table.to_pandas()
+    return pickle.loads(blob)
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite-backed storage shared safely by several worker processes on one host.
+
+    Each named cache is a namespace in the same database file. WAL mode lets
+    readers proceed while one worker writes; sizes are the serialized bytes.
+    The file is trusted local state (values may be pickled).
+    
+    Hits are read-only: access times are collected in memory and written in
+    one statement batch on the next set(), or once TOUCH_BATCH hits or
+    TOUCH_INTERVAL seconds have accumulated, so reads never queue on the
+    write lock. LRU order across workers is therefore approximate.
+    """
+
+    TOUCH_BATCH = 256
+    TOUCH_INTERVAL = 30.0
+
+    def __init__(self, path: str, namespace: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        self._touched: Dict[str, float] = {}  # hashed key -> last hit time, not yet written
+        self._touch_lock = threading.Lock()
+        self._touches_flushed_at = time.time()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, last_access)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, Optional[float]]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT format, value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, self._key(key))
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch(self._key(key))
+        try:
+            return deserialize_value(row[0], row[1]), row[2]
+        except Exception:
+            self.delete(key)  # written by an incompatible version
+            return None
+
+    def _touch(self, hashed_key: str):
+        now = time.time()
+        with self._touch_lock:
+            self._touched[hashed_key] = now
+            due = len(self._touched) >= self.TOUCH_BATCH or now - self._touches_flushed_at >= self.TOUCH_INTERVAL
+        if due:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touches(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _flush_touches(self, conn: sqlite3.Connection):
+        """Write the pending access times (inside the caller's transaction)"""
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._touches_flushed_at = time.time()
+        if touched:
+            conn.executemany(
+                "UPDATE cache_entries SET last_access = MAX(last_access, ?) WHERE namespace = ? AND key = ?",
+                [(accessed, self.namespace, hashed_key) for hashed_key, accessed in touched.items()]
+            )
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float]) -> int:
+        fmt, blob = serialize_value(value)
+        if len(blob) > self.max_bytes:
+            return 0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._flush_touches(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, format, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, self._key(key), fmt, blob, len(blob), expires_at, time.time())
+            )
+            evicted = self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        evicted = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, time.time())
+        ).rowcount
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY last_access",
+            (self.namespace,)
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def delete(self, key: Hashable):
+        self._connect().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, self._key(key))
+        )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def stats(self) -> Dict[str, int]:
+        entries, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,)
+        ).fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
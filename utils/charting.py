@@ -0,0 +1,140 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.arrow_results import is_numeric
+from utils.helpers import is_id_column
+
+# Integer period columns (e.g. from the trend template: EXTRACT(YEAR ...) AS tahun, EXTRACT(MONTH ...) AS bulan)
+YEAR_COLUMNS = {"tahun", "year"}
+MONTH_COLUMNS = {"bulan", "month"}
+PERIOD_COLUMN = "periode"
+MAX_SERIES = 5
+
+def _is_text(data_type: pa.DataType) -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling (x ascending).
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previous pick and the
+    next bucket's average, so peaks and dips survive.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # threshold - 2 buckets over points 1..n-2; integer bounds so the last one ends exactly at n - 1
+    bounds = 1 + (np.arange(threshold - 1) * (n - 2)) // (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_end = bounds[i + 2] if i + 2 < len(bounds) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+def _period_column(table: pa.Table) -> Optional[pa.Array]:
+    """Year (and month) integer columns combined into one timestamp column"""
+    names = {name.lower(): name for name in table.column_names}
+    year = next((names[name] for name in YEAR_COLUMNS if name in names), None)
+    if year is None or not is_numeric(table.schema.field(year).type):
+        return None
+    years = table.column(year).to_numpy(zero_copy_only=False).astype(np.float64)
+    if np.isnan(years).any():
+        return None
+    month = next((names[name] for name in MONTH_COLUMNS if name in names), None)
+    if month is not None and is_numeric(table.schema.field(month).type):
+        months = table.column(month).to_numpy(zero_copy_only=False).astype(np.float64)
+        if np.isnan(months).any():
+            return None
+        periods = ((years - 1970) * 12 + months - 1).astype(np.int64).astype("datetime64[M]")
+    else:
+        periods = (years - 1970).astype(np.int64).astype("datetime64[Y]")
+    return pa.array(periods.astype("datetime64[ms]"))
+
+def detect_chart(table: pa.Table) -> Optional[Dict]:
+    """{"kind": "line" | "bar", "x", "y"} for result shapes that chart well, or None.
+
+    - a temporal column (or tahun/bulan period columns) with numeric measures -> line
+    - numeric columns only, the first one ascending -> line
+    - one text column with numeric measures (GROUP BY shape) -> bar
+    """
+    if table.num_rows < 2:
+        return None
+    schema = table.schema
+    period = None
+    if _period_column(table) is not None:
+        period = {name for name in table.column_names if name.lower() in YEAR_COLUMNS | MONTH_COLUMNS}
+    numeric = [field.name for field in schema if is_numeric(field.type) and not is_id_column(field.name)
+               and (period is None or field.name not in period)]
+    temporal = [field.name for field in schema if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)]
+    text = [field.name for field in schema if _is_text(field.type)]
+    others = [field.name for field in schema if field.name not in numeric and not is_id_column(field.name)
+              and (period is None or field.name not in period)]
+
+    if period is not None and numeric and not others:
+        return {"kind": "line", "x": PERIOD_COLUMN, "y": numeric[:MAX_SERIES]}
+    if len(temporal) == 1 and numeric and others == temporal:
+        return {"kind": "line", "x": temporal[0], "y": numeric[:MAX_SERIES]}
+    if not others and len(numeric) >= 2:
+        x = table.column(numeric[0])
+        if x.null_count == 0 and pc.all(pc.greater_equal(x.slice(1), x.slice(0, len(x) - 1))).as_py():
+            return {"kind": "line", "x": numeric[0], "y": numeric[1:MAX_SERIES + 1]}
+    if len(text) == 1 and numeric and others == text:
+        return {"kind": "bar", "x": text[0], "y": numeric[:MAX_SERIES]}
+    return None
+
+def _as_float(values: pa.ChunkedArray) -> np.ndarray:
+    if pa.types.is_timestamp(values.type):
+        values = pc.cast(values, pa.int64())
+    elif pa.types.is_date(values.type):
+        values = pc.cast(pc.cast(values, pa.date32()), pa.int32())
+    return values.to_numpy().astype(np.float64)
+
+def chart_data(table: pa.Table, spec: Dict, max_points: int, max_categories: int) -> pa.Table:
+    """Only the columns and rows the chart needs: lines downsampled with LTTB, bars cut to the top categories"""
+    if spec["x"] == PERIOD_COLUMN and PERIOD_COLUMN not in table.column_names:
+        table = table.append_column(PERIOD_COLUMN, _period_column(table))
+    data = table.select([spec["x"]] + spec["y"])
+    data = data.filter(pc.is_valid(data.column(spec["x"])))
+
+    if spec["kind"] == "bar":
+        order = pc.sort_indices(data, sort_keys=[(spec["y"][0], "descending")])
+        return data.take(order[:max_categories])
+
+    order = pc.sort_indices(data, sort_keys=[(spec["x"], "ascending")])
+    data = data.take(order)
+    if data.num_rows <= max_points:
+        return data
+    x = _as_float(data.column(spec["x"]))
+    keep = np.unique(np.concatenate([
+        lttb(x, np.nan_to_num(_as_float(data.column(name))), max_points) for name in spec["y"]
+    ]))
+    return data.take(pa.array(keep))
+
+def build_chart(table: pa.Table, max_points: int, max_categories: int) -> Optional[Dict]:
+    """Chart spec plus its (small) data for a result table, or None when the shape does not chart"""
+    spec = detect_chart(table)
+    if spec is None:
+        return None
+    return dict(spec, data=chart_data(table, spec, max_points, max_categories), rows=table.num_rows)
+
+def chart_payload(chart: Optional[Dict]) -> Optional[Dict]:
+    """JSON form of build_chart output for API clients"""
+    if chart is None:
+        return None
+    data = chart["data"]
+    return {
+        "kind": chart["kind"],
+        "x": chart["x"],
+        "y": chart["y"],
+        "rows": chart["rows"],
+        "points": [list(row.values()) for row in data.to_pylist()]
+    }
@@ -1,5 +1,15 @@
 import os
-from typing import Dict, List, Optional, Any
+import re
+from typing import Callable, Dict, List, Optional, Any
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Reserved on common warehouses yet found as column names; they only work quoted
+_RESERVED_WORDS = {
+    "all", "and", "as", "asc", "between", "by", "case", "check", "column", "comment", "date", "default", "desc",
+    "distinct", "end", "from", "group", "having", "in", "index", "is", "key", "level", "like", "limit", "not",
+    "null", "number", "offset", "or", "order", "range", "row", "rows", "select", "size", "table", "to", "union",
+    "user", "values", "when", "where", "window"
+}
 
 def load_environment_variables() -> Dict[str, str]:
     """Load and validate environment variables"""
@@ -45,8 +55,9 @@ def safe_get_nested_value(data: Dict, keys: List[str], default: Any = None) -> A
             return default
     return current
 
-def parse_api_response(data: Any, expected_structure: str = "list") -> List[Dict]:
-    """Parse API response with different possible structures"""
+def parse_api_response(data: Any, expected_structure: str = "list",
+                       project: Optional[Callable[[Dict], Dict]] = None) -> List[Dict]:
+    """Parse API response with different possible structures, optionally projecting each item"""
     results = []
     
     if expected_structure == "list" and isinstance(data, list):
@@ -77,8 +88,33 @@ def parse_api_response(data: Any, expected_structure: str = "list") -> List[Dict
                         if isinstance(item, dict) and item.get("id") is not None:
                             results.append(item)
     
+    if project is not None:
+        results = [project(item) for item in results]
     return results
 
+def collection_path(item: Dict) -> str:
+    """Human readable collection path ("Sales / Regional") of a Metabase item"""
+    collection = item.get("collection")
+    if not isinstance(collection, dict):
+        return ""
+    names = [
+        ancestor.get("name") for ancestor in collection.get("effective_ancestors") or []
+        if isinstance(ancestor, dict) and ancestor.get("name")
+    ]
+    if collection.get("name"):
+        names.append(collection["name"])
+    return " / ".join(names)
+
+def project_listing_item(item: Dict, label: str) -> Dict:
+    """Keep only the fields the chatbot uses from a card/dashboard listing item"""
+    return {
+        "id": item.get("id"),
+        "name": item.get("name") or f"{label} {item.get('id')}",
+        "description": item.get("description") or "No description",
+        "collection": collection_path(item),
+        "updated_at": item.get("updated_at")
+    }
+
 def generate_fallback_query(question: str) -> str:
     """Generate fallback SQL query based on question content"""
     question_lower = question.lower()
@@ -98,4 +134,19 @@ def generate_fallback_query(question: str) -> str:
         return "SELECT ITEM_DESCRIPTION, COUNT(*) as sold_count, SUM(QUANTITY) as total_quantity, SUM(TOTAL_PRICE) as total_revenue FROM mb.khs_customer_transactions GROUP BY ITEM_DESCRIPTION ORDER BY total_revenue DESC LIMIT 15"
     
     else:
-        return "SELECT * FROM mb.khs_customer_transactions ORDER BY REQUEST_DATE DESC LIMIT 10"
\ No newline at end of file
+        return "SELECT * FROM mb.khs_customer_transactions ORDER BY REQUEST_DATE DESC LIMIT 10"
+
+def is_id_column(name: str) -> bool:
+    """Key columns ("id", "customer_id"): numeric, but not a measure or a useful category"""
+    lowered = name.lower()
+    return lowered == "id" or lowered.endswith("_id")
+
+def quote_identifier(name: str) -> str:
+    """A column/table name as SQL: plain identifiers as they are; names with other characters, mixed case
+    (unquoted names are folded to one case) or reserved words double-quoted, keeping their exact spelling"""
+    plain = _IDENTIFIER.match(name) and name.lower() not in _RESERVED_WORDS and name in (name.upper(), name.lower())
+    return name if plain else '"' + name.replace('"', '""') + '"'
+
+def normalize_sql(sql_query: str) -> str:
+    """Normalize SQL text for use as a cache key (whitespace, trailing semicolon)"""
+    return " ".join(clean_sql_query(sql_query).split()).rstrip(";").strip()
@@ -0,0 +1,183 @@
+import codecs
+import json
+import re
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+
+from utils.arrow_results import combine_chunks, unique_names
+
+ROWS_KEY = re.compile(r'"rows"\s*:\s*\[')
+# The rows array closing before the next key: rows hold only scalars, and a '"' inside a string is escaped
+ROWS_END = re.compile(r'\]\s*,\s*"')
+SKIP_OVERLAP = 256  # text kept between chunks while skipping, so ROWS_END can straddle two chunks
+BATCH_ROWS = 16384
+PENDING_VALUE_BYTES = 48  # rough size of one decoded JSON scalar as a Python object
+_WHITESPACE = " \t\r\n,"
+
+class DatasetStreamDecoder:
+    """Incremental decoder for Metabase dataset responses ({"data": {"rows": [...], "cols": [...]}}).
+
+    Chunks are fed as they arrive from the socket. Rows are decoded one at a
+    time with the C JSON scanner and packed into per-column Arrow arrays
+    every BATCH_ROWS rows, so neither the raw body nor the full Python object
+    tree is held in memory. Everything outside the rows array ("cols",
+    "native_form", ...) is kept as text and parsed at the end with rows = [].
+    After stop_keeping() the remaining rows are not decoded: the text is only
+    scanned for the end of the rows array.
+    """
+
+    def __init__(self, batch_rows: int = BATCH_ROWS):
+        self.batch_rows = batch_rows
+        self.row_count = 0
+        self.bytes_read = 0
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._state = "head"  # head -> rows -> tail
+        self._text = ""
+        self._skeleton: List[str] = []
+        self._rows: List[list] = []
+        self._chunks: List[List[pa.Array]] = []  # per column, list of batch arrays
+        self._arrow_bytes = 0
+        self.keeping = True
+        self.rows_dropped = 0
+
+    @property
+    def rows_decoded(self) -> int:
+        return self.row_count + len(self._rows) + self.rows_dropped
+
+    def stop_keeping(self):
+        """Keep the rows decoded so far; later rows are only counted"""
+        self._pack()
+        self.keeping = False
+
+    @property
+    def arrow_bytes(self) -> int:
+        """Memory held by decoded rows: packed batches plus an estimate for the pending batch"""
+        pending = len(self._rows) * len(self._rows[0]) * PENDING_VALUE_BYTES if self._rows else 0
+        return self._arrow_bytes + pending
+
+    def feed(self, chunk: bytes):
+        self.bytes_read += len(chunk)
+        self._text += self._utf8.decode(chunk)
+        if self._state == "head":
+            match = ROWS_KEY.search(self._text)
+            if match is None:
+                return
+            self._skeleton.append(self._text[:match.start()] + '"rows":[]')
+            self._text = self._text[match.end():]
+            self._state = "rows"
+        if self._state == "rows":
+            if self.keeping:
+                self._decode_rows()
+            else:
+                self._skip_rows()
+        if self._state == "tail":
+            self._skeleton.append(self._text)
+            self._text = ""
+
+    def _decode_rows(self):
+        text, pos, end = self._text, 0, len(self._text)
+        while pos < end and text[pos] in _WHITESPACE:
+            pos += 1
+        # Fast path: every complete row up to the last "]" in one C-level parse. A cut inside a
+        # string or a nested array leaves the JSON unbalanced, so it can only fail, never misparse.
+        cut = text.rfind("]", pos)
+        if cut > pos:
+            try:
+                rows = json.loads(f"[{text[pos:cut + 1]}]")
+            except json.JSONDecodeError:
+                rows = None
+            if rows is not None and all(isinstance(row, list) for row in rows):
+                self._add_rows(rows)
+                pos = cut + 1
+        while True:
+            while pos < end and text[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= end:
+                break
+            if text[pos] == "]":
+                self._state = "tail"
+                pos += 1
+                break
+            try:
+                row, pos = self._json.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break  # row continues in the next chunk
+            self._add_rows([row])
+        self._text = text[pos:]
+
+    def _skip_rows(self):
+        match = ROWS_END.search(self._text)
+        if match is None:
+            self._text = self._text[-SKIP_OVERLAP:]
+            return
+        self._text = self._text[match.start() + 1:]
+        self._state = "tail"
+
+    def _add_rows(self, rows: List[list]):
+        if not self.keeping:
+            self.rows_dropped += len(rows)
+            return
+        self._rows.extend(rows)
+        if len(self._rows) >= self.batch_rows:
+            self._pack()
+
+    def _pack(self):
+        if not self._rows:
+            return
+        while len(self._chunks) < len(self._rows[0]):
+            self._chunks.append([pa.nulls(self.row_count)] if self.row_count else [])
+        for i, column in enumerate(self._chunks):
+            try:
+                values = list(map(itemgetter(i), self._rows))
+            except IndexError:  # ragged rows
+                values = [row[i] if i < len(row) else None for row in self._rows]
+            try:
+                array = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                array = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+            column.append(array)
+            self._arrow_bytes += array.nbytes
+        self.row_count += len(self._rows)
+        self._rows = []
+
+    def close(self) -> Dict:
+        """Finish decoding; return the response with data.rows empty (use table() for the rows)"""
+        self._text += self._utf8.decode(b"", final=True)
+        if self._state == "head":
+            # No rows array found (error payload or unexpected shape): parse as plain JSON
+            return json.loads(self._text)
+        if self._state == "rows":
+            raise ValueError("Truncated dataset response: rows array was not closed")
+        self._skeleton.append(self._text)
+        self._text = ""
+        self._pack()
+        return json.loads("".join(self._skeleton))
+
+    def table(self, cols: List[Dict], typed: bool = True) -> pa.Table:
+        """Assemble the decoded rows; typed applies Metabase base_types (dates become timestamps)"""
+        arrays = []
+        for i, col in enumerate(cols):
+            chunks = self._chunks[i] if i < len(self._chunks) else [pa.nulls(self.row_count)]
+            arrays.append(combine_chunks(chunks, col.get("base_type") if typed else None))
+        return pa.Table.from_arrays(arrays, names=unique_names(cols))
+
+def decode_stream(chunks: Iterable[bytes], max_bytes: Optional[int] = None,
+                  on_progress: Optional[Callable[[int], None]] = None):
+    """Feed every chunk into a decoder; returns (decoder, complete).
+
+    Once max_bytes of rows are held the decoder stops keeping rows but reads
+    on, since Metabase writes "cols" after "rows"; complete is then False
+    and the table holds the leading rows that fit. on_progress, if given, is
+    called with the number of rows read so far after every chunk.
+    """
+    decoder = DatasetStreamDecoder()
+    for chunk in chunks:
+        decoder.feed(chunk)
+        if on_progress is not None:
+            on_progress(decoder.rows_decoded)
+        if decoder.keeping and max_bytes is not None and decoder.arrow_bytes > max_bytes:
+            decoder.stop_keeping()
+    return decoder, decoder.keeping
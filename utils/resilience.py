@@ -0,0 +1,244 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+class DeadlineExceeded(Exception):
+    """The request-wide time budget ran out"""
+
+class CircuitOpenError(Exception):
+    """An upstream is considered down; calls fail fast until the breaker half-opens"""
+
+class Cancelled(Exception):
+    """The caller cancelled the operation (e.g. a query job)"""
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("Batas waktu permintaan terlampaui")
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Set a request-wide deadline; nested scopes can only shorten it"""
+    deadline = Deadline(seconds)
+    parent = current_deadline()
+    if parent is not None and parent.expires_at < deadline.expires_at:
+        deadline = parent
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def bounded_timeout(timeout: float) -> float:
+    """Clamp a per-call timeout to what is left of the current deadline"""
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    deadline.check()
+    return min(timeout, deadline.remaining())
+
+class CancelToken:
+    """Cancellation flag for one unit of work, with hooks that abort blocking I/O.
+
+    Code doing I/O registers a hook (e.g. response.close) for the duration of
+    the call; cancel() runs the hooks from the cancelling thread, so a blocked
+    socket read fails immediately instead of at the next check().
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._hooks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+        self.rows_read = 0  # progress reported by streamed dataset reads
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            hooks, self._hooks = self._hooks, []
+        for hook in hooks:
+            try:
+                hook()
+            except Exception:
+                pass
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled("Dibatalkan oleh pengguna")
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+    def on_cancel(self, hook: Callable[[], Any]) -> Callable[[], None]:
+        """Run hook on cancel (right away if already cancelled); returns a function that unregisters it"""
+        with self._lock:
+            if not self._event.is_set():
+                self._hooks.append(hook)
+                return lambda: self._discard(hook)
+        hook()
+        return lambda: None
+
+    def _discard(self, hook: Callable[[], Any]):
+        with self._lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+_current_cancel_token: contextvars.ContextVar = contextvars.ContextVar("cancel_token", default=None)
+
+def current_cancel_token() -> Optional[CancelToken]:
+    return _current_cancel_token.get()
+
+@contextmanager
+def cancel_scope(token: CancelToken):
+    """Make token the cancellation token for calls made in this context"""
+    reset = _current_cancel_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_cancel_token.reset(reset)
+
+def check_cancelled():
+    token = current_cancel_token()
+    if token is not None:
+        token.check()
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive failures -> half-open after reset_timeout"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._half_open_probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through (one probe while half-open)"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self._half_open_probe:
+                self._half_open_probe = True
+                return
+        raise CircuitOpenError(f"{self.name} sedang tidak tersedia, coba lagi sebentar lagi")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._half_open_probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._half_open_probe = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable[[], Any], is_failure: Callable[[BaseException], bool] = lambda e: True,
+             is_failed_result: Callable[[Any], bool] = lambda result: False) -> Any:
+        """Run fn; raised errors (per is_failure) and returned results (per is_failed_result) count as failures"""
+        self.before_call()
+        try:
+            result = fn()
+        except BaseException as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        if is_failed_result(result):
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> CircuitBreaker:
+    """Process-wide breaker per upstream (e.g. one per Metabase URL, one for OpenRouter)"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[name]
+
+def breaker_states() -> Dict[str, str]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def retry_call(fn: Callable[[], Any], should_retry: Callable[[BaseException], bool],
+               max_retries: int = 2, base: float = 0.25, cap: float = 4.0) -> Any:
+    """Call fn, retrying retryable errors with jittered backoff while the deadline allows"""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not should_retry(e):
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= delay:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second on average, bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
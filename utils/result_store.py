@@ -0,0 +1,100 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+
+from config.settings import RESULT_HISTORY_LIMIT, RESULT_SESSION_MAX_MB, RESULT_TOTAL_MAX_MB
+
+_MB = 1024 * 1024
+
+def _entry_bytes(entry: Dict) -> int:
+    size = entry["table"].nbytes
+    view = entry.get("view")
+    if view is not None and view[1] is not entry["table"]:
+        size += view[1].nbytes
+    return size
+
+class ResultStore:
+    """Query results kept for the result viewer, bounded per session and per process.
+
+    Entries are evicted least recently used first: the oldest results of a
+    session once it holds more than session_max_results or session_max_bytes,
+    and the oldest results of any session once the process-wide total exceeds
+    total_max_bytes. Tables share buffers with the result cache, so the
+    accounting is conservative.
+    """
+
+    def __init__(self, session_max_bytes: int, total_max_bytes: int, session_max_results: int):
+        self.session_max_bytes = session_max_bytes
+        self.total_max_bytes = total_max_bytes
+        self.session_max_results = session_max_results
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def put(self, session_id: str, table: pa.Table, title: str) -> str:
+        result_id = uuid.uuid4().hex[:8]
+        entry = {"table": table, "title": title, "view": None, "stats": {}, "bytes": table.nbytes}
+        with self._lock:
+            self._entries[(session_id, result_id)] = entry
+            self._bytes += entry["bytes"]
+            self._evict(session_id, keep=(session_id, result_id))
+        return result_id
+
+    def get(self, session_id: str, result_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            key = (session_id, result_id)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def account(self, session_id: str, result_id: str):
+        """Re-measure an entry after its cached view changed, evicting if over budget"""
+        with self._lock:
+            entry = self._entries.get((session_id, result_id))
+            if entry is None:
+                return
+            size = _entry_bytes(entry)
+            self._bytes += size - entry["bytes"]
+            entry["bytes"] = size
+            self._evict(session_id, keep=(session_id, result_id))
+
+    def _evict(self, session_id: str, keep: Optional[tuple] = None):
+        session_keys = [key for key in self._entries if key[0] == session_id and key != keep]
+        session_count = len(session_keys) + (keep is not None)
+        session_bytes = sum(self._entries[key]["bytes"] for key in self._entries if key[0] == session_id)
+        for key in session_keys:
+            if session_count <= self.session_max_results and session_bytes <= self.session_max_bytes:
+                break
+            session_bytes -= self._drop(key)
+            session_count -= 1
+        for key in list(self._entries):
+            if self._bytes <= self.total_max_bytes:
+                break
+            if key != keep:
+                self._drop(key)
+
+    def _drop(self, key: tuple) -> int:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["bytes"]
+        self._evictions += 1
+        return entry["bytes"]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "results": len(self._entries),
+                "sessions": len({key[0] for key in self._entries}),
+                "bytes": self._bytes,
+                "evictions": self._evictions
+            }
+
+result_store = ResultStore(
+    session_max_bytes=int(RESULT_SESSION_MAX_MB * _MB),
+    total_max_bytes=int(RESULT_TOTAL_MAX_MB * _MB),
+    session_max_results=RESULT_HISTORY_LIMIT
+)
@@ -0,0 +1,205 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+STOPWORDS = {
+    # Bahasa Indonesia
+    "yang", "dan", "di", "ke", "dari", "untuk", "apa", "ada", "ini", "itu", "dengan", "atau",
+    "saya", "mana", "bagaimana", "berapa", "tentang", "tolong", "dong", "nya", "per", "pada",
+    # English
+    "the", "a", "an", "of", "for", "to", "in", "on", "and", "or", "is", "are", "what", "which",
+    "show", "me", "about", "any", "there"
+}
+
+# Field weights: a match in the name counts more than one in the description
+FIELD_WEIGHTS = {"name": 3.0, "collection": 1.5, "description": 1.0, "query": 0.5}
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", (text or "").lower()) if token not in STOPWORDS]
+
+class InvertedIndex:
+    """Small BM25 inverted index with incremental updates.
+
+    Documents are keyed by (model, id) and re-indexed only when their
+    updated_at changes, so refreshing from a cached listing is cheap.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, float]] = defaultdict(dict)
+        self._doc_terms: Dict[Hashable, Dict[str, float]] = {}
+        self._doc_length: Dict[Hashable, float] = {}
+        self._docs: Dict[Hashable, Dict] = {}
+        self._versions: Dict[Hashable, object] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, key: Hashable, doc: Dict, version: object = None):
+        with self._lock:
+            self.remove(key)
+            terms: Dict[str, float] = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(str(doc.get(field) or "")):
+                    terms[token] += weight
+            for token, tf in terms.items():
+                self._postings[token][key] = tf
+            self._doc_terms[key] = dict(terms)
+            self._doc_length[key] = sum(terms.values())
+            self._docs[key] = doc
+            self._versions[key] = version
+
+    def update_fields(self, key: Hashable, **fields):
+        """Merge extra searchable fields into an indexed document, keeping its version"""
+        with self._lock:
+            if key in self._docs:
+                self.add(key, dict(self._docs[key], **fields), self._versions.get(key))
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            for token in self._doc_terms.pop(key, {}):
+                postings = self._postings.get(token)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[token]
+            self._doc_length.pop(key, None)
+            self._docs.pop(key, None)
+            self._versions.pop(key, None)
+
+    def sync(self, model: str, items: List[Dict]) -> int:
+        """Bring all documents of one model in line with items; return how many were (re)indexed"""
+        with self._lock:
+            changed = 0
+            seen = set()
+            for item in items:
+                key = (model, item.get("id"))
+                seen.add(key)
+                version = item.get("updated_at") or (item.get("name"), item.get("description"))
+                if key in self._docs and self._versions.get(key) == version:
+                    continue
+                self.add(key, item, version)
+                changed += 1
+            for key in [k for k in self._docs if k[0] == model and k not in seen]:
+                self.remove(key)
+                changed += 1
+            return changed
+
+    def search(self, query: str, model: Optional[str] = None, limit: int = 10) -> List[Tuple[float, Dict]]:
+        """Return [(score, doc)] best first; short prefixes also match longer words"""
+        with self._lock:
+            if not self._docs:
+                return []
+            n_docs = len(self._docs)
+            avg_length = sum(self._doc_length.values()) / n_docs or 1.0
+            scores: Dict[Hashable, float] = defaultdict(float)
+
+            for query_token in set(tokenize(query)):
+                expansions = [(query_token, 1.0)]
+                if len(query_token) >= 3:
+                    expansions += [
+                        (token, 0.5) for token in self._postings
+                        if token != query_token and token.startswith(query_token)
+                    ]
+                for token, boost in expansions:
+                    postings = self._postings.get(token, {})
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for key, tf in postings.items():
+                        if model is not None and key[0] != model:
+                            continue
+                        norm = tf + self.k1 * (1 - self.b + self.b * self._doc_length[key] / avg_length)
+                        scores[key] += boost * idf * tf * (self.k1 + 1) / norm
+
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [(score, self._docs[key]) for key, score in ranked]
+
+def normalize_value(text: str) -> str:
+    """Casefolded, punctuation-insensitive form used to compare column values"""
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).casefold()))
+
+def _trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ValueIndex:
+    """Distinct column values with character-trigram lookup, for resolving literals in questions.
+
+    Values are grouped per field and re-indexed only when a field's version
+    changes, so refreshing from cached field values is cheap. Lookup finds
+    candidates by shared trigrams, then scores them with SequenceMatcher.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Dict[str, str]] = {}  # field -> normalized -> original value
+        self._grams: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self._versions: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(len(values) for values in self._values.values())
+
+    def sync_field(self, field: str, values: List, version: object = None) -> bool:
+        """Replace a field's values unless version is unchanged; return whether it was re-indexed"""
+        with self._lock:
+            if field in self._values and self._versions.get(field) == version:
+                return False
+            self.remove_field(field)
+            normalized_values = {}
+            for value in values:
+                normalized = normalize_value(value)
+                if normalized:
+                    normalized_values.setdefault(normalized, str(value))
+            for normalized in normalized_values:
+                for gram in _trigrams(normalized):
+                    self._grams[gram].add((field, normalized))
+            self._values[field] = normalized_values
+            self._versions[field] = version
+            return True
+
+    def remove_field(self, field: str):
+        with self._lock:
+            for normalized in self._values.pop(field, {}):
+                for gram in _trigrams(normalized):
+                    postings = self._grams.get(gram)
+                    if postings is not None:
+                        postings.discard((field, normalized))
+                        if not postings:
+                            del self._grams[gram]
+            self._versions.pop(field, None)
+
+    def fields(self) -> List[str]:
+        with self._lock:
+            return list(self._values)
+
+    def lookup(self, text: str, min_score: float = 0.85, candidates: int = 10) -> List[Tuple[float, str, str]]:
+        """[(score, field, value)] best first; an exact (normalized) match scores 1.0"""
+        normalized = normalize_value(text)
+        if not normalized:
+            return []
+        with self._lock:
+            exact = [(1.0, field, values[normalized]) for field, values in self._values.items() if normalized in values]
+            if exact:
+                return exact
+            grams = _trigrams(normalized)
+            shared: Dict[Tuple[str, str], int] = defaultdict(int)
+            for gram in grams:
+                for key in self._grams.get(gram, ()):
+                    shared[key] += 1
+            # Dice coefficient on trigrams (a string of n chars has about n + 1 of them)
+            size = len(normalized) + 1
+            ranked = sorted(
+                shared.items(), key=lambda kv: 2 * kv[1] / (size + len(kv[0][1]) + 1), reverse=True
+            )[:candidates]
+            matches = []
+            for (field, value_key), _ in ranked:
+                score = SequenceMatcher(None, normalized, value_key).ratio()
+                if score >= min_score:
+                    matches.append((score, field, self._values[field][value_key]))
+            return sorted(matches, reverse=True)
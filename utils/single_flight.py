@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from utils.resilience import Cancelled, current_cancel_token
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one execution.
+
+    The first caller for a key runs fn; callers arriving while it is in flight
+    block and receive the same result (or exception). Results are shared
+    objects and must be treated as read-only. A cancelled leader does not
+    cancel its waiters: they retry, and one of them becomes the new leader.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            token = current_cancel_token()
+            if token is None:
+                call.done.wait()
+            else:
+                while not call.done.wait(0.2):
+                    token.check()
+            if isinstance(call.error, Cancelled):
+                # The leader was cancelled, not this caller: run it again
+                return self.do(key, fn)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
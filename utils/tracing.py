@@ -0,0 +1,198 @@
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from config.settings import TRACE_HISTORY, TRACE_SLOW_SECONDS
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRIC_PREFIX = "chatoracle"
+
+class Histogram:
+    """Cumulative-bucket latency histogram, Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.errors += int(error)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None past the last bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return None
+
+class Trace:
+    """One request's timeline: spans with their start offset, duration, parent and attributes"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.id = next(self._ids)
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Seconds per top-level stage (nested spans are already inside their parent)"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            if span["parent"] is None:
+                totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration"]
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "name": self.name, "attrs": self.attrs, "started_at": self.started_at,
+            "duration": self.duration, "error": self.error,
+            "spans": sorted(self.spans, key=lambda span: span["start"])
+        }
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+_histograms: Dict[str, Histogram] = {}
+_traces: deque = deque(maxlen=TRACE_HISTORY)
+_lock = threading.Lock()
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def _observe(name: str, seconds: float, error: bool):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds, error)
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Root of a request timeline; nested calls join the trace that is already open"""
+    if current_trace() is not None:
+        with span(name, **attrs):
+            yield current_trace()
+        return
+    trace = Trace(name, attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace._start
+        _observe(name, trace.duration, trace.error is not None)
+        with _lock:
+            _traces.append(trace)
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block: it lands in the current trace (if any) and in the latency histogram for name"""
+    trace = current_trace()
+    parent = _current_span.get()
+    record = {"name": name, "parent": parent, "attrs": attrs, "error": None}
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _observe(name, duration, record["error"] is not None)
+        if trace is not None:
+            record.update(start=start - trace._start, duration=duration, thread=threading.current_thread().name)
+            trace.add(record)
+
+def traced(name: str):
+    """Decorator form of span()"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def recent_traces(limit: int = 20, min_duration: float = 0.0) -> List[Trace]:
+    """Newest first"""
+    with _lock:
+        traces = list(_traces)
+    return [trace for trace in reversed(traces) if (trace.duration or 0.0) >= min_duration][:limit]
+
+def slow_traces(limit: int = 20) -> List[Trace]:
+    return recent_traces(limit, TRACE_SLOW_SECONDS)
+
+def latency_summary() -> Dict[str, Dict[str, Any]]:
+    """count/avg/p50/p95 per span name"""
+    with _lock:
+        items = list(_histograms.items())
+    return {
+        name: {
+            "count": histogram.count,
+            "errors": histogram.errors,
+            "avg": histogram.sum / histogram.count if histogram.count else None,
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95)
+        }
+        for name, histogram in sorted(items)
+    }
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def metrics_text() -> str:
+    """Latency histograms and error counters in the Prometheus text exposition format"""
+    metric = f"{METRIC_PREFIX}_stage_duration_seconds"
+    errors = f"{METRIC_PREFIX}_stage_errors_total"
+    with _lock:
+        items = [(name, histogram.buckets, list(histogram.counts), histogram.count, histogram.sum, histogram.errors)
+                 for name, histogram in sorted(_histograms.items())]
+    lines = [f"# HELP {metric} Duration of pipeline stages and client calls.", f"# TYPE {metric} histogram"]
+    for name, buckets, counts, count, total, _ in items:
+        stage = _label(name)
+        for bound, bucket_count in zip(buckets, counts):
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+        lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'{metric}_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+    lines += [f"# HELP {errors} Stages and calls that raised.", f"# TYPE {errors} counter"]
+    lines += [f'{errors}{{stage="{_label(name)}"}} {error_count}' for name, *_, error_count in items]
+    return "\n".join(lines) + "\n"
+
+def reset_tracing():
+    """Drop histograms and stored traces (used by tests)"""
+    with _lock:
+        _histograms.clear()
+        _traces.clear()